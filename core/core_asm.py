@@ -0,0 +1,515 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import re
+from dataclasses import dataclass, field
+
+# === Registers ===
+
+ABI_NAMES = [
+    "zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2",
+    "s0", "s1", "a0", "a1", "a2", "a3", "a4", "a5",
+    "a6", "a7", "s2", "s3", "s4", "s5", "s6", "s7",
+    "s8", "s9", "s10", "s11", "t3", "t4", "t5", "t6",
+]
+
+REGS = {f"x{i}": i for i in range(32)}
+REGS.update({name: i for i, name in enumerate(ABI_NAMES)})
+REGS["fp"] = 8
+
+CSRS = {
+    "mhartid": 0xF14,
+    "cycle": 0xC00,
+    "instret": 0xC02,
+}
+
+# === Encodings ===
+
+R_TYPE = {
+    "add":  (0x0, 0x00), "sub": (0x0, 0x20), "sll": (0x1, 0x00), "slt": (0x2, 0x00),
+    "sltu": (0x3, 0x00), "xor": (0x4, 0x00), "srl": (0x5, 0x00), "sra": (0x5, 0x20),
+    "or":   (0x6, 0x00), "and": (0x7, 0x00),
+}
+I_ALU = {"addi": 0x0, "slti": 0x2, "sltiu": 0x3, "xori": 0x4, "ori": 0x6, "andi": 0x7}
+I_SHIFT = {"slli": (0x1, 0x00), "srli": (0x5, 0x00), "srai": (0x5, 0x20)}
+# the core moves whole words only, so sub-word forms are rejected instead of silently running as lw/sw
+LOADS = {"lw": 0x2}
+STORES = {"sw": 0x2}
+SUBWORD = {"lb", "lh", "lbu", "lhu", "sb", "sh"}
+BRANCHES = {"beq": 0x0, "bne": 0x1, "blt": 0x4, "bge": 0x5, "bltu": 0x6, "bgeu": 0x7}
+CSR_OPS = {"csrrw": 0x1, "csrrs": 0x2, "csrrc": 0x3, "csrrwi": 0x5, "csrrsi": 0x6, "csrrci": 0x7}
+
+# pseudo branches that swap their operands: bgt a, b -> blt b, a
+SWAPPED_BRANCHES = {"bgt": "blt", "ble": "bge", "bgtu": "bltu", "bleu": "bgeu"}
+ZERO_BRANCHES = {
+    "beqz": ("beq", False), "bnez": ("bne", False), "bltz": ("blt", False), "bgez": ("bge", False),
+    "blez": ("bge", True), "bgtz": ("blt", True),
+}
+
+def r_type(funct7, rs2, rs1, funct3, rd, opcode):
+    return (funct7 << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+def i_type(imm, rs1, funct3, rd, opcode):
+    return ((imm & 0xfff) << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+def s_type(imm, rs2, rs1, funct3, opcode):
+    return (((imm >> 5) & 0x7f) << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | ((imm & 0x1f) << 7) | opcode
+
+def b_type(imm, rs2, rs1, funct3, opcode):
+    return (((imm >> 12) & 0x1) << 31) | (((imm >> 5) & 0x3f) << 25) | (rs2 << 20) | (rs1 << 15) | \
+        (funct3 << 12) | (((imm >> 1) & 0xf) << 8) | (((imm >> 11) & 0x1) << 7) | opcode
+
+def u_type(imm, rd, opcode):
+    return (imm & 0xfffff000) | (rd << 7) | opcode
+
+def j_type(imm, rd, opcode):
+    return (((imm >> 20) & 0x1) << 31) | (((imm >> 1) & 0x3ff) << 21) | (((imm >> 11) & 0x1) << 20) | \
+        (((imm >> 12) & 0xff) << 12) | (rd << 7) | opcode
+
+def fits_imm12(v):
+    return -2048 <= v < 2048
+
+def hi_lo(v):
+    # lui/addi split, addi sign-extends so round the upper part
+    v &= 0xFFFFFFFF
+    lo = ((v & 0xfff) ^ 0x800) - 0x800
+    hi = (v - lo) & 0xFFFFFFFF
+    return hi, lo
+
+# === Program ===
+
+@dataclass
+class Program:
+    image: dict = field(default_factory=dict)    # byte address -> byte
+    symbols: dict = field(default_factory=dict)
+    sections: dict = field(default_factory=dict) # name -> base address
+    text_symbols: dict = field(default_factory=dict)
+
+    def words(self):
+        words = {}
+        for addr, b in self.image.items():
+            base = addr & ~0x3
+            words[base] = words.get(base, 0) | (b << ((addr & 0x3) * 8))
+        return words
+
+class AsmError(RuntimeError):
+    pass
+
+# === Linker Script ===
+
+def parse_linker_script(path):
+    # only the MEMORY regions and which region each output section goes to
+    with open(path, "r") as f:
+        text = re.sub(r"/\*.*?\*/", "", f.read(), flags=re.S)
+
+    regions = {}
+    for name, origin, length in re.findall(r"(\w+)\s*(?:\([^)]*\))?\s*:\s*ORIGIN\s*=\s*(\w+)\s*,\s*LENGTH\s*=\s*(\w+)", text):
+        regions[name] = (int(origin, 0), parse_size(length))
+
+    bases = {}
+    for section, region in re.findall(r"(\.\w+)\s*:\s*\{[^}]*\}\s*>\s*(\w+)", text):
+        if region in regions:
+            bases[section] = regions[region][0]
+
+    return bases, regions
+
+def parse_size(s):
+    mult = 1
+    if s[-1] in "kK":
+        mult, s = 1024, s[:-1]
+    elif s[-1] in "mM":
+        mult, s = 1024 * 1024, s[:-1]
+    return int(s, 0) * mult
+
+# === Assembler ===
+
+class Assembler:
+    def __init__(self, text_base=0x00000000, data_base=0x80000000):
+        self.bases = {".text": text_base, ".data": data_base}
+
+    def assemble(self, source):
+        lines = self.parse(source)
+
+        # pass 1 lays out sections and labels, pass 2 encodes with every symbol known
+        self.symbols = {}
+        self.text_symbols = {}
+        self.wide_li = {}
+        self.run(lines, emit=False)
+        self.image = {}
+        self.run(lines, emit=True)
+
+        return Program(self.image, dict(self.symbols), dict(self.bases), dict(self.text_symbols))
+
+    def parse(self, source):
+        lines = []
+        for lineno, line in enumerate(source.splitlines(), start=1):
+            line = line.split("#", 1)[0].split("//", 1)[0].strip()
+            labels = []
+            while True:
+                m = re.match(r"^([A-Za-z_.$][\w.$]*):\s*(.*)$", line)
+                if not m:
+                    break
+                labels.append(m.group(1))
+                line = m.group(2)
+
+            op, args = None, []
+            if line:
+                parts = line.split(None, 1)
+                op = parts[0].lower()
+                if len(parts) > 1:
+                    args = split_args(parts[1])
+            lines.append((lineno, labels, op, args))
+        return lines
+
+    def run(self, lines, emit):
+        self.emit = emit
+        self.section = ".text"
+        self.addr = {name: base for name, base in self.bases.items()}
+
+        for lineno, labels, op, args in lines:
+            self.lineno = lineno
+            try:
+                for label in labels:
+                    if not emit:
+                        if label in self.symbols:
+                            raise AsmError(f"duplicate label {label}")
+                        self.symbols[label] = self.pc()
+                        if self.section == ".text":
+                            self.text_symbols[label] = self.pc()
+                if op is None:
+                    continue
+                if op.startswith("."):
+                    self.directive(op, args)
+                else:
+                    self.instruction(op, args)
+            except AsmError as e:
+                raise AsmError(f"Line {lineno}: {e}") from None
+
+    def pc(self):
+        return self.addr[self.section]
+
+    # === Output ===
+
+    def put(self, value, size):
+        if self.emit:
+            a = self.pc()
+            for i in range(size):
+                self.image[a + i] = (value >> (8 * i)) & 0xFF
+        self.addr[self.section] += size
+
+    def put_word(self, word):
+        self.put(word, 4)
+
+    # === Directives ===
+
+    def directive(self, op, args):
+        if op in (".global", ".globl", ".type", ".size", ".option", ".file", ".ident"):
+            return
+        if op == ".section":
+            name = args[0] if args else ".text"
+            self.set_section(".text" if name.startswith(".text") else ".data" if name.startswith((".data", ".rodata", ".bss", ".sdata")) else name)
+        elif op in (".text", ".data"):
+            self.set_section(op)
+        elif op in (".rodata", ".bss"):
+            self.set_section(".data")
+        elif op in (".word", ".long", ".4byte"):
+            for a in args:
+                self.put(self.value(a) & 0xFFFFFFFF, 4)
+        elif op in (".half", ".short", ".2byte"):
+            for a in args:
+                self.put(self.value(a) & 0xFFFF, 2)
+        elif op == ".byte":
+            for a in args:
+                self.put(self.value(a) & 0xFF, 1)
+        elif op in (".space", ".zero", ".skip"):
+            for _ in range(self.value(args[0])):
+                self.put(0, 1)
+        elif op in (".align", ".p2align", ".balign"):
+            n = self.value(args[0])
+            align = n if op == ".balign" else 1 << n
+            while self.pc() % align:
+                self.put(0, 1)
+        elif op in (".equ", ".set"):
+            self.symbols[args[0]] = self.value(args[1])
+        else:
+            raise AsmError(f"unknown directive {op}")
+
+    def set_section(self, name):
+        if name not in self.addr:
+            raise AsmError(f"no base address for section {name}")
+        self.section = name
+
+    # === Operands ===
+
+    def reg(self, s):
+        r = REGS.get(s.strip().lower())
+        if r is None:
+            raise AsmError(f"bad register {s}")
+        return r
+
+    def value(self, s):
+        s = s.strip()
+        m = re.match(r"^%(hi|lo)\((.*)\)$", s)
+        if m:
+            hi, lo = hi_lo(self.value(m.group(2)))
+            return (hi >> 12) if m.group(1) == "hi" else lo
+
+        # sums and differences of numbers and symbols, undefined symbols read as 0 in pass 1
+        total = 0
+        for sign, term in re.findall(r"([+-]?)\s*([^+\-\s]+)", s):
+            term = term.strip()
+            if re.match(r"^(0x[0-9a-fA-F]+|0b[01]+|\d+)$", term):
+                v = int(term, 0)
+            elif re.match(r"^'.'$", term):
+                v = ord(term[1])
+            elif term in self.symbols:
+                v = self.symbols[term]
+            elif not self.emit:
+                v = 0
+            else:
+                raise AsmError(f"undefined symbol {term}")
+            total += -v if sign == "-" else v
+        return total
+
+    def known(self, s):
+        for _, term in re.findall(r"([+-]?)\s*([^+\-\s]+)", s.strip()):
+            term = term.strip()
+            if not (re.match(r"^(0x[0-9a-fA-F]+|0b[01]+|\d+|'.')$", term) or term in self.symbols):
+                return False
+        return True
+
+    def mem_operand(self, s):
+        m = re.match(r"^(.*)\(\s*(\w+)\s*\)$", s.strip())
+        if not m:
+            raise AsmError(f"bad memory operand {s}")
+        off = m.group(1).strip()
+        return (self.value(off) if off else 0), self.reg(m.group(2))
+
+    def branch_offset(self, target):
+        off = self.value(target) - self.pc()
+        if self.emit and (off & 1 or not -4096 <= off < 4096):
+            raise AsmError(f"branch target {target} out of range")
+        return off
+
+    def jump_offset(self, target):
+        off = self.value(target) - self.pc()
+        if self.emit and (off & 1 or not -(1 << 20) <= off < (1 << 20)):
+            raise AsmError(f"jump target {target} out of range")
+        return off
+
+    def imm12(self, s):
+        v = self.value(s)
+        if self.emit and not fits_imm12(v):
+            raise AsmError(f"immediate {s} does not fit in 12 bits")
+        return v
+
+    def expect(self, args, n, op):
+        if len(args) != n:
+            raise AsmError(f"{op} takes {n} operands, got {len(args)}")
+
+    # === Instructions ===
+
+    def instruction(self, op, a):
+        if op in R_TYPE:
+            self.expect(a, 3, op)
+            funct3, funct7 = R_TYPE[op]
+            self.put_word(r_type(funct7, self.reg(a[2]), self.reg(a[1]), funct3, self.reg(a[0]), 0x33))
+        elif op in I_ALU:
+            self.expect(a, 3, op)
+            self.put_word(i_type(self.imm12(a[2]), self.reg(a[1]), I_ALU[op], self.reg(a[0]), 0x13))
+        elif op in I_SHIFT:
+            self.expect(a, 3, op)
+            funct3, funct7 = I_SHIFT[op]
+            shamt = self.value(a[2])
+            if self.emit and not 0 <= shamt < 32:
+                raise AsmError(f"shift amount {shamt} out of range")
+            self.put_word(i_type((funct7 << 5) | (shamt & 0x1f), self.reg(a[1]), funct3, self.reg(a[0]), 0x13))
+        elif op in SUBWORD:
+            raise AsmError(f"{op} is not supported, the core only does word loads and stores")
+        elif op in LOADS:
+            self.expect(a, 2, op)
+            off, rs1 = self.mem_operand(a[1])
+            self.put_word(i_type(off, rs1, LOADS[op], self.reg(a[0]), 0x03))
+        elif op in STORES:
+            self.expect(a, 2, op)
+            off, rs1 = self.mem_operand(a[1])
+            self.put_word(s_type(off, self.reg(a[0]), rs1, STORES[op], 0x23))
+        elif op in BRANCHES:
+            self.expect(a, 3, op)
+            self.put_word(b_type(self.branch_offset(a[2]), self.reg(a[1]), self.reg(a[0]), BRANCHES[op], 0x63))
+        elif op in SWAPPED_BRANCHES:
+            self.expect(a, 3, op)
+            self.instruction(SWAPPED_BRANCHES[op], [a[1], a[0], a[2]])
+        elif op in ZERO_BRANCHES:
+            self.expect(a, 2, op)
+            base, swap = ZERO_BRANCHES[op]
+            self.instruction(base, ["zero", a[0], a[1]] if swap else [a[0], "zero", a[1]])
+        elif op == "lui" or op == "auipc":
+            self.expect(a, 2, op)
+            self.put_word(u_type(self.value(a[1]) << 12, self.reg(a[0]), 0x37 if op == "lui" else 0x17))
+        elif op == "jal":
+            if len(a) == 1:
+                a = ["ra", a[0]]
+            self.expect(a, 2, op)
+            self.put_word(j_type(self.jump_offset(a[1]), self.reg(a[0]), 0x6f))
+        elif op == "jalr":
+            if len(a) == 1:
+                a = ["ra", f"0({a[0]})"]
+            elif len(a) == 3:
+                a = [a[0], f"{a[2]}({a[1]})"]
+            off, rs1 = self.mem_operand(a[1]) if "(" in a[1] else (0, self.reg(a[1]))
+            self.put_word(i_type(off, rs1, 0x0, self.reg(a[0]), 0x67))
+        elif op in CSR_OPS:
+            self.expect(a, 3, op)
+            csr = CSRS.get(a[1].lower())
+            csr = csr if csr is not None else self.value(a[1])
+            src = self.value(a[2]) if op.endswith("i") else self.reg(a[2])
+            self.put_word(i_type(csr, src, CSR_OPS[op], self.reg(a[0]), 0x73))
+        elif op == "ecall":
+            self.put_word(0x00000073)
+        elif op == "ebreak":
+            self.put_word(0x00100073)
+        elif op == "fence":
+            self.put_word(0x0ff0000f)
+        else:
+            self.pseudo(op, a)
+
+    def pseudo(self, op, a):
+        if op == "nop":
+            self.instruction("addi", ["zero", "zero", "0"])
+        elif op == "li":
+            self.expect(a, 2, op)
+            # addi when the value fits in 12 signed bits, a lone lui when its low 12 bits are zero,
+            # lui+addi otherwise. A value pass 1 can't see yet (forward label) always gets both words
+            # so the layout holds.
+            if not self.emit:
+                self.wide_li[self.lineno] = not self.known(a[1])
+            v = self.value(a[1])
+            hi, lo = hi_lo(v)
+            if self.wide_li[self.lineno]:
+                self.put_word(u_type(hi, self.reg(a[0]), 0x37))
+                self.put_word(i_type(lo, self.reg(a[0]), 0x0, self.reg(a[0]), 0x13))
+            elif fits_imm12(v if v < 0x80000000 else v - 0x100000000):
+                self.instruction("addi", [a[0], "zero", str(lo)])
+            elif lo == 0:
+                self.put_word(u_type(hi, self.reg(a[0]), 0x37))
+            else:
+                self.put_word(u_type(hi, self.reg(a[0]), 0x37))
+                self.put_word(i_type(lo, self.reg(a[0]), 0x0, self.reg(a[0]), 0x13))
+        elif op == "la":
+            self.expect(a, 2, op)
+            hi, lo = hi_lo(self.value(a[1]))
+            self.put_word(u_type(hi, self.reg(a[0]), 0x37))
+            self.put_word(i_type(lo, self.reg(a[0]), 0x0, self.reg(a[0]), 0x13))
+        elif op == "mv":
+            self.instruction("addi", [a[0], a[1], "0"])
+        elif op == "not":
+            self.instruction("xori", [a[0], a[1], "-1"])
+        elif op == "neg":
+            self.instruction("sub", [a[0], "zero", a[1]])
+        elif op == "seqz":
+            self.instruction("sltiu", [a[0], a[1], "1"])
+        elif op == "snez":
+            self.instruction("sltu", [a[0], "zero", a[1]])
+        elif op == "sltz":
+            self.instruction("slt", [a[0], a[1], "zero"])
+        elif op == "sgtz":
+            self.instruction("slt", [a[0], "zero", a[1]])
+        elif op == "j":
+            self.instruction("jal", ["zero", a[0]])
+        elif op == "jr":
+            self.instruction("jalr", ["zero", f"0({a[0]})"])
+        elif op == "ret":
+            self.instruction("jalr", ["zero", "0(ra)"])
+        elif op == "call":
+            self.instruction("jal", ["ra", a[0]])
+        elif op == "tail":
+            self.instruction("jal", ["zero", a[0]])
+        elif op == "csrr":
+            self.instruction("csrrs", [a[0], a[1], "zero"])
+        elif op == "csrw":
+            self.instruction("csrrw", ["zero", a[0], a[1]])
+        else:
+            raise AsmError(f"unknown instruction {op}")
+
+def split_args(s):
+    args = []
+    depth = 0
+    cur = ""
+    for ch in s:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            args.append(cur.strip())
+            cur = ""
+        else:
+            cur += ch
+    if cur.strip():
+        args.append(cur.strip())
+    return args
+
+def assemble(source, text_base=0x00000000, data_base=0x80000000):
+    return Assembler(text_base, data_base).assemble(source)
+
+def assemble_file(path, linker_script=None):
+    text_base, data_base = 0x00000000, 0x80000000
+    if linker_script is not None:
+        bases, _ = parse_linker_script(linker_script)
+        text_base = bases.get(".text", text_base)
+        data_base = bases.get(".data", data_base)
+
+    with open(path, "r") as f:
+        return assemble(f.read(), text_base, data_base)
+
+# === Intel HEX ===
+
+def hex_record(addr, rec_type, data):
+    rec = [len(data), (addr >> 8) & 0xFF, addr & 0xFF, rec_type] + list(data)
+    checksum = (-sum(rec)) & 0xFF
+    return ":" + "".join(f"{b:02X}" for b in rec) + f"{checksum:02X}"
+
+def to_hex(image, record_size=16):
+    lines = []
+    upper = 0
+    addrs = sorted(image)
+    i = 0
+    while i < len(addrs):
+        start = addrs[i]
+        data = [image[start]]
+        i += 1
+        # a record stays inside one 64 KiB segment and one run of contiguous bytes
+        while i < len(addrs) and addrs[i] == start + len(data) and len(data) < record_size and (addrs[i] >> 16) == (start >> 16):
+            data.append(image[addrs[i]])
+            i += 1
+
+        if (start >> 16) != upper:
+            upper = start >> 16
+            lines.append(hex_record(0, 0x04, [(upper >> 8) & 0xFF, upper & 0xFF]))
+        lines.append(hex_record(start & 0xFFFF, 0x00, data))
+
+    lines.append(hex_record(0, 0x01, []))
+    return "\n".join(lines) + "\n"
+
+def write_hex(program, path):
+    with open(path, "w") as f:
+        f.write(to_hex(program.image))
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Assemble RV32I source into Intel HEX")
+    parser.add_argument("source")
+    parser.add_argument("-o", "--output")
+    parser.add_argument("-T", "--linker-script")
+    args = parser.parse_args()
+
+    program = assemble_file(args.source, args.linker_script)
+    out = args.output or os.path.splitext(args.source)[0] + ".hex"
+    write_hex(program, out)
+
+    print(f"Wrote {out}")
+    for name, addr in sorted(program.symbols.items(), key=lambda s: s[1]):
+        print(f"  0x{addr:08x} {name}")
@@ -1,9 +1,11 @@
 import sys
 import os
+import copy
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sim import *
 from core_tasks import *
+from core_mem import *
 
 def hex_byte(p, offset): 
     def hex_digit(c):
@@ -19,8 +21,9 @@ def hex_byte(p, offset):
     lo = hex_digit(p[offset + 1])
     return (hi << 4) | lo
 
-def load_hex(name, size):
-    mem = [0] * size
+def load_hex(name, mem=None):
+    if mem is None:
+        mem = SparseMemory()
 
     try:
         with open(name, "r") as f:
@@ -68,14 +71,11 @@ def load_hex(name, size):
                     addr = base + addr_hi_lo
                     for i, byte_val in enumerate(data):
                         a = addr + i
-                        word_index = a >> 2
-                        byte_lane = a & 0x3
 
-                        if word_index >= size:
+                        if not mem.in_range(a):
                             raise RuntimeError(f"Line {lineno}: write address out of range(0x{a:08x})")
                         
-                        mem[word_index] &= ~(0xFF << (byte_lane * 8))
-                        mem[word_index] |= (byte_val << (byte_lane * 8))
+                        mem.write_byte(a, byte_val)
 
                 elif rec_type == 0x01:
                     saw_eof = True
@@ -104,25 +104,23 @@ def load_hex(name, size):
     return mem
 
 
-def rv32i_5stage(program):
-    sim = Sim()
-
-    IMEM_SIZE = 1024
-    DMEM_SIZE = 2048
+def init_dmem(dmem):
     ARR_LEN = 16 
 
-    imem_data = load_hex(program, IMEM_SIZE)
-    imem = sim.reg(imem_data)
-
-    dmem_data = [0] * DMEM_SIZE
-    if DMEM_SIZE < (ARR_LEN * 2): 
-        raise RuntimeError("DMEM too small for array")
     for i in range(ARR_LEN):
-        dmem_data[i] = ARR_LEN - i
-    dmem = sim.reg(dmem_data)
+        dmem.write(i * 4, ARR_LEN - i)
+
+def add_core(sim, imem, dmem, stack_top, hart_id=0, icache=None, dcache=None, arbiter=None, width=1):
+    if width == 1:
+        fetch, decode, execute, memory, writeback = fetch_stage, decode_stage, execute_stage, mem_stage, wb_stage
+    elif width == 2:
+        fetch, decode, execute, memory, writeback = fetch2_stage, decode2_stage, execute2_stage, mem2_stage, wb2_stage
+    else:
+        raise RuntimeError(f"Unsupported issue width {width}")
 
     regfile_data = [0] * 32
-    regfile_data[2] = DMEM_SIZE - 4
+    regfile_data[2] = stack_top
+    regfile_data[10] = hart_id # a0, like a boot rom handing over the hart id
     regfile = sim.reg(regfile_data)
 
     if_id_reg = sim.reg(None)
@@ -136,32 +134,41 @@ def rv32i_5stage(program):
 
     # === IF ===
 
+    icache = sim.reg(icache) if icache is not None else None
+    dcache = sim.reg(dcache) if dcache is not None else None
+    icache_fill = sim.reg(None) # outside front_end, a refill keeps going through freezes
+    dcache_wait = sim.reg(0)
+
     pc = sim.reg(0)
-    sim.add(fetch_stage(
+    sim.add(fetch(
         pc, 
         imem,
         stall_if,
         redirect_pc,
-        if_id_reg
+        if_id_reg,
+        icache,
+        icache_fill
     ))
 
     # === ID ===
     
     saved_if_id = sim.reg(None)
     hazard_manager = sim.reg(DataHazardManager())
-    sim.add(decode_stage(
+    sim.add(decode(
         if_id_reg, 
         saved_if_id, 
         hazard_manager, 
         wb_finished, 
         regfile, 
         id_ex_reg, 
-        stall_if
+        stall_if,
+        redirect_pc,
+        hart_id
     ))
 
     # === EX ===
 
-    sim.add(execute_stage(
+    sim.add(execute(
         id_ex_reg, 
         ex_mem_reg,
         redirect_pc
@@ -169,50 +176,167 @@ def rv32i_5stage(program):
 
     # === MEM ===
 
-    sim.add(mem_stage(
+    front_end = [pc, if_id_reg, saved_if_id, stall_if, redirect_pc, id_ex_reg, ex_mem_reg]
+    sim.add(memory(
         ex_mem_reg, 
         dmem, 
-        mem_wb_reg
+        mem_wb_reg,
+        dcache,
+        dcache_wait,
+        lambda: freeze_front_end(front_end, hazard_manager, wb_finished),
+        arbiter,
+        hart_id
     ))
 
     # === WB ===
 
-    sim.add(wb_stage(
+    retired_hist = sim.reg([0] * (width + 1))
+    retire_hooks = [] # called with every retiring MemToWb, see core_trace.py
+    sim.add(writeback(
         mem_wb_reg, 
         regfile,
-        wb_finished
+        wb_finished,
+        retired_hist,
+        retire_hooks
     ))
 
     # === Outputs ===
 
     outputs = {
+        "hart_id": hart_id,
+        "width": width,
         "pc": pc,
         "regfile": regfile,
+        "imem": imem,
         "dmem": dmem, 
         "if_id_reg": if_id_reg, 
+        "saved_if_id": saved_if_id,
         "id_ex_reg": id_ex_reg, 
         "ex_mem_reg": ex_mem_reg,
         "mem_wb_reg": mem_wb_reg, 
-        "hazard_manager": hazard_manager
+        "hazard_manager": hazard_manager,
+        "icache": icache,
+        "dcache": dcache,
+        "icache_fill": icache_fill,
+        "retired_hist": retired_hist,
+        "retire_hooks": retire_hooks
     }
 
+    return outputs
+
+def rv32i_5stage(program, imem_regions=None, dmem_regions=None, stack_top=0x7FFFFFF0, strict=False, icache=None, dcache=None, width=1):
+    sim = Sim()
+
+    imem = sim.reg(load_hex(program, SparseMemory(imem_regions, strict)))
+
+    # the image goes into DMEM as well so its .data section is there at reset
+    dmem_data = load_hex(program, SparseMemory(dmem_regions, strict))
+    init_dmem(dmem_data)
+    dmem = sim.reg(dmem_data)
+
+    outputs = add_core(sim, imem, dmem, stack_top, 0, icache, dcache, width=width)
+
     return sim, outputs
 
+def rv32i_multicore(program, num_cores, imem_regions=None, dmem_regions=None, stack_top=0x7FFFFFF0, stack_size=0x10000, strict=False, width=1):
+    sim = Sim()
+
+    # every hart runs the same image, only DMEM goes through the arbiter
+    imem = sim.reg(load_hex(program, SparseMemory(imem_regions, strict)))
+
+    # the image goes into DMEM as well so its .data section is there at reset
+    dmem_data = load_hex(program, SparseMemory(dmem_regions, strict))
+    init_dmem(dmem_data)
+    dmem = sim.reg(dmem_data)
+
+    arbiter = sim.reg(DmemArbiter(num_cores))
+    ex_mem_regs = []
+
+    # the arbiter has to see every core's MEM request before any MEM stage runs
+    sim.add(arbitrate(arbiter, ex_mem_regs))
+
+    cores = []
+    for hart in range(num_cores):
+        core = add_core(sim, imem, dmem, stack_top - hart * stack_size, hart, arbiter=arbiter, width=width)
+        ex_mem_regs.append(core["ex_mem_reg"])
+        cores.append(core)
+
+    outputs = {
+        "cores": cores,
+        "imem": imem,
+        "dmem": dmem,
+        "arbiter": arbiter
+    }
+
+    return sim, outputs
+
+HALT_INSTR = 0x0000006F # jal x0, 0
+
+def retired_slots(mem_wb):
+    if mem_wb is None:
+        return []
+    return mem_wb if isinstance(mem_wb, list) else [mem_wb]
+
+def run_until_halt(sim, outputs, max_cycles=100000):
+    # programs end by spinning on jal x0, 0, so stop once WB retires it. Reaching MEM/WB is not
+    # enough, the slot issued next to it in a bundle only writes back on the following step
+    while sim.cycle < max_cycles:
+        sim.step()
+        for mw in retired_slots(outputs["mem_wb_reg"].val):
+            if mw.instr == HALT_INSTR:
+                sim.step()
+                return sim.cycle
+    return None
+
+def compare_widths(program, max_cycles=100000, **kwargs):
+    results = {}
+    for width in (1, 2):
+        # caches are stateful, each core gets its own copy
+        sim, outputs = rv32i_5stage(program, width=width, **copy.deepcopy(kwargs))
+        cycles = run_until_halt(sim, outputs, max_cycles)
+        hist = outputs["retired_hist"].val
+        retired = sum(n * count for n, count in enumerate(hist))
+        results[width] = (cycles, retired, hist, outputs)
+
+        ipc = retired / cycles if cycles else 0.0
+        print(f"width {width}: cycles {cycles}, retired {retired}, IPC {ipc:.3f}, retired/cycle histogram {hist}")
+
+    scalar, dual = results[1][3], results[2][3]
+    same = scalar["regfile"].val == dual["regfile"].val and scalar["dmem"].val.pages == dual["dmem"].val.pages
+    if results[1][0] and results[2][0]:
+        print(f"speedup {results[1][0] / results[2][0]:.3f}, same final state: {same}")
+
+    return results
+
 if __name__ == "__main__":
     num_cores = 1
     program = "software/bubblesort.hex"
 
-    print(f"Instantiating core...")
-    sim, outputs = rv32i_5stage(program)
+    print(f"Instantiating {num_cores} core(s)...")
+    if num_cores == 1:
+        sim, outputs = rv32i_5stage(program)
+        cores = [outputs]
+    else:
+        sim, outputs = rv32i_multicore(program, num_cores)
+        cores = outputs["cores"]
     print(f"Running core simulation...")
 
-    for cycle in range(2001): 
+    for cycle in range(4001): 
         sim.run(1)
 
         if cycle % 100 == 0:
             print(f"\nCycle {cycle}:")
-            print(f"PC: 0x{outputs['pc'].val:08x}")
-            print(f"x3: {outputs['regfile'].val[3]}")
-            print(f"x4: {outputs['regfile'].val[4]}")
-            print(f"x5: {outputs['regfile'].val[5]}")
-            print(f"DMem[0:4]: {outputs['dmem'].val}")
\ No newline at end of file
+            for core in cores:
+                print(f"[hart {core['hart_id']}] PC: 0x{core['pc'].val:08x}")
+                print(f"[hart {core['hart_id']}] x3: {core['regfile'].val[3]}")
+                print(f"[hart {core['hart_id']}] x4: {core['regfile'].val[4]}")
+                print(f"[hart {core['hart_id']}] x5: {core['regfile'].val[5]}")
+            print(f"DMem[0:16]: {outputs['dmem'].val.words(0, 16)}")
+
+    dmem = outputs["dmem"].val
+    print(f"\nDMem footprint: {dmem.footprint()} bytes, faults: {dmem.fault_count}")
+    if num_cores > 1:
+        print(f"Arbiter: {outputs['arbiter'].val.stats()}")
+
+    print()
+    compare_widths(program)
@@ -0,0 +1,262 @@
+import sys
+import os
+from collections import deque
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_tasks import *
+from core_mem import PAGE_BITS
+
+# === Reference Model ===
+
+# One instruction per step, straight from the RV32I spec with no pipeline in the way.
+# It shares nothing mutable with the core it checks, DMEM is cloned up front.
+
+@dataclass
+class IssRetire:
+    pc: int
+    instr: int
+    rd: Optional[int] = None
+    rd_val: int = 0
+    store_addr: Optional[int] = None
+    store_data: int = 0
+
+class Iss:
+    def __init__(self, imem, dmem, pc=0, regs=None, hart_id=0):
+        self.imem = imem
+        self.dmem = dmem
+        self.pc = pc
+        self.regs = list(regs) if regs is not None else [0] * 32
+        self.hart_id = hart_id
+        self.dirty_pages = set()
+        self.retired = 0
+
+    def load(self, addr, size, signed):
+        if size == 4 and addr & 0x3 == 0:
+            val = self.dmem.read(addr)
+        else:
+            val = 0
+            for i in range(size):
+                a = addr + i
+                val |= ((self.dmem.read(a & ~0x3) >> ((a & 0x3) * 8)) & 0xFF) << (8 * i)
+        return mask32(sext32(val, 8 * size)) if signed else val
+
+    def store(self, addr, size, val):
+        if size == 4 and addr & 0x3 == 0:
+            self.dmem.write(addr, val)
+        else:
+            for i in range(size):
+                self.dmem.write_byte(addr + i, val >> (8 * i))
+        self.dirty_pages.add(addr >> PAGE_BITS)
+        self.dirty_pages.add((addr + size - 1) >> PAGE_BITS)
+
+    def step(self):
+        pc = self.pc
+        instr = self.imem.read(pc)
+        r = self.regs
+
+        opcode = instr & 0x7f
+        rd = (instr >> 7) & 0x1f
+        funct3 = (instr >> 12) & 0x7
+        rs1 = r[(instr >> 15) & 0x1f]
+        rs2 = r[(instr >> 20) & 0x1f]
+        funct7 = instr >> 25
+
+        imm_i = sext32(instr >> 20, 12)
+        next_pc = mask32(pc + 4)
+        ret = IssRetire(pc, instr)
+        val = None
+
+        if opcode == 0x33:
+            if funct7 == 0x00 and funct3 == 0x0: val = rs1 + rs2
+            elif funct7 == 0x20 and funct3 == 0x0: val = rs1 - rs2
+            elif funct7 == 0x00 and funct3 == 0x1: val = rs1 << (rs2 & 31)
+            elif funct7 == 0x00 and funct3 == 0x2: val = int(to_int32(rs1) < to_int32(rs2))
+            elif funct7 == 0x00 and funct3 == 0x3: val = int(rs1 < rs2)
+            elif funct7 == 0x00 and funct3 == 0x4: val = rs1 ^ rs2
+            elif funct7 == 0x00 and funct3 == 0x5: val = rs1 >> (rs2 & 31)
+            elif funct7 == 0x20 and funct3 == 0x5: val = to_int32(rs1) >> (rs2 & 31)
+            elif funct7 == 0x00 and funct3 == 0x6: val = rs1 | rs2
+            elif funct7 == 0x00 and funct3 == 0x7: val = rs1 & rs2
+            else: self.illegal(instr)
+
+        elif opcode == 0x13:
+            shamt = (instr >> 20) & 31
+            if funct3 == 0x0: val = rs1 + imm_i
+            elif funct3 == 0x2: val = int(to_int32(rs1) < imm_i)
+            elif funct3 == 0x3: val = int(rs1 < mask32(imm_i))
+            elif funct3 == 0x4: val = rs1 ^ imm_i
+            elif funct3 == 0x6: val = rs1 | imm_i
+            elif funct3 == 0x7: val = rs1 & imm_i
+            elif funct3 == 0x1 and funct7 == 0x00: val = rs1 << shamt
+            elif funct3 == 0x5 and funct7 == 0x00: val = rs1 >> shamt
+            elif funct3 == 0x5 and funct7 == 0x20: val = to_int32(rs1) >> shamt
+            else: self.illegal(instr)
+
+        elif opcode == 0x03:
+            addr = mask32(rs1 + imm_i)
+            if funct3 == 0x0: val = self.load(addr, 1, True)
+            elif funct3 == 0x1: val = self.load(addr, 2, True)
+            elif funct3 == 0x2: val = self.load(addr, 4, False)
+            elif funct3 == 0x4: val = self.load(addr, 1, False)
+            elif funct3 == 0x5: val = self.load(addr, 2, False)
+            else: self.illegal(instr)
+
+        elif opcode == 0x23:
+            imm_s = sext32(((instr >> 7) & 0x1f) | ((instr >> 25) << 5), 12)
+            addr = mask32(rs1 + imm_s)
+            if funct3 > 0x2:
+                self.illegal(instr)
+            size = 1 << funct3
+            data = rs2 & ((1 << (8 * size)) - 1)
+            self.store(addr, size, data)
+            ret.store_addr = addr
+            ret.store_data = data
+
+        elif opcode == 0x63:
+            imm_b = sext32((((instr >> 8) & 0x0f) << 1) | (((instr >> 25) & 0x3f) << 5) | (((instr >> 7) & 0x01) << 11) | ((instr >> 31) << 12), 13)
+            if funct3 == 0x0: taken = rs1 == rs2
+            elif funct3 == 0x1: taken = rs1 != rs2
+            elif funct3 == 0x4: taken = to_int32(rs1) < to_int32(rs2)
+            elif funct3 == 0x5: taken = to_int32(rs1) >= to_int32(rs2)
+            elif funct3 == 0x6: taken = rs1 < rs2
+            elif funct3 == 0x7: taken = rs1 >= rs2
+            else: self.illegal(instr)
+            if taken:
+                next_pc = mask32(pc + imm_b)
+
+        elif opcode == 0x37:
+            val = instr & 0xfffff000
+
+        elif opcode == 0x17:
+            val = pc + (instr & 0xfffff000)
+
+        elif opcode == 0x6f:
+            imm_j = sext32((((instr >> 21) & 0x3ff) << 1) | (((instr >> 20) & 0x1) << 11) | (((instr >> 12) & 0xff) << 12) | ((instr >> 31) << 20), 21)
+            val = pc + 4
+            next_pc = mask32(pc + imm_j)
+
+        elif opcode == 0x67:
+            val = pc + 4
+            next_pc = mask32(rs1 + imm_i) & ~1
+
+        elif opcode == 0x73:
+            # the core only implements csrr rd, mhartid, everything else in SYSTEM retires as a nop
+            if funct3 == 0x2 and (instr >> 20) == 0xF14 and (instr >> 15) & 0x1f == 0:
+                val = self.hart_id
+
+        elif opcode == 0x0f:
+            pass # fence
+
+        else:
+            self.illegal(instr)
+
+        if val is not None and rd != 0:
+            val = mask32(val)
+            r[rd] = val
+            ret.rd = rd
+            ret.rd_val = val
+
+        self.pc = next_pc
+        self.retired += 1
+        return ret
+
+    def illegal(self, instr):
+        raise RuntimeError(f"ISS: illegal instruction 0x{instr:08x} at pc 0x{self.pc:08x}")
+
+# === Lockstep Checker ===
+
+class LockstepMismatch(RuntimeError):
+    pass
+
+class LockstepChecker:
+    def __init__(self, sim, outputs, history=8):
+        self.sim = sim
+        self.outputs = outputs
+        # the ISS starts from the core's reset state, so attach before the first step
+        self.iss = Iss(
+            outputs["imem"].val,
+            outputs["dmem"].val.copy(),
+            outputs["pc"].val,
+            outputs["regfile"].val,
+            outputs["hart_id"]
+        )
+        self.recent = deque(maxlen=history)
+        self.checked = 0
+
+    def retire(self, mw):
+        # only what this instruction changed is compared, the full state check is check_state()
+        exp = self.iss.step()
+        self.recent.append(mw)
+
+        rd = mw.rd if mw.rd != 0 else None
+        store = mw.mem == MemOperation.WRITE
+
+        if mw.pc != exp.pc or mw.instr != exp.instr:
+            self.mismatch(f"retired pc 0x{mw.pc:08x} (0x{mw.instr:08x}), expected pc 0x{exp.pc:08x} (0x{exp.instr:08x})")
+        if rd != exp.rd or (rd is not None and mw.wb_data != exp.rd_val):
+            got = f"x{rd}=0x{mw.wb_data:08x}" if rd is not None else "no write"
+            want = f"x{exp.rd}=0x{exp.rd_val:08x}" if exp.rd is not None else "no write"
+            self.mismatch(f"register write {got}, expected {want}")
+        if store != (exp.store_addr is not None) or (store and (mw.mem_addr, mw.mem_data) != (exp.store_addr, exp.store_data)):
+            got = f"[0x{mw.mem_addr:08x}]=0x{mw.mem_data:08x}" if store else "no store"
+            want = f"[0x{exp.store_addr:08x}]=0x{exp.store_data:08x}" if exp.store_addr is not None else "no store"
+            self.mismatch(f"store {got}, expected {want}")
+
+        self.checked += 1
+
+    def check_state(self):
+        # registers plus every page the ISS has stored to, at the end of a run or at a checkpoint
+        regs = self.outputs["regfile"].val
+        for i in range(32):
+            if regs[i] != self.iss.regs[i]:
+                self.mismatch(f"final x{i}=0x{regs[i]:08x}, expected 0x{self.iss.regs[i]:08x}")
+
+        dmem = self.outputs["dmem"].val
+        for page in sorted(self.iss.dirty_pages):
+            got = dmem.pages.get(page)
+            want = self.iss.dmem.pages.get(page)
+            if got != want:
+                for i in range(len(want)):
+                    if got is None or got[i] != want[i]:
+                        addr = (page << PAGE_BITS) + 4 * i
+                        self.mismatch(f"final DMEM[0x{addr:08x}]=0x{dmem.read(addr):08x}, expected 0x{want[i]:08x}")
+
+    def mismatch(self, what):
+        raise LockstepMismatch(f"Lockstep mismatch after {self.checked} retirements: {what}\n{self.dump()}")
+
+    def dump(self):
+        o = self.outputs
+        lines = [f"cycle {self.sim.cycle}, fetch pc 0x{o['pc'].val:08x}"]
+        for name in ["if_id_reg", "saved_if_id", "id_ex_reg", "ex_mem_reg", "mem_wb_reg"]:
+            lines.append(f"  {name:<12} {o[name].val}")
+        lines.append(f"  scoreboard   0x{o['hazard_manager'].val.scoreboard:08x}")
+        regs = o["regfile"].val
+        for i in range(0, 32, 8):
+            lines.append("  " + " ".join(f"x{j:<2}={regs[j]:08x}" for j in range(i, i + 8)))
+        lines.append("  last retirements:")
+        for mw in self.recent:
+            lines.append(f"    {mw}")
+        return "\n".join(lines)
+
+def attach_lockstep(sim, outputs):
+    # single core only, harts sharing DMEM would need their stores interleaved into one ISS memory
+    checker = LockstepChecker(sim, outputs)
+    outputs["retire_hooks"].append(checker.retire)
+    return checker
+
+if __name__ == "__main__":
+    from core_gen import rv32i_5stage, run_until_halt
+    from core_mem import Cache
+    from core_workloads import SUITE, build_workload
+
+    for name, n in SUITE:
+        for width in (1, 2):
+            # the I-cache shifts where the halt lands in a bundle, so run both
+            for icache in (None, Cache(256, 16, 2, "lru", 5)):
+                path, _, _ = build_workload(name, n)
+                sim, outputs = rv32i_5stage(path, width=width, icache=icache)
+                checker = attach_lockstep(sim, outputs)
+                run_until_halt(sim, outputs, 5000000)
+                checker.check_state()
+                tag = " icache" if icache is not None else ""
+                print(f"{name}_{n} width {width}{tag}: {checker.checked} retirements match")
@@ -0,0 +1,166 @@
+from array import array
+import copy
+import random
+
+# === Sparse Memory ===
+
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_WORDS = PAGE_SIZE >> 2
+ADDR_LIMIT = 1 << 32
+
+class SparseMemory:
+    # word-addressed by byte address, 4 KiB pages allocated on first write
+    def __init__(self, regions=None, strict=False):
+        self.pages = {}
+        self.regions = regions # list of (base, size) in bytes, None means the whole 32-bit space
+        self.strict = strict
+        self.fault_count = 0
+        self.last_fault = None
+        self.shared = set() # pages still owned by the memory this one was forked from
+
+    def in_range(self, addr):
+        if addr < 0 or addr >= ADDR_LIMIT:
+            return False
+        if self.regions is None:
+            return True
+        for base, size in self.regions:
+            if base <= addr < base + size:
+                return True
+        return False
+
+    def fault(self, kind, addr):
+        self.fault_count += 1
+        self.last_fault = (kind, addr)
+        if self.strict:
+            raise RuntimeError(f"Out of range {kind} at 0x{addr:08x}")
+
+    def read(self, addr):
+        if not self.in_range(addr):
+            self.fault("read", addr)
+            return 0
+        page = self.pages.get(addr >> PAGE_BITS)
+        if page is None:
+            return 0
+        return page[(addr >> 2) & (PAGE_WORDS - 1)]
+
+    def write(self, addr, val):
+        if not self.in_range(addr):
+            self.fault("write", addr)
+            return
+        n = addr >> PAGE_BITS
+        page = self.pages.get(n)
+        if page is None:
+            page = array("I", bytes(PAGE_SIZE))
+            self.pages[n] = page
+        elif n in self.shared:
+            page = array("I", page)
+            self.pages[n] = page
+            self.shared.discard(n)
+        page[(addr >> 2) & (PAGE_WORDS - 1)] = val & 0xFFFFFFFF
+
+    def write_byte(self, addr, val):
+        lane = (addr & 0x3) * 8
+        word = self.read(addr & ~0x3)
+        word = (word & ~(0xFF << lane)) | ((val & 0xFF) << lane)
+        self.write(addr & ~0x3, word)
+
+    def words(self, addr, count):
+        return [self.read(addr + 4 * i) for i in range(count)]
+
+    def footprint(self):
+        return len(self.pages) * PAGE_SIZE
+
+    def copy(self):
+        new = SparseMemory(self.regions, self.strict)
+        new.pages = {n: array("I", page) for n, page in self.pages.items()}
+        return new
+
+    def fork(self):
+        # like copy(), but a page is only duplicated on its first write
+        new = SparseMemory(self.regions, self.strict)
+        new.pages = dict(self.pages)
+        new.shared = set(self.pages)
+        new.fault_count = self.fault_count
+        new.last_fault = self.last_fault
+        return new
+
+# === Cache ===
+
+class Cache:
+    # tags only, the data always lives in the backing memory so the cache only decides timing
+    def __init__(self, size=4096, line_size=32, assoc=2, policy="lru", miss_penalty=10, seed=0):
+        if line_size & (line_size - 1) or line_size < 4:
+            raise RuntimeError(f"Line size must be a power of two >= 4, got {line_size}")
+        if size % (line_size * assoc):
+            raise RuntimeError("Cache size must be a multiple of line_size * assoc")
+        if policy not in ("lru", "fifo", "random"):
+            raise RuntimeError(f"Unknown replacement policy {policy}")
+
+        self.size = size
+        self.line_size = line_size
+        self.assoc = assoc
+        self.policy = policy
+        self.miss_penalty = miss_penalty
+        self.num_sets = size // (line_size * assoc)
+        self.offset_bits = line_size.bit_length() - 1
+        self.rng = random.Random(seed)
+
+        # each set is a list of [tag, dirty], oldest (or least recently used) first
+        self.sets = [[] for _ in range(self.num_sets)]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+        self.stall_cycles = 0
+
+    def fork(self):
+        # tags, counters and the rng all change as it runs, so the reset value needs its own copy
+        return copy.deepcopy(self)
+
+    def locate(self, addr):
+        line = addr >> self.offset_bits
+        return self.sets[line % self.num_sets], line // self.num_sets
+
+    def access(self, addr, write=False):
+        if self.lookup(addr, write):
+            return True
+        self.install(addr, write)
+        return False
+
+    def lookup(self, addr, write=False):
+        # a hit updates the replacement order, a miss leaves the cache alone
+        ways, tag = self.locate(addr)
+        for i, way in enumerate(ways):
+            if way[0] == tag:
+                self.hits += 1
+                if write:
+                    way[1] = True
+                if self.policy == "lru" and i != len(ways) - 1:
+                    ways.append(ways.pop(i))
+                return True
+        return False
+
+    def install(self, addr, write=False):
+        # the miss: brings the line in, evicting a victim if the set is full
+        ways, tag = self.locate(addr)
+        self.misses += 1
+        if len(ways) >= self.assoc:
+            victim = self.rng.randrange(len(ways)) if self.policy == "random" else 0
+            if ways.pop(victim)[1]:
+                self.writebacks += 1
+            self.evictions += 1
+        ways.append([tag, write])
+        return False
+
+    def stats(self):
+        accesses = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "writebacks": self.writebacks,
+            "hit_rate": self.hits / accesses if accesses else 0.0,
+            "stall_cycles": self.stall_cycles,
+        }
@@ -0,0 +1,197 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+
+from sim import *
+from core_tasks import *
+
+# === Profiler ===
+
+STAGES = ["IF", "ID", "EX", "MEM", "WB"]
+
+def slots(val):
+    if val is None:
+        return []
+    return val if isinstance(val, list) else [val]
+
+class Profiler:
+    def __init__(self, imem, symbols=None):
+        self.imem = imem
+        self.symbols = symbols or {} # name -> address
+        self.cycles = 0
+
+        # per pc
+        self.head_cycles = {}   # every cycle is charged to the oldest instruction in flight
+        self.stage_cycles = {}  # occupancy of each pipeline stage
+        self.stalls = {}        # reason -> cycles the instruction spent waiting
+        self.retired = {}
+
+    def stage(self, pc, s):
+        counts = self.stage_cycles.get(pc)
+        if counts is None:
+            counts = [0] * len(STAGES)
+            self.stage_cycles[pc] = counts
+        counts[s] += 1
+
+    def stall(self, pc, reason):
+        reasons = self.stalls.setdefault(pc, {})
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+    # === Basic Blocks ===
+
+    def leaders(self):
+        leaders = set(self.symbols.values())
+        leaders.add(0)
+        for pc in self.stage_cycles:
+            instr = self.imem.read(pc)
+            opcode = instr & 0x7f
+            if opcode in [0x63, 0x6f, 0x67]:
+                leaders.add(pc + 4)
+                dec = decode_instr(instr, pc, [0] * 32)
+                if opcode != 0x67:
+                    leaders.add(mask32(pc + dec.imm))
+        return leaders
+
+    def symbolize(self, pc):
+        best = None
+        for name, addr in self.symbols.items():
+            if addr <= pc and (best is None or addr > best[1]):
+                best = (name, addr)
+        if best is None:
+            return f"0x{pc:08x}"
+        offset = pc - best[1]
+        return best[0] if offset == 0 else f"{best[0]}+{offset}"
+
+    def blocks(self):
+        leaders = self.leaders()
+        blocks = []
+        cur = None
+        for pc in sorted(self.stage_cycles):
+            if cur is None or pc in leaders or pc != cur["end"]:
+                cur = {"start": pc, "end": pc, "name": self.symbolize(pc), "cycles": 0, "retired": 0, "stalls": {}}
+                blocks.append(cur)
+            cur["end"] = pc + 4
+            cur["cycles"] += self.head_cycles.get(pc, 0)
+            cur["retired"] += self.retired.get(pc, 0)
+            for reason, n in self.stalls.get(pc, {}).items():
+                cur["stalls"][reason] = cur["stalls"].get(reason, 0) + n
+        return sorted(blocks, key=lambda b: b["cycles"], reverse=True)
+
+    # === Output ===
+
+    def instructions(self):
+        rows = []
+        for pc in self.stage_cycles:
+            rows.append({
+                "pc": pc,
+                "symbol": self.symbolize(pc),
+                "instr": self.imem.read(pc),
+                "cycles": self.head_cycles.get(pc, 0),
+                "retired": self.retired.get(pc, 0),
+                "stages": dict(zip(STAGES, self.stage_cycles[pc])),
+                "stalls": self.stalls.get(pc, {}),
+            })
+        return sorted(rows, key=lambda r: r["cycles"], reverse=True)
+
+    def report(self, top=20):
+        total = max(self.cycles, 1)
+        lines = [f"Total cycles: {self.cycles}, retired: {sum(self.retired.values())}", ""]
+
+        lines.append("Basic blocks:")
+        lines.append(f"{'block':<24}{'range':<24}{'cycles':>10}{'%':>8}{'retired':>10}  stalls")
+        for b in self.blocks()[:top]:
+            rng = f"0x{b['start']:08x}-0x{b['end']:08x}"
+            lines.append(f"{b['name']:<24}{rng:<24}{b['cycles']:>10}{100 * b['cycles'] / total:>7.1f}%{b['retired']:>10}  {b['stalls']}")
+
+        lines.append("")
+        lines.append("Instructions:")
+        lines.append(f"{'pc':<12}{'symbol':<24}{'instr':<12}{'cycles':>10}{'%':>8}{'retired':>10}  stalls")
+        for r in self.instructions()[:top]:
+            lines.append(f"0x{r['pc']:08x}  {r['symbol']:<24}0x{r['instr']:08x}  {r['cycles']:>10}{100 * r['cycles'] / total:>7.1f}%{r['retired']:>10}  {r['stalls']}")
+
+        return "\n".join(lines)
+
+    def dump_json(self, path):
+        with open(path, "w") as f:
+            json.dump({
+                "cycles": self.cycles,
+                "symbols": self.symbols,
+                "instructions": self.instructions(),
+                "blocks": self.blocks(),
+            }, f, indent=2)
+
+# === Sampling Task ===
+
+@task
+def profile_stages(prof, pc, if_id, saved_if_id, id_ex, ex_mem, mem_wb, icache_fill):
+    # runs after every stage, so .val is what each stage worked on this cycle and .next what it decided
+    prof.cycles += 1
+
+    wb = slots(mem_wb.val)
+    mem = slots(ex_mem.val)
+    ex = slots(id_ex.val)
+    id_ = slots(saved_if_id.val) or slots(if_id.val)
+
+    for mw in wb:
+        prof.stage(mw.pc, 4)
+        prof.retired[mw.pc] = prof.retired.get(mw.pc, 0) + 1
+
+    mem_stalled = mem_wb.next is None
+    for em in mem:
+        prof.stage(em.pc, 3)
+        if mem_stalled:
+            prof.stall(em.pc, "mem")
+
+    for dec in ex:
+        prof.stage(dec.pc, 2)
+
+    if id_:
+        # a squashed slot (redirect pending) is wrong path, not a stall
+        branch_in_ex = any(d.br != BranchKind.NONE for d in ex)
+        held = slots(saved_if_id.next)
+        for f in id_:
+            prof.stage(f.pc, 1)
+            if f in held:
+                prof.stall(f.pc, "branch" if branch_in_ex else "hazard")
+
+    prof.stage(pc.val, 0)
+    if icache_fill.next is not None:
+        prof.stall(pc.val, "icache")
+
+    oldest = (wb or mem or ex or id_ or [None])[0]
+    head = oldest.pc if oldest is not None else pc.val
+    prof.head_cycles[head] = prof.head_cycles.get(head, 0) + 1
+
+def attach_profiler(sim, outputs, symbols=None):
+    prof = Profiler(outputs["imem"].val, symbols)
+    sim.add(profile_stages(
+        prof,
+        outputs["pc"],
+        outputs["if_id_reg"],
+        outputs["saved_if_id"],
+        outputs["id_ex_reg"],
+        outputs["ex_mem_reg"],
+        outputs["mem_wb_reg"],
+        outputs["icache_fill"]
+    ))
+    return prof
+
+# === Symbols ===
+
+def load_asm_symbols(path, linker_script=None):
+    from core_asm import assemble_file
+    return assemble_file(path, linker_script).text_symbols
+
+if __name__ == "__main__":
+    from core_gen import rv32i_5stage, run_until_halt
+
+    program = "software/bubblesort.hex"
+    sim, outputs = rv32i_5stage(program)
+    prof = attach_profiler(sim, outputs, load_asm_symbols("software/bubblesort.asm"))
+    run_until_halt(sim, outputs)
+
+    print(prof.report())
+    if len(sys.argv) == 2:
+        prof.dump_json(sys.argv[1])
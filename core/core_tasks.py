@@ -58,6 +58,7 @@ class DecodeToExec:
     rs1_val: int = 0
     rs2_val: int = 0
     pc: int = 0
+    instr: int = 0
 
 @dataclass
 class ExecToMem: 
@@ -66,11 +67,18 @@ class ExecToMem:
     wb_data_nonload: int = 0
     mem: MemOperation = MemOperation.NONE
     rd: Optional[int] = None
+    pc: int = 0
+    instr: int = 0
 
 @dataclass
 class MemToWb:
     wb_data: int = 0
     rd: Optional[int] = None
+    pc: int = 0
+    instr: int = 0
+    mem: MemOperation = MemOperation.NONE
+    mem_addr: int = 0
+    mem_data: int = 0
 
 # === Helper Functions ===
 
@@ -87,23 +95,135 @@ def to_int32(x):
         return x - 0x100000000
     return x
 
+def cache_stall(cache, wait, addr, write=False):
+    # True while the access is still waiting on a miss, wait counts the remaining penalty
+    if wait.val > 1:
+        wait.next = wait.val - 1
+    elif wait.val == 1:
+        wait.next = 0
+        return False
+    elif cache.access(addr, write) or cache.miss_penalty == 0:
+        return False
+    else:
+        wait.next = cache.miss_penalty
+    cache.stall_cycles += 1
+    return True
+
+def icache_stall(cache, fill, addr):
+    # runs every cycle, addr is None when IF is not fetching. fill is the one refill in flight as
+    # (addr, cycles left): it counts down whatever IF, ID or MEM are doing, a redirect does not
+    # cancel it, and the line goes in on its last cycle. True while addr has to wait for a line
+    done = None
+    if fill.val is not None:
+        fill_addr, left = fill.val
+        if left > 1:
+            fill.next = (fill_addr, left - 1)
+        else:
+            cache.install(fill_addr)
+            cache.stall_cycles += cache.miss_penalty
+            fill.next = None
+            done = fill_addr >> cache.offset_bits
+
+    if addr is None:
+        return False
+    if done == addr >> cache.offset_bits:
+        return False
+    if fill.val is not None and done is None:
+        return True
+    if cache.lookup(addr):
+        return False
+    if cache.miss_penalty == 0:
+        cache.install(addr)
+        return False
+    fill.next = (addr, cache.miss_penalty)
+    return True
+
+def writable(mem):
+    # memories, caches and the arbiter are updated in place, so the first access after a reset forks the reset value
+    if mem.val is mem.init:
+        mem.val = mem.init.fork()
+        mem.next = mem.val
+    return mem.val
+
+def freeze_front_end(regs, hazard_manager, wb_finished):
+    # hold IF/ID/EX for this cycle, WB keeps draining so its scoreboard release still has to land
+    for r in regs:
+        r.next = r.val
+    hm = hazard_manager.val.copy()
+    released = wb_finished.val
+    if released is not None:
+        # the dual issue WB hands over a list of registers
+        for r in (released if isinstance(released, list) else [released]):
+            hm.release_reg(r)
+    hazard_manager.next = hm
+
+class DmemArbiter:
+    # single ported shared DMEM, one access per cycle handed out round robin
+    def __init__(self, num_ports):
+        self.num_ports = num_ports
+        self.grant = None
+        self.last = num_ports - 1
+        self.accesses = [0] * num_ports
+        self.contention_cycles = [0] * num_ports
+
+    def fork(self):
+        new = DmemArbiter(self.num_ports)
+        new.grant = self.grant
+        new.last = self.last
+        new.accesses = list(self.accesses)
+        new.contention_cycles = list(self.contention_cycles)
+        return new
+
+    def stats(self):
+        return {
+            "accesses": list(self.accesses),
+            "contention_cycles": list(self.contention_cycles),
+        }
+
+@task
+def arbitrate(arbiter, ex_mem_regs):
+    # runs first every cycle, so the MEM stages after it all see the forked arbiter
+    arb = writable(arbiter)
+    arb.grant = None
+
+    for i in range(1, arb.num_ports + 1):
+        port = (arb.last + i) % arb.num_ports
+        em = ex_mem_regs[port].val
+        if em is None:
+            continue
+        # a dual issue core hands over a bundle, at most one slot of it touches DMEM
+        if any(s.mem != MemOperation.NONE for s in (em if isinstance(em, list) else [em])):
+            arb.grant = port
+            arb.last = port
+            return
+
 # === IF ===
 
 @task
-def fetch_stage(pc, imem, stall_if, redirect_pc, fetch_to_decode):
+def fetch_stage(pc, imem, stall_if, redirect_pc, fetch_to_decode, icache=None, icache_fill=None):
     if redirect_pc.val is not None:
         pc.next = redirect_pc.val
         fetch_to_decode.next = None
+        if icache is not None:
+            icache_stall(writable(icache), icache_fill, None)
     elif stall_if.val:
         pc.next = pc.val
         fetch_to_decode.next = fetch_to_decode.val
+        if icache is not None:
+            icache_stall(writable(icache), icache_fill, None)
     else:
-        pc_addr = pc.val >> 2
-        if pc_addr < len(imem.val):
-            instr = imem.val[pc_addr]
+        # the line arrives on the last wait cycle, until then IF only sends bubbles
+        if icache is not None and icache_stall(writable(icache), icache_fill, pc.val):
+            pc.next = pc.val
+            fetch_to_decode.next = None
+            return
+
+        if imem.val.in_range(pc.val):
+            instr = imem.val.read(pc.val)
             fetch_to_decode.next = FetchToDecode(instr=instr, pc=pc.val)
             pc.next = pc.val + 4
         else: 
+            writable(imem).fault("fetch", pc.val)
             pc.next = pc.val
             fetch_to_decode.next = None
 
@@ -127,47 +247,33 @@ class DataHazardManager:
 
 # === ID ===
 
-@task
-def decode_stage(fetch_to_decode_in, saved_fetch_to_decode, hazardManager, wb_finished, regfile, decode_to_exec, stall_request):
-    stall_request.next = False
-    decode_to_exec.next = None
+def source_regs(instr):
+    opcode = instr & 0x7f
+    rs1 = (instr >> 15) & 0x1f
+    rs2 = (instr >> 20) & 0x1f
 
-    current_hm = hazardManager.val.copy()
-    if wb_finished.val is not None: 
-        current_hm.release_reg(wb_finished.val)
-    hazardManager.next = current_hm
-    
-    fetch_to_decode = fetch_to_decode_in.val
-    if saved_fetch_to_decode.val is not None:
-        fetch_to_decode = saved_fetch_to_decode.val
-    saved_fetch_to_decode.next = None
+    check_rs1 = opcode in [0x33, 0x13, 0x03, 0x23, 0x63, 0x67]
+    check_rs2 = opcode in [0x33, 0x23, 0x63]
 
-    if fetch_to_decode is None:
-        return 
-    
-    instr = fetch_to_decode.instr
+    return (rs1 if check_rs1 else None), (rs2 if check_rs2 else None)
+
+def has_hazard(hm, instr):
+    rs1, rs2 = source_regs(instr)
+    if rs1 is not None and hm.is_locked(rs1):
+        return True
+    if rs2 is not None and hm.is_locked(rs2):
+        return True
+    return False
+
+def decode_instr(instr, pc, regfile, hart_id=0):
     opcode = instr & 0x7f
     rd = (instr >> 7) & 0x1f
     funct3 = (instr >> 12) & 0x7
     rs1 = (instr >> 15) & 0x1f
     rs2 = (instr >> 20) & 0x1f
     funct7 = (instr >> 25) & 0x7f
-    
-    check_rs1 = opcode in [0x33, 0x13, 0x03, 0x23, 0x63, 0x67]
-    check_rs2 = opcode in [0x33, 0x23, 0x63]
-    
-    hazard_stall = False
-    if check_rs1 and current_hm.is_locked(rs1):
-        hazard_stall = True
-    if check_rs2 and current_hm.is_locked(rs2):
-        hazard_stall = True
-    
-    if hazard_stall:
-        saved_fetch_to_decode.next = fetch_to_decode
-        stall_request.next = True
-        return
-    
-    dec = DecodeToExec(pc=fetch_to_decode.pc)
+
+    dec = DecodeToExec(pc=pc, instr=instr)
 
     def imm_i(): 
         return sext32(instr >> 20, 12)
@@ -183,8 +289,8 @@ def decode_stage(fetch_to_decode_in, saved_fetch_to_decode, hazardManager, wb_fi
         v = (((instr >> 21) & 0x3ff) << 1) | (((instr >> 20) & 0x001) << 11) | (((instr >> 12) & 0x0ff) << 12) | (((instr >> 31) & 0x001) << 20)
         return sext32(v, 21)
 
-    dec.rs1_val = regfile.val[rs1]
-    dec.rs2_val = regfile.val[rs2]
+    dec.rs1_val = regfile[rs1]
+    dec.rs2_val = regfile[rs2]
 
     if opcode == 0x33: 
         if rd != 0:
@@ -274,6 +380,49 @@ def decode_stage(fetch_to_decode_in, saved_fetch_to_decode, hazardManager, wb_fi
         dec.br = BranchKind.JALR
         dec.imm = imm_i()
     
+    elif opcode == 0x73:
+        # only csrr rd, mhartid, the value rides through EX like a LUI immediate
+        if funct3 == 0x2 and (instr >> 20) == 0xF14 and rs1 == 0 and rd != 0:
+            dec.rd = rd
+            dec.op = AluOp.LUI
+            dec.imm = hart_id
+
+    return dec
+
+@task
+def decode_stage(fetch_to_decode_in, saved_fetch_to_decode, hazardManager, wb_finished, regfile, decode_to_exec, stall_request, redirect_pc, hart_id=0):
+    branch_in_ex = decode_to_exec.val is not None and decode_to_exec.val.br != BranchKind.NONE
+    stall_request.next = False
+    decode_to_exec.next = None
+
+    current_hm = hazardManager.val.copy()
+    if wb_finished.val is not None: 
+        current_hm.release_reg(wb_finished.val)
+    hazardManager.next = current_hm
+    
+    fetch_to_decode = fetch_to_decode_in.val
+    if saved_fetch_to_decode.val is not None:
+        fetch_to_decode = saved_fetch_to_decode.val
+    saved_fetch_to_decode.next = None
+
+    if fetch_to_decode is None:
+        return 
+
+    # anything fetched behind a branch waits for EX to resolve it and is dropped on a redirect
+    if redirect_pc.val is not None:
+        return
+    if branch_in_ex:
+        saved_fetch_to_decode.next = fetch_to_decode
+        stall_request.next = saved_fetch_to_decode.val is not None
+        return
+    
+    if has_hazard(current_hm, fetch_to_decode.instr):
+        saved_fetch_to_decode.next = fetch_to_decode
+        stall_request.next = True
+        return
+    
+    dec = decode_instr(fetch_to_decode.instr, fetch_to_decode.pc, regfile.val, hart_id)
+
     stall_request.next = (dec.br != BranchKind.NONE)
 
     if (dec.rd is not None):
@@ -284,16 +433,9 @@ def decode_stage(fetch_to_decode_in, saved_fetch_to_decode, hazardManager, wb_fi
 
 # === EX ===
 
-@task
-def execute_stage(decode_to_exec, exec_to_mem, redirect_pc): 
-    redirect_pc.next = None
-    exec_to_mem.next = None
-
-    if decode_to_exec.val is None:
-        return 
-    
-    dec = decode_to_exec.val
-    em = ExecToMem()
+def execute_instr(dec):
+    em = ExecToMem(pc=dec.pc, instr=dec.instr)
+    redirect = None
 
     em.mem = dec.mem
     em.rd = dec.rd
@@ -330,7 +472,8 @@ def execute_stage(decode_to_exec, exec_to_mem, redirect_pc):
     elif dec.op == AluOp.SLT: 
         alu = do_slt(to_int32(rs1_val), to_int32(op2))
     elif dec.op == AluOp.SLTU:
-        alu = do_sltu(rs1_val, op2)
+        # sltiu sign-extends its immediate and then compares unsigned
+        alu = do_sltu(rs1_val, mask32(op2))
     elif dec.op == AluOp.LUI: 
         alu = dec.imm if dec.imm is not None else 0
     elif dec.op == AluOp.AUIPC:
@@ -344,27 +487,27 @@ def execute_stage(decode_to_exec, exec_to_mem, redirect_pc):
     
     if dec.br == BranchKind.BEQ: 
         if rs1_val == rs2_val:
-            redirect_pc.next = branch_target()
+            redirect = branch_target()
     elif dec.br == BranchKind.BNE:
         if rs1_val != rs2_val: 
-            redirect_pc.next = branch_target()
+            redirect = branch_target()
     elif dec.br == BranchKind.BLT:
         if to_int32(rs1_val) < to_int32(rs2_val):
-            redirect_pc.next = branch_target()
+            redirect = branch_target()
     elif dec.br == BranchKind.BGE:
         if to_int32(rs1_val) >= to_int32(rs2_val):
-            redirect_pc.next = branch_target()
+            redirect = branch_target()
     elif dec.br == BranchKind.BLTU:
         if rs1_val < rs2_val:
-            redirect_pc.next = branch_target()
+            redirect = branch_target()
     elif dec.br == BranchKind.BGEU:
         if rs1_val >= rs2_val:
-            redirect_pc.next = branch_target()
+            redirect = branch_target()
     elif dec.br == BranchKind.JAL:
-        redirect_pc.next = branch_target()
+        redirect = branch_target()
         link_val = mask32(dec.pc + 4)
     elif dec.br == BranchKind.JALR:
-        redirect_pc.next = mask32((rs1_val + (dec.imm if dec.imm is not None else 0)) & ~1)
+        redirect = mask32((rs1_val + (dec.imm if dec.imm is not None else 0)) & ~1)
         link_val = mask32(dec.pc + 4)
     
     if dec.br == BranchKind.JAL or dec.br == BranchKind.JALR:
@@ -375,44 +518,93 @@ def execute_stage(decode_to_exec, exec_to_mem, redirect_pc):
     em.addr_or_alu = alu
     em.store_data = rs2_val
 
-    exec_to_mem.next = em
-
-# === MEM ===
+    return em, redirect
 
 @task
-def mem_stage(exec_to_mem, dmem, mem_to_wb):
-    mem_to_wb.next = None
+def execute_stage(decode_to_exec, exec_to_mem, redirect_pc): 
+    redirect_pc.next = None
+    exec_to_mem.next = None
 
-    if exec_to_mem.val is None: 
+    if decode_to_exec.val is None:
         return 
     
-    em = exec_to_mem.val
-    mw = MemToWb()
+    exec_to_mem.next, redirect_pc.next = execute_instr(decode_to_exec.val)
+
+# === MEM ===
+
+def mem_stall(em, dcache, dcache_wait, arbiter, port):
+    if em.mem == MemOperation.NONE:
+        return False
+
+    if arbiter is not None:
+        if arbiter.val.grant != port:
+            arbiter.val.contention_cycles[port] += 1
+            return True
+        arbiter.val.accesses[port] += 1
+
+    if dcache is not None:
+        return cache_stall(writable(dcache), dcache_wait, em.addr_or_alu, em.mem == MemOperation.WRITE)
+
+    return False
+
+def mem_access(em, dmem):
+    mw = MemToWb(pc=em.pc, instr=em.instr)
 
     mw.rd = em.rd
     mw.wb_data = em.wb_data_nonload
 
+    # dmem is only touched here so stores go straight into the pages instead of copying the whole memory
     if em.mem == MemOperation.READ: 
-        addr = em.addr_or_alu >> 2
-        if addr < len(dmem.val):
-            mw.wb_data = dmem.val[addr]
+        mw.wb_data = writable(dmem).read(em.addr_or_alu & ~0x3)
+        mw.mem_data = mw.wb_data
     elif em.mem == MemOperation.WRITE: 
-        addr = em.addr_or_alu >> 2
-        if addr < len(dmem.val):
-            new_dmem = dmem.val.copy()
-            new_dmem[addr] = em.store_data
-            dmem.next = new_dmem
+        writable(dmem).write(em.addr_or_alu & ~0x3, em.store_data)
+        mw.mem_data = em.store_data
+    mw.mem = em.mem
+    mw.mem_addr = em.addr_or_alu
+
+    return mw
+
+@task
+def mem_stage(exec_to_mem, dmem, mem_to_wb, dcache=None, dcache_wait=None, freeze=None, arbiter=None, port=0):
+    mem_to_wb.next = None
+
+    if exec_to_mem.val is None: 
+        return 
+    
+    em = exec_to_mem.val
+
+    if mem_stall(em, dcache, dcache_wait, arbiter, port):
+        freeze()
+        return
         
-    mem_to_wb.next = mw
+    mem_to_wb.next = mem_access(em, dmem)
+
+# === WB ===
+
+def count_retired(retired_hist, n):
+    # a new list every cycle, the one in Reg.init has to stay all zeros for Sim.reset()
+    hist = retired_hist.val.copy()
+    hist[n] += 1
+    retired_hist.next = hist
 
 @task
-def wb_stage(mem_to_wb, regfile, wb_finished):
+def wb_stage(mem_to_wb, regfile, wb_finished, retired_hist=None, retire_hooks=None):
     wb_finished.next = None
 
     if mem_to_wb.val is None:
+        if retired_hist is not None:
+            count_retired(retired_hist, 0)
         return 
     
     mw = mem_to_wb.val
+    if retired_hist is not None:
+        count_retired(retired_hist, 1)
+
+    # stores and branches retire here too even though they never touch the regfile
+    if retire_hooks:
+        for hook in retire_hooks:
+            hook(mw)
 
     if mw.rd is None or mw.rd == 0:
         return
@@ -421,4 +613,162 @@ def wb_stage(mem_to_wb, regfile, wb_finished):
         new_regfile = regfile.val.copy()
         new_regfile[mw.rd] = mw.wb_data
         regfile.next = new_regfile
-        wb_finished.next = mw.rd
\ No newline at end of file
+        wb_finished.next = mw.rd
+
+# === Dual Issue ===
+
+# Same five stages, but every pipeline register carries a list of up to two slots (oldest first).
+# The pair moves as one bundle from ID to WB, so a stall anywhere holds both slots.
+
+@task
+def fetch2_stage(pc, imem, stall_if, redirect_pc, fetch_to_decode, icache=None, icache_fill=None):
+    if redirect_pc.val is not None:
+        pc.next = redirect_pc.val
+        fetch_to_decode.next = None
+        if icache is not None:
+            icache_stall(writable(icache), icache_fill, None)
+    elif stall_if.val:
+        pc.next = pc.val
+        fetch_to_decode.next = fetch_to_decode.val
+        if icache is not None:
+            icache_stall(writable(icache), icache_fill, None)
+    else:
+        if icache is not None and icache_stall(writable(icache), icache_fill, pc.val):
+            pc.next = pc.val
+            fetch_to_decode.next = None
+            return
+
+        if not imem.val.in_range(pc.val):
+            writable(imem).fault("fetch", pc.val)
+            pc.next = pc.val
+            fetch_to_decode.next = None
+            return
+
+        bundle = [FetchToDecode(instr=imem.val.read(pc.val), pc=pc.val)]
+
+        # the second word has to come from the same fetch block (cache line when there is an icache)
+        pc1 = pc.val + 4
+        same_block = icache is None or (pc1 >> icache.val.offset_bits) == (pc.val >> icache.val.offset_bits)
+        if same_block and imem.val.in_range(pc1):
+            bundle.append(FetchToDecode(instr=imem.val.read(pc1), pc=pc1))
+
+        fetch_to_decode.next = bundle
+        pc.next = pc.val + 4 * len(bundle)
+
+@task
+def decode2_stage(fetch_to_decode_in, saved_fetch_to_decode, hazardManager, wb_finished, regfile, decode_to_exec, stall_request, redirect_pc, hart_id=0):
+    branch_in_ex = decode_to_exec.val is not None and any(d.br != BranchKind.NONE for d in decode_to_exec.val)
+    stall_request.next = False
+    decode_to_exec.next = None
+
+    current_hm = hazardManager.val.copy()
+    if wb_finished.val is not None: 
+        for r in wb_finished.val:
+            current_hm.release_reg(r)
+    hazardManager.next = current_hm
+    
+    bundle = fetch_to_decode_in.val
+    if saved_fetch_to_decode.val is not None:
+        bundle = saved_fetch_to_decode.val
+    saved_fetch_to_decode.next = None
+
+    if bundle is None:
+        return 
+
+    if redirect_pc.val is not None:
+        return
+    if branch_in_ex:
+        # a held leftover means IF/ID still has an unread bundle, so keep IF from overwriting it
+        saved_fetch_to_decode.next = bundle
+        stall_request.next = saved_fetch_to_decode.val is not None
+        return
+
+    if has_hazard(current_hm, bundle[0].instr):
+        saved_fetch_to_decode.next = bundle
+        stall_request.next = True
+        return
+
+    # 4 read / 2 write ports: both slots read their operands this cycle, both may write back together
+    issued = []
+    for i, f in enumerate(bundle):
+        if i > 0:
+            prev = issued[-1]
+            if prev.br != BranchKind.NONE:
+                break
+            if has_hazard(current_hm, f.instr):
+                break
+            if prev.mem != MemOperation.NONE and (f.instr & 0x7f) in [0x03, 0x23]:
+                break
+
+        dec = decode_instr(f.instr, f.pc, regfile.val, hart_id)
+        if dec.rd is not None:
+            current_hm.lock_reg(dec.rd)
+        issued.append(dec)
+
+    leftover = bundle[len(issued):]
+    if leftover:
+        saved_fetch_to_decode.next = leftover
+
+    stall_request.next = bool(leftover) or issued[-1].br != BranchKind.NONE
+    hazardManager.next = current_hm
+    decode_to_exec.next = issued
+
+@task
+def execute2_stage(decode_to_exec, exec_to_mem, redirect_pc): 
+    redirect_pc.next = None
+    exec_to_mem.next = None
+
+    if decode_to_exec.val is None:
+        return 
+
+    # only the last slot of a bundle can be a branch
+    bundle = []
+    for dec in decode_to_exec.val:
+        em, redirect = execute_instr(dec)
+        bundle.append(em)
+        if redirect is not None:
+            redirect_pc.next = redirect
+    exec_to_mem.next = bundle
+
+@task
+def mem2_stage(exec_to_mem, dmem, mem_to_wb, dcache=None, dcache_wait=None, freeze=None, arbiter=None, port=0):
+    mem_to_wb.next = None
+
+    if exec_to_mem.val is None: 
+        return 
+
+    # at most one slot is a memory op, the other one waits with it
+    for em in exec_to_mem.val:
+        if mem_stall(em, dcache, dcache_wait, arbiter, port):
+            freeze()
+            return
+
+    mem_to_wb.next = [mem_access(em, dmem) for em in exec_to_mem.val]
+
+@task
+def wb2_stage(mem_to_wb, regfile, wb_finished, retired_hist=None, retire_hooks=None):
+    wb_finished.next = None
+
+    if mem_to_wb.val is None:
+        if retired_hist is not None:
+            count_retired(retired_hist, 0)
+        return 
+
+    bundle = mem_to_wb.val
+    if retired_hist is not None:
+        count_retired(retired_hist, len(bundle))
+
+    if retire_hooks:
+        for mw in bundle:
+            for hook in retire_hooks:
+                hook(mw)
+
+    written = [mw for mw in bundle if mw.rd is not None and mw.rd != 0]
+    if not written:
+        return
+
+    new_regfile = regfile.val.copy()
+    for mw in written:
+        new_regfile[mw.rd] = mw.wb_data
+    regfile.next = new_regfile
+    wb_finished.next = [mw.rd for mw in written]
@@ -0,0 +1,198 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gzip
+import struct
+from dataclasses import dataclass
+
+from core_tasks import *
+
+# === Record Format ===
+
+# one fixed-size little-endian record per retired instruction:
+# cycle, pc, instr, rd value, mem addr, mem data, rd, flags
+RECORD = struct.Struct("<QIIIIIBB2x")
+HEADER = struct.Struct("<4sHH")
+MAGIC = b"RVTR"
+VERSION = 1
+
+FLAG_RD    = 0x1
+FLAG_LOAD  = 0x2
+FLAG_STORE = 0x4
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+@dataclass
+class TraceRecord:
+    cycle: int
+    pc: int
+    instr: int
+    rd: Optional[int]
+    rd_val: int
+    mem: MemOperation
+    mem_addr: int
+    mem_data: int
+
+    def __str__(self):
+        s = f"{self.cycle:>8} pc=0x{self.pc:08x} instr=0x{self.instr:08x}"
+        if self.rd is not None:
+            s += f" x{self.rd}=0x{self.rd_val:08x}"
+        if self.mem == MemOperation.READ:
+            s += f" load [0x{self.mem_addr:08x}]=0x{self.mem_data:08x}"
+        elif self.mem == MemOperation.WRITE:
+            s += f" store [0x{self.mem_addr:08x}]=0x{self.mem_data:08x}"
+        return s
+
+def open_compressed(path, mode, compression):
+    if compression is None:
+        return open(path, mode)
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=1)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd trace compression needs the zstandard package")
+        if "w" in mode:
+            return zstandard.ZstdCompressor(level=3).stream_writer(open(path, "wb"), closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    raise RuntimeError(f"Unknown trace compression {compression}")
+
+# === Writer ===
+
+class TraceWriter:
+    def __init__(self, path, sim, compression=None, buffer_records=8192):
+        self.sim = sim
+        self.f = open_compressed(path, "wb", compression)
+        self.f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+
+        self.buf = bytearray(RECORD.size * buffer_records)
+        self.offset = 0
+        self.count = 0
+
+    def retire(self, mw):
+        # this runs once per instruction, keep it to a single pack into the preallocated buffer
+        flags = 0
+        rd = 0
+        if mw.rd is not None and mw.rd != 0:
+            flags = FLAG_RD
+            rd = mw.rd
+        if mw.mem == MemOperation.READ:
+            flags |= FLAG_LOAD
+        elif mw.mem == MemOperation.WRITE:
+            flags |= FLAG_STORE
+
+        RECORD.pack_into(
+            self.buf, self.offset,
+            self.sim.cycle, mw.pc, mw.instr, mw.wb_data if flags & FLAG_RD else 0,
+            mw.mem_addr if flags & (FLAG_LOAD | FLAG_STORE) else 0, mw.mem_data, rd, flags
+        )
+        self.offset += RECORD.size
+        self.count += 1
+
+        if self.offset == len(self.buf):
+            self.flush()
+
+    def flush(self):
+        self.f.write(memoryview(self.buf)[:self.offset])
+        self.offset = 0
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+def attach_trace(sim, outputs, path, compression=None):
+    writer = TraceWriter(path, sim, compression)
+    outputs["retire_hooks"].append(writer.retire)
+    return writer
+
+# === Reader ===
+
+def read_full(f, size):
+    # compressed streams can hand back short reads more than once, only EOF stops early
+    data = b""
+    while len(data) < size:
+        more = f.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+def read_trace(path):
+    with open(path, "rb") as f:
+        magic = f.read(4)
+
+    compression = None
+    if magic[:2] == GZIP_MAGIC:
+        compression = "gzip"
+    elif magic == ZSTD_MAGIC:
+        compression = "zstd"
+
+    with open_compressed(path, "rb", compression) as f:
+        header = read_full(f, HEADER.size)
+        if len(header) != HEADER.size:
+            raise RuntimeError(f"{path} is not a commit trace")
+        magic, version, size = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise RuntimeError(f"{path} is not a commit trace")
+        if version != VERSION or size != RECORD.size:
+            raise RuntimeError(f"{path}: unsupported trace version {version} (record size {size})")
+
+        chunk = RECORD.size * 8192
+        while True:
+            data = f.read(chunk)
+            if not data:
+                break
+            if len(data) % RECORD.size:
+                data += read_full(f, RECORD.size - len(data) % RECORD.size)
+                if len(data) % RECORD.size:
+                    raise RuntimeError(f"{path}: truncated record")
+
+            for cycle, pc, instr, rd_val, mem_addr, mem_data, rd, flags in RECORD.iter_unpack(data):
+                mem = MemOperation.NONE
+                if flags & FLAG_LOAD:
+                    mem = MemOperation.READ
+                elif flags & FLAG_STORE:
+                    mem = MemOperation.WRITE
+                yield TraceRecord(cycle, pc, instr, rd if flags & FLAG_RD else None, rd_val, mem, mem_addr, mem_data)
+
+# === Diff ===
+
+def same_retirement(a, b):
+    return (a.pc, a.instr, a.rd, a.rd_val, a.mem, a.mem_addr, a.mem_data) == \
+        (b.pc, b.instr, b.rd, b.rd_val, b.mem, b.mem_addr, b.mem_data)
+
+def diff_traces(path_a, path_b, compare_cycles=False):
+    # returns (index, record_a, record_b) for the first mismatch, None when the traces agree
+    a = read_trace(path_a)
+    b = read_trace(path_b)
+
+    index = 0
+    while True:
+        ra = next(a, None)
+        rb = next(b, None)
+        if ra is None and rb is None:
+            return None
+        if ra is None or rb is None or not same_retirement(ra, rb) or (compare_cycles and ra.cycle != rb.cycle):
+            return index, ra, rb
+        index += 1
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "dump":
+        for rec in read_trace(sys.argv[2]):
+            print(rec)
+    elif len(sys.argv) == 4 and sys.argv[1] == "diff":
+        result = diff_traces(sys.argv[2], sys.argv[3])
+        if result is None:
+            print("Traces match")
+        else:
+            index, ra, rb = result
+            print(f"First mismatch at retirement {index}:")
+            print(f"  a: {ra if ra is not None else '<end of trace>'}")
+            print(f"  b: {rb if rb is not None else '<end of trace>'}")
+            sys.exit(1)
+    else:
+        print("usage: core_trace.py dump <trace> | diff <trace_a> <trace_b>")
+        sys.exit(2)
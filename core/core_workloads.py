@@ -0,0 +1,389 @@
+import sys
+import os
+import time
+import random
+import zlib
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core_asm import *
+from core_gen import rv32i_5stage, run_until_halt
+
+SOFTWARE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "software")
+
+# === Helpers ===
+
+# every workload is RV32I with word loads/stores only, data lives in .data and the
+# program spins on `done: j done` so run_until_halt can stop it
+
+def words_directive(values, per_line=8):
+    lines = []
+    for i in range(0, len(values), per_line):
+        lines.append("    .word " + ", ".join(str(v & 0xFFFFFFFF) for v in values[i:i + per_line]))
+    return "\n".join(lines)
+
+def random_words(n, seed, limit=1000):
+    rng = random.Random(seed)
+    return [rng.randrange(limit) for _ in range(n)]
+
+def read_words(dmem, program, symbol, count):
+    return dmem.words(program.symbols[symbol], count)
+
+# rv32i has no mul, so the matmul workload calls this
+MUL_ROUTINE = """
+# a0 = a0 * a1, clobbers t0, t1
+mul:
+    li t0, 0
+mul_loop:
+    beqz a1, mul_done
+    andi t1, a1, 1
+    beqz t1, mul_skip
+    add t0, t0, a0
+mul_skip:
+    slli a0, a0, 1
+    srli a1, a1, 1
+    j mul_loop
+mul_done:
+    mv a0, t0
+    ret
+"""
+
+# === Workloads ===
+
+def memcpy_source(n, seed=0):
+    src = random_words(n, seed, 1 << 32)
+    source = f"""
+.section .text
+_start:
+    la a0, dst
+    la a1, src
+    li a2, {n}
+copy:
+    beqz a2, done
+    lw t0, 0(a1)
+    sw t0, 0(a0)
+    addi a0, a0, 4
+    addi a1, a1, 4
+    addi a2, a2, -1
+    j copy
+done:
+    j done
+
+.section .data
+src:
+{words_directive(src)}
+dst:
+    .space {4 * n}
+"""
+    def check(dmem, program):
+        return read_words(dmem, program, "dst", n) == src
+
+    return source, check
+
+def matmul_source(n, seed=0):
+    if n & (n - 1):
+        raise RuntimeError(f"matmul size must be a power of two, got {n}")
+    log = n.bit_length() - 1
+    a = random_words(n * n, seed, 16)
+    b = random_words(n * n, seed + 1, 16)
+
+    def index(row, col, dst):
+        # dst = 4 * (row * n + col)
+        return f"""    slli {dst}, {row}, {log}
+    add {dst}, {dst}, {col}
+    slli {dst}, {dst}, 2"""
+
+    source = f"""
+.section .text
+_start:
+    li s4, {n}
+    li s0, 0
+i_loop:
+    bge s0, s4, done
+    li s1, 0
+j_loop:
+    bge s1, s4, i_next
+    li s3, 0
+    li s2, 0
+k_loop:
+    bge s2, s4, k_done
+{index("s0", "s2", "t2")}
+    la t3, mat_a
+    add t3, t3, t2
+    lw a0, 0(t3)
+{index("s2", "s1", "t2")}
+    la t3, mat_b
+    add t3, t3, t2
+    lw a1, 0(t3)
+    call mul
+    add s3, s3, a0
+    addi s2, s2, 1
+    j k_loop
+k_done:
+{index("s0", "s1", "t2")}
+    la t3, mat_c
+    add t3, t3, t2
+    sw s3, 0(t3)
+    addi s1, s1, 1
+    j j_loop
+i_next:
+    addi s0, s0, 1
+    j i_loop
+done:
+    j done
+{MUL_ROUTINE}
+.section .data
+mat_a:
+{words_directive(a)}
+mat_b:
+{words_directive(b)}
+mat_c:
+    .space {4 * n * n}
+"""
+    def check(dmem, program):
+        expected = [sum(a[i * n + k] * b[k * n + j] for k in range(n)) for i in range(n) for j in range(n)]
+        return read_words(dmem, program, "mat_c", n * n) == expected
+
+    return source, check
+
+def listwalk_source(n, seed=0):
+    # nodes are {next, value} pairs laid out in shuffled order so the walk jumps around
+    values = random_words(n, seed)
+    order = list(range(n))
+    random.Random(seed + 1).shuffle(order)
+
+    base = 0x80000000 + 4 # after the head pointer, see the .data layout below
+    slot = {node: i for i, node in enumerate(order)}
+    nodes = [0] * (2 * n)
+    for node in range(n):
+        nxt = base + 8 * slot[node + 1] if node + 1 < n else 0
+        nodes[2 * slot[node]] = nxt
+        nodes[2 * slot[node] + 1] = values[node]
+
+    source = f"""
+.section .text
+_start:
+    la t0, head
+    lw t0, 0(t0)
+    li a0, 0
+    li a1, 0
+walk:
+    beqz t0, walk_done
+    lw t1, 4(t0)
+    add a0, a0, t1
+    addi a1, a1, 1
+    lw t0, 0(t0)
+    j walk
+walk_done:
+    la t0, result
+    sw a0, 0(t0)
+    sw a1, 4(t0)
+done:
+    j done
+
+.section .data
+head:
+    .word {base + 8 * slot[0]}
+nodes:
+{words_directive(nodes)}
+result:
+    .space 8
+"""
+    def check(dmem, program):
+        if program.symbols["nodes"] != base:
+            raise RuntimeError("listwalk: node table is not where the pointers expect it")
+        return read_words(dmem, program, "result", 2) == [sum(values) & 0xFFFFFFFF, n]
+
+    return source, check
+
+def crc32_source(n, seed=0):
+    # bitwise crc32 over n little-endian words, the same result as zlib.crc32
+    data = random_words(n, seed, 1 << 32)
+    source = f"""
+.section .text
+_start:
+    la s1, buf
+    li s2, {n}
+    li s0, -1
+    li s5, 0xEDB88320
+word_loop:
+    beqz s2, crc_done
+    lw s3, 0(s1)
+    li s4, 4
+byte_loop:
+    beqz s4, word_next
+    andi t0, s3, 0xff
+    xor s0, s0, t0
+    srli s3, s3, 8
+    li t2, 8
+bit_loop:
+    beqz t2, byte_next
+    andi t1, s0, 1
+    srli s0, s0, 1
+    beqz t1, bit_next
+    xor s0, s0, s5
+bit_next:
+    addi t2, t2, -1
+    j bit_loop
+byte_next:
+    addi s4, s4, -1
+    j byte_loop
+word_next:
+    addi s1, s1, 4
+    addi s2, s2, -1
+    j word_loop
+crc_done:
+    not s0, s0
+    la t0, result
+    sw s0, 0(t0)
+done:
+    j done
+
+.section .data
+buf:
+{words_directive(data)}
+result:
+    .space 4
+"""
+    def check(dmem, program):
+        expected = zlib.crc32(b"".join(w.to_bytes(4, "little") for w in data))
+        return read_words(dmem, program, "result", 1) == [expected]
+
+    return source, check
+
+def bubblesort_source(n, seed=0):
+    arr = random_words(n, seed)
+    source = f"""
+.section .text
+_start:
+    la a0, arr
+    li x3, {n}
+    li x4, 0
+outer_loop:
+    bge x4, x3, done
+    li x5, 0
+inner_loop:
+    addi x6, x3, -1
+    sub x6, x6, x4
+    bge x5, x6, outer_inc
+    slli x7, x5, 2
+    add x7, x7, a0
+    lw x8, 0(x7)
+    lw x9, 4(x7)
+    ble x8, x9, no_swap
+    sw x9, 0(x7)
+    sw x8, 4(x7)
+no_swap:
+    addi x5, x5, 1
+    j inner_loop
+outer_inc:
+    addi x4, x4, 1
+    j outer_loop
+done:
+    j done
+
+.section .data
+arr:
+{words_directive(arr)}
+"""
+    def check(dmem, program):
+        return read_words(dmem, program, "arr", n) == sorted(arr)
+
+    return source, check
+
+def insertion_sort_source(n, seed=0):
+    arr = random_words(n, seed)
+    source = f"""
+.section .text
+_start:
+    la s0, arr
+    li s1, {n}
+    li s2, 1
+outer:
+    bge s2, s1, done
+    slli t0, s2, 2
+    add t0, t0, s0
+    lw s3, 0(t0)
+inner:
+    beq t0, s0, insert
+    lw t1, -4(t0)
+    ble t1, s3, insert
+    sw t1, 0(t0)
+    addi t0, t0, -4
+    j inner
+insert:
+    sw s3, 0(t0)
+    addi s2, s2, 1
+    j outer
+done:
+    j done
+
+.section .data
+arr:
+{words_directive(arr)}
+"""
+    def check(dmem, program):
+        return read_words(dmem, program, "arr", n) == sorted(arr)
+
+    return source, check
+
+WORKLOADS = {
+    "memcpy": memcpy_source,
+    "matmul": matmul_source,
+    "listwalk": listwalk_source,
+    "crc32": crc32_source,
+    "bubblesort": bubblesort_source,
+    "insertion_sort": insertion_sort_source,
+}
+
+# default sizes for the suite, kept small enough for the 8K DMEM in link.ld
+SUITE = [
+    ("memcpy", 64), ("memcpy", 256),
+    ("matmul", 4), ("matmul", 8),
+    ("listwalk", 32), ("listwalk", 128),
+    ("crc32", 8), ("crc32", 32),
+    ("bubblesort", 16), ("bubblesort", 64),
+    ("insertion_sort", 16), ("insertion_sort", 64),
+]
+
+# === Build & Run ===
+
+def build_workload(name, n, seed=0, out_dir=SOFTWARE_DIR):
+    if name not in WORKLOADS:
+        raise RuntimeError(f"Unknown workload {name}")
+    source, check = WORKLOADS[name](n, seed)
+
+    base = os.path.join(out_dir, f"{name}_{n}")
+    with open(base + ".asm", "w") as f:
+        f.write(source.lstrip())
+
+    program = assemble_file(base + ".asm", os.path.join(SOFTWARE_DIR, "link.ld"))
+    write_hex(program, base + ".hex")
+    return base + ".hex", program, check
+
+def run_workload(name, n, width=1, seed=0, max_cycles=5000000, **kwargs):
+    path, program, check = build_workload(name, n, seed)
+    sim, outputs = rv32i_5stage(path, width=width, **kwargs)
+
+    start = time.perf_counter()
+    cycles = run_until_halt(sim, outputs, max_cycles)
+    elapsed = time.perf_counter() - start
+    if cycles is None:
+        raise RuntimeError(f"{name}_{n} did not halt within {max_cycles} cycles")
+
+    retired = sum(k * count for k, count in enumerate(outputs["retired_hist"].val))
+    return {
+        "name": f"{name}_{n}",
+        "width": width,
+        "cycles": cycles,
+        "retired": retired,
+        "cpi": cycles / retired,
+        "cycles_per_sec": cycles / elapsed if elapsed else 0.0,
+        "correct": check(outputs["dmem"].val, program),
+    }
+
+if __name__ == "__main__":
+    print(f"{'workload':<22}{'width':>6}{'cycles':>10}{'retired':>10}{'CPI':>8}{'cycles/s':>12}  result")
+    for name, n in SUITE:
+        for width in (1, 2):
+            r = run_workload(name, n, width)
+            print(f"{r['name']:<22}{r['width']:>6}{r['cycles']:>10}{r['retired']:>10}{r['cpi']:>8.3f}{r['cycles_per_sec']:>12.0f}  {'ok' if r['correct'] else 'WRONG'}")
@@ -0,0 +1,38 @@
+.section .text
+_start:
+    la a0, arr
+    li x3, 64
+    li x4, 0
+outer_loop:
+    bge x4, x3, done
+    li x5, 0
+inner_loop:
+    addi x6, x3, -1
+    sub x6, x6, x4
+    bge x5, x6, outer_inc
+    slli x7, x5, 2
+    add x7, x7, a0
+    lw x8, 0(x7)
+    lw x9, 4(x7)
+    ble x8, x9, no_swap
+    sw x9, 0(x7)
+    sw x8, 4(x7)
+no_swap:
+    addi x5, x5, 1
+    j inner_loop
+outer_inc:
+    addi x4, x4, 1
+    j outer_loop
+done:
+    j done
+
+.section .data
+arr:
+    .word 864, 394, 776, 911, 430, 41, 265, 988
+    .word 523, 497, 414, 940, 802, 849, 310, 991
+    .word 488, 366, 597, 913, 929, 223, 516, 142
+    .word 288, 143, 773, 97, 633, 818, 256, 931
+    .word 545, 722, 829, 616, 923, 150, 317, 101
+    .word 747, 75, 920, 870, 700, 338, 483, 573
+    .word 103, 362, 444, 323, 625, 655, 934, 209
+    .word 989, 565, 488, 453, 886, 533, 266, 63
@@ -0,0 +1,44 @@
+.section .text
+_start:
+    la s1, buf
+    li s2, 8
+    li s0, -1
+    li s5, 0xEDB88320
+word_loop:
+    beqz s2, crc_done
+    lw s3, 0(s1)
+    li s4, 4
+byte_loop:
+    beqz s4, word_next
+    andi t0, s3, 0xff
+    xor s0, s0, t0
+    srli s3, s3, 8
+    li t2, 8
+bit_loop:
+    beqz t2, byte_next
+    andi t1, s0, 1
+    srli s0, s0, 1
+    beqz t1, bit_next
+    xor s0, s0, s5
+bit_next:
+    addi t2, t2, -1
+    j bit_loop
+byte_next:
+    addi s4, s4, -1
+    j byte_loop
+word_next:
+    addi s1, s1, 4
+    addi s2, s2, -1
+    j word_loop
+crc_done:
+    not s0, s0
+    la t0, result
+    sw s0, 0(t0)
+done:
+    j done
+
+.section .data
+buf:
+    .word 3626764237, 1806341205, 2195908194, 2046968324, 3900315155, 2167613558, 1210484339, 3246154361
+result:
+    .space 4
@@ -0,0 +1,28 @@
+.section .text
+_start:
+    la s0, arr
+    li s1, 16
+    li s2, 1
+outer:
+    bge s2, s1, done
+    slli t0, s2, 2
+    add t0, t0, s0
+    lw s3, 0(t0)
+inner:
+    beq t0, s0, insert
+    lw t1, -4(t0)
+    ble t1, s3, insert
+    sw t1, 0(t0)
+    addi t0, t0, -4
+    j inner
+insert:
+    sw s3, 0(t0)
+    addi s2, s2, 1
+    j outer
+done:
+    j done
+
+.section .data
+arr:
+    .word 864, 394, 776, 911, 430, 41, 265, 988
+    .word 523, 497, 414, 940, 802, 849, 310, 991
@@ -0,0 +1,34 @@
+.section .text
+_start:
+    la s0, arr
+    li s1, 64
+    li s2, 1
+outer:
+    bge s2, s1, done
+    slli t0, s2, 2
+    add t0, t0, s0
+    lw s3, 0(t0)
+inner:
+    beq t0, s0, insert
+    lw t1, -4(t0)
+    ble t1, s3, insert
+    sw t1, 0(t0)
+    addi t0, t0, -4
+    j inner
+insert:
+    sw s3, 0(t0)
+    addi s2, s2, 1
+    j outer
+done:
+    j done
+
+.section .data
+arr:
+    .word 864, 394, 776, 911, 430, 41, 265, 988
+    .word 523, 497, 414, 940, 802, 849, 310, 991
+    .word 488, 366, 597, 913, 929, 223, 516, 142
+    .word 288, 143, 773, 97, 633, 818, 256, 931
+    .word 545, 722, 829, 616, 923, 150, 317, 101
+    .word 747, 75, 920, 870, 700, 338, 483, 573
+    .word 103, 362, 444, 323, 625, 655, 934, 209
+    .word 989, 565, 488, 453, 886, 533, 266, 63
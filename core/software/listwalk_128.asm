@@ -0,0 +1,58 @@
+.section .text
+_start:
+    la t0, head
+    lw t0, 0(t0)
+    li a0, 0
+    li a1, 0
+walk:
+    beqz t0, walk_done
+    lw t1, 4(t0)
+    add a0, a0, t1
+    addi a1, a1, 1
+    lw t0, 0(t0)
+    j walk
+walk_done:
+    la t0, result
+    sw a0, 0(t0)
+    sw a1, 4(t0)
+done:
+    j done
+
+.section .data
+head:
+    .word 2147484468
+nodes:
+    .word 2147484612, 310, 2147484052, 483, 2147484660, 860, 2147484236, 923
+    .word 2147483972, 822, 2147484348, 127, 2147484164, 249, 2147484140, 366
+    .word 2147483980, 430, 2147483900, 323, 2147484556, 556, 2147484492, 684
+    .word 2147483684, 244, 2147484596, 617, 2147483908, 720, 2147484124, 505
+    .word 2147483892, 317, 2147484044, 601, 2147484628, 988, 2147483708, 488
+    .word 2147483876, 223, 2147484180, 75, 2147483812, 929, 2147483772, 626
+    .word 2147484516, 520, 2147484532, 533, 2147484212, 564, 2147483764, 333
+    .word 2147484204, 516, 2147483948, 497, 2147484404, 101, 2147484220, 625
+    .word 2147484460, 891, 2147484420, 844, 2147483724, 444, 2147484652, 501
+    .word 2147484668, 722, 2147484020, 414, 2147483796, 265, 2147484580, 453
+    .word 2147484636, 990, 2147483956, 41, 2147483660, 338, 2147484268, 870
+    .word 2147483676, 616, 2147484644, 93, 2147484540, 940, 2147484316, 561
+    .word 2147483692, 723, 2147484076, 294, 2147484564, 573, 2147484324, 195
+    .word 2147484116, 256, 2147484444, 455, 2147484452, 834, 2147484548, 143
+    .word 2147483756, 818, 2147484028, 940, 2147484620, 931, 2147484252, 847
+    .word 2147484364, 14, 2147484148, 597, 2147483828, 913, 2147484092, 288
+    .word 2147483868, 747, 2147484108, 824, 2147483996, 920, 2147484100, 986
+    .word 2147483916, 727, 2147484156, 142, 2147484036, 298, 2147484332, 655
+    .word 2147484276, 327, 2147483780, 150, 2147483964, 488, 2147484572, 888
+    .word 2147483836, 1, 2147483988, 700, 2147483844, 896, 2147483668, 736
+    .word 2147484188, 208, 2147484588, 989, 2147484428, 633, 2147484132, 937
+    .word 2147484436, 939, 2147484500, 934, 2147484308, 97, 2147484372, 560
+    .word 2147484388, 394, 2147484284, 95, 2147484084, 340, 2147483748, 227
+    .word 2147484524, 776, 2147483860, 308, 2147483820, 747, 2147483652, 849
+    .word 2147483740, 803, 2147484068, 818, 2147484380, 581, 0, 93
+    .word 2147484484, 944, 2147484060, 64, 2147484356, 864, 2147483732, 822
+    .word 2147484292, 553, 2147484260, 640, 2147484300, 209, 2147483924, 362
+    .word 2147483932, 955, 2147483716, 911, 2147484604, 266, 2147484412, 802
+    .word 2147484340, 773, 2147484012, 458, 2147484508, 103, 2147483700, 341
+    .word 2147483852, 886, 2147484244, 565, 2147483788, 560, 2147484172, 63
+    .word 2147483804, 991, 2147483940, 545, 2147483884, 523, 2147484476, 145
+    .word 2147484228, 82, 2147484396, 111, 2147484196, 408, 2147484004, 829
+result:
+    .space 8
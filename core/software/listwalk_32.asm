@@ -0,0 +1,34 @@
+.section .text
+_start:
+    la t0, head
+    lw t0, 0(t0)
+    li a0, 0
+    li a1, 0
+walk:
+    beqz t0, walk_done
+    lw t1, 4(t0)
+    add a0, a0, t1
+    addi a1, a1, 1
+    lw t0, 0(t0)
+    j walk
+walk_done:
+    la t0, result
+    sw a0, 0(t0)
+    sw a1, 4(t0)
+done:
+    j done
+
+.section .data
+head:
+    .word 2147483772
+nodes:
+    .word 2147483884, 773, 2147483892, 366, 2147483804, 940, 2147483668, 414
+    .word 2147483788, 633, 2147483860, 394, 2147483796, 41, 2147483700, 430
+    .word 2147483900, 988, 2147483660, 488, 2147483676, 497, 2147483812, 913
+    .word 2147483852, 256, 2147483828, 849, 2147483820, 516, 2147483692, 864
+    .word 2147483764, 223, 2147483748, 818, 2147483716, 265, 2147483756, 802
+    .word 2147483780, 929, 2147483868, 142, 2147483836, 310, 2147483724, 991
+    .word 2147483708, 911, 0, 931, 2147483844, 776, 2147483876, 288
+    .word 2147483652, 143, 2147483684, 97, 2147483740, 597, 2147483732, 523
+result:
+    .space 8
@@ -0,0 +1,69 @@
+.section .text
+_start:
+    li s4, 4
+    li s0, 0
+i_loop:
+    bge s0, s4, done
+    li s1, 0
+j_loop:
+    bge s1, s4, i_next
+    li s3, 0
+    li s2, 0
+k_loop:
+    bge s2, s4, k_done
+    slli t2, s0, 2
+    add t2, t2, s2
+    slli t2, t2, 2
+    la t3, mat_a
+    add t3, t3, t2
+    lw a0, 0(t3)
+    slli t2, s2, 2
+    add t2, t2, s1
+    slli t2, t2, 2
+    la t3, mat_b
+    add t3, t3, t2
+    lw a1, 0(t3)
+    call mul
+    add s3, s3, a0
+    addi s2, s2, 1
+    j k_loop
+k_done:
+    slli t2, s0, 2
+    add t2, t2, s1
+    slli t2, t2, 2
+    la t3, mat_c
+    add t3, t3, t2
+    sw s3, 0(t3)
+    addi s1, s1, 1
+    j j_loop
+i_next:
+    addi s0, s0, 1
+    j i_loop
+done:
+    j done
+
+# a0 = a0 * a1, clobbers t0, t1
+mul:
+    li t0, 0
+mul_loop:
+    beqz a1, mul_done
+    andi t1, a1, 1
+    beqz t1, mul_skip
+    add t0, t0, a0
+mul_skip:
+    slli a0, a0, 1
+    srli a1, a1, 1
+    j mul_loop
+mul_done:
+    mv a0, t0
+    ret
+
+.section .data
+mat_a:
+    .word 12, 13, 1, 8, 15, 12, 9, 15
+    .word 11, 6, 4, 9, 4, 3, 8, 4
+mat_b:
+    .word 4, 2, 8, 3, 15, 14, 15, 12
+    .word 6, 3, 15, 0, 12, 13, 0, 14
+mat_c:
+    .space 64
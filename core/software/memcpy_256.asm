@@ -0,0 +1,52 @@
+.section .text
+_start:
+    la a0, dst
+    la a1, src
+    li a2, 256
+copy:
+    beqz a2, done
+    lw t0, 0(a1)
+    sw t0, 0(a0)
+    addi a0, a0, 4
+    addi a1, a1, 4
+    addi a2, a2, -1
+    j copy
+done:
+    j done
+
+.section .data
+src:
+    .word 3626764237, 1806341205, 2195908194, 2046968324, 3900315155, 2167613558, 1210484339, 3246154361
+    .word 3874773259, 1332073689, 3134603515, 2937688618, 432508404, 1864753826, 3921352636, 2048741382
+    .word 1118805955, 60308648, 3726325546, 3738645480, 2437440079, 4155553746, 1924014660, 4006490763
+    .word 468399889, 2367674807, 3034658173, 2351240810, 2320500417, 2523796087, 1911213317, 1653137829
+    .word 2472402290, 1246955724, 801997237, 2820330615, 2046685052, 3253884088, 3765700075, 3965891272
+    .word 3618339112, 3485918757, 3648514451, 4079209076, 2489771122, 1935153793, 3407305306, 353789296
+    .word 2631883398, 2706462215, 3629580546, 1043830061, 3141722290, 946870804, 3412707896, 1428231901
+    .word 3504320067, 2996472582, 2923108076, 114661864, 2727303856, 2473699103, 1680231637, 4211286945
+    .word 92928119, 532125690, 3439180443, 1116347426, 948454521, 2778524824, 1504501144, 774459493
+    .word 2163102318, 4244437633, 856226606, 3142190795, 2888969234, 2904264544, 3631070993, 1076693935
+    .word 750843993, 1533954791, 1077747587, 53413578, 3185037723, 1206384019, 4093659351, 2667504740
+    .word 3073561711, 2795305861, 1436244341, 1028283729, 2737609583, 1779861933, 200917231, 1912773091
+    .word 677258676, 3244782399, 3796214880, 2124216399, 2005286885, 3489295581, 3116232237, 4238366006
+    .word 2914199755, 1357970475, 917081460, 419980565, 2788573788, 3752314605, 4202690751, 430272795
+    .word 349375932, 3403080980, 3699512615, 1490581366, 3744626685, 79776130, 174647438, 2924858879
+    .word 2398119636, 4065197528, 2814757767, 3877110562, 2749385531, 2310386536, 892683641, 2521684855
+    .word 38212703, 648639589, 1431978117, 3391405645, 3085931548, 2665190898, 176965319, 703775687
+    .word 1243525559, 2355722127, 1260173501, 207259503, 304353766, 1410985724, 1781215744, 3902654485
+    .word 2035834473, 1475972382, 2057660952, 3004738892, 1831955274, 1296664028, 3841417822, 3950033509
+    .word 2743962364, 363653025, 3220665294, 262663685, 33719836, 2229104038, 2917582313, 1816934709
+    .word 1581971554, 3337619763, 1852080195, 1539833323, 3015084887, 2907353429, 510715801, 1709197715
+    .word 628587760, 850274848, 1623634925, 649976180, 4221906521, 2920274888, 939623321, 3861210115
+    .word 3513791694, 3367969787, 3617794108, 2503743374, 3466276464, 169289719, 966757007, 174513230
+    .word 3624757788, 2817857884, 4160097919, 2168957172, 2157914403, 2464763529, 4254304988, 3208191931
+    .word 885213514, 2571028678, 2518519247, 3427639329, 781550570, 1092894811, 281839377, 3693171169
+    .word 1752660907, 3479084707, 267399352, 546838737, 3564568120, 154334646, 1794720992, 3080302222
+    .word 4237869689, 1765833703, 2627535859, 1660790868, 202004839, 650119556, 2651714651, 2705684633
+    .word 1488927646, 2105906981, 3785054263, 2671630484, 3916079535, 3433144372, 3480000914, 812296305
+    .word 3359154501, 1909454868, 3249641924, 1956229772, 4012743224, 2088063218, 3870072202, 927624393
+    .word 487242132, 2431007201, 3963741942, 4019036144, 1785165347, 426107957, 3323526174, 1918641781
+    .word 2948143304, 129425550, 4132800011, 3103297595, 337320475, 302062762, 126175447, 1494123482
+    .word 4184687619, 3517607006, 3837274503, 893258886, 30857475, 2597803407, 3690131153, 803123253
+dst:
+    .space 1024
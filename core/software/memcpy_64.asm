@@ -0,0 +1,28 @@
+.section .text
+_start:
+    la a0, dst
+    la a1, src
+    li a2, 64
+copy:
+    beqz a2, done
+    lw t0, 0(a1)
+    sw t0, 0(a0)
+    addi a0, a0, 4
+    addi a1, a1, 4
+    addi a2, a2, -1
+    j copy
+done:
+    j done
+
+.section .data
+src:
+    .word 3626764237, 1806341205, 2195908194, 2046968324, 3900315155, 2167613558, 1210484339, 3246154361
+    .word 3874773259, 1332073689, 3134603515, 2937688618, 432508404, 1864753826, 3921352636, 2048741382
+    .word 1118805955, 60308648, 3726325546, 3738645480, 2437440079, 4155553746, 1924014660, 4006490763
+    .word 468399889, 2367674807, 3034658173, 2351240810, 2320500417, 2523796087, 1911213317, 1653137829
+    .word 2472402290, 1246955724, 801997237, 2820330615, 2046685052, 3253884088, 3765700075, 3965891272
+    .word 3618339112, 3485918757, 3648514451, 4079209076, 2489771122, 1935153793, 3407305306, 353789296
+    .word 2631883398, 2706462215, 3629580546, 1043830061, 3141722290, 946870804, 3412707896, 1428231901
+    .word 3504320067, 2996472582, 2923108076, 114661864, 2727303856, 2473699103, 1680231637, 4211286945
+dst:
+    .space 256
@@ -5,24 +5,87 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sim import *
 from systolic_tasks import *
 
-def gen_systolic(matrix_a, matrix_b):
-    N = len(matrix_a)
+def gen_systolic(matrix_a, matrix_b, engine="pe", dataflow="os", rows=None, cols=None):
+    if dataflow not in DATAFLOWS:
+        raise RuntimeError(f"Unknown dataflow {dataflow}")
+
+    M, K, N = len(matrix_a), len(matrix_b), len(matrix_b[0])
+    if any(len(row) != K for row in matrix_a):
+        raise RuntimeError(f"A is {M}x{len(matrix_a[0])} but B has {K} rows")
+
+    # without an explicit array size the array fits the whole problem in one pass
+    default_rows, default_cols = default_array(M, K, N, dataflow)
+    rows = rows or default_rows
+    cols = cols or default_cols
+
+    # "numpy" matches the per-PE model every cycle, "fast" only in the final values and cycle count
+    if engine in ("numpy", "fast"):
+        try:
+            from systolic_np import gen_systolic_np, gen_systolic_fast
+        except ImportError:
+            raise RuntimeError(f"the {engine} systolic engine needs the numpy package")
+        if engine == "fast":
+            return gen_systolic_fast(matrix_a, matrix_b, dataflow, rows, cols)
+        if dataflow != "os" or (rows, cols) != (M, N):
+            raise RuntimeError("the numpy engine only models a single os pass")
+        return gen_systolic_np(matrix_a, matrix_b)
+    if engine != "pe":
+        raise RuntimeError(f"Unknown systolic engine {engine}")
+
     sim = Sim()
 
+    tiles = plan_tiles(matrix_a, matrix_b, rows, cols, dataflow)
+    tiler = Tiler(tiles, dataflow, rows, cols, M, N, sim.reg(0))
+    depth = stream_depth(M, K, N, dataflow)
+
     count = sim.reg(0)
     sim.add(counter(count))
 
-    a_feeders = [[sim.reg(0) for _ in range(N)] for _ in range(N)]
-    b_feeders = [[sim.reg(0) for _ in range(N)] for _ in range(N)]
+    # the stationary stream starts once the rows + 1 preload steps are over
+    stream_count = sim.reg(-(rows + 1))
+    sim.add(counter(stream_count))
+
+    stats = sim.reg(SystolicStats(dataflow, rows, cols, M * N * K, sum(t["cycles"] for t in tiles)))
+    sim.add(count_cycles(stats))
+
+    if dataflow == "os":
+        outs = add_output_stationary(sim, count, TileOperand(tiler, "a"), TileOperand(tiler, "b"), rows, cols, depth, stats)
+    else:
+        w_name, x_name = ("b", "a") if dataflow == "ws" else ("a", "b")
+        outs = add_stationary(sim, count, stream_count, TileOperand(tiler, "w"), TileOperand(tiler, "x"), rows, cols, depth, stats, w_name, x_name)
+
+    result = sim.reg([[0] * N for _ in range(M)])
+    sim.add(sequence(count, stream_count, tiler, outs, result, stats))
+
+    if dataflow == "is":
+        # the drain hands out C transposed, stream row j is column j of C
+        mac_accums = [[outs[j][i] for j in range(depth)] for i in range(cols)]
+    else:
+        mac_accums = outs
+
+    outputs = {
+        "mac_accums": mac_accums, # the array's outputs for the pass in flight, all of C when it fits in one pass
+        "result": result,         # C accumulated over every finished pass
+        "stats": stats,
+        "dataflow": dataflow,
+        "tiler": tiler,
+    }
 
-    mac_accums = [[sim.reg(0) for _ in range(N)] for _ in range(N)]
+    return sim, outputs
 
-    a_in_feeders = [sim.reg(0) for _ in range(N)]
-    b_in_feeders = [sim.reg(0) for _ in range(N)]
+def add_output_stationary(sim, count, matrix_a, matrix_b, rows, cols, depth, stats):
+    a_feeders = [[sim.reg(0) for _ in range(cols)] for _ in range(rows)]
+    b_feeders = [[sim.reg(0) for _ in range(cols)] for _ in range(rows)]
 
-    for i in range(N):
-        sim.add(feed_a_row(count, i, matrix_a, a_in_feeders[i], N))
-        sim.add(feed_b_col(count, i, matrix_b, b_in_feeders[i], N))
+    mac_accums = [[sim.reg(0) for _ in range(cols)] for _ in range(rows)]
+
+    a_in_feeders = [sim.reg(0) for _ in range(rows)]
+    b_in_feeders = [sim.reg(0) for _ in range(cols)]
+
+    for i in range(rows):
+        sim.add(feed_a_row(count, i, matrix_a, a_in_feeders[i], depth, stats))
+    for j in range(cols):
+        sim.add(feed_b_col(count, j, matrix_b, b_in_feeders[j], depth, stats))
     
     def get_a_in(i, j):
         if j == 0:
@@ -30,7 +93,7 @@ def gen_systolic(matrix_a, matrix_b):
         return a_feeders[i][j-1]
     
     def get_a_out(i, j):
-        if j == N - 1:
+        if j == cols - 1:
             return sim.reg(0)
         return a_feeders[i][j]
 
@@ -40,12 +103,12 @@ def gen_systolic(matrix_a, matrix_b):
         return b_feeders[i-1][j]
     
     def get_b_out(i, j):
-        if i == N - 1:
+        if i == rows - 1:
             return sim.reg(0)
         return b_feeders[i][j]
     
-    for i in range(N):
-        for j in range(N):
+    for i in range(rows):
+        for j in range(cols):
             sim.add(mac(
                 get_a_in(i, j),
                 get_b_in(i, j),
@@ -54,7 +117,105 @@ def gen_systolic(matrix_a, matrix_b):
                 get_b_out(i, j)
             ))
     
-    return sim, mac_accums
+    return mac_accums
+
+def add_stationary(sim, count, stream_count, weights, stream, rows, cols, depth, stats, w_name, x_name):
+    # PE (k, j) keeps weights[k][j], stream[r][k] enters row k skewed by k and the
+    # partial sum for stream row r reaches the bottom of column j with sum_k stream[r][k] * weights[k][j]
+    w_in_feeders = [sim.reg(0) for _ in range(cols)]
+    weights_held = [[sim.reg(0) for _ in range(cols)] for _ in range(rows)]
+
+    x_in_feeders = [sim.reg(0) for _ in range(rows)]
+    x_feeders = [[sim.reg(0) for _ in range(cols)] for _ in range(rows)]
+    psums = [[sim.reg(0) for _ in range(cols)] for _ in range(rows)]
+    zero = sim.reg(0)
+
+    outs = [[sim.reg(0) for _ in range(cols)] for _ in range(depth)]
+
+    for j in range(cols):
+        sim.add(feed_weight(count, j, weights, w_in_feeders[j], rows, stats, w_name))
+    for k in range(rows):
+        # stream[r][k] on stream step r + k, the same skew a B column gets in the os grid
+        sim.add(feed_b_col(stream_count, k, stream, x_in_feeders[k], depth, stats, x_name))
+
+    for k in range(rows):
+        for j in range(cols):
+            sim.add(preload(count, w_in_feeders[j] if k == 0 else weights_held[k-1][j], weights_held[k][j], rows))
+            sim.add(mac_stationary(
+                x_in_feeders[k] if j == 0 else x_feeders[k][j-1],
+                zero if k == 0 else psums[k-1][j],
+                weights_held[k][j],
+                x_feeders[k][j],
+                psums[k][j]
+            ))
+
+    for j in range(cols):
+        sim.add(drain_col(stream_count, j, psums[rows-1][j], [outs[r][j] for r in range(depth)], rows, depth, stats))
+
+    return outs
+
+def gen_systolic_stream(pairs, rows, cols):
+    # os only: the next problem's wavefront follows the previous one's K cycles later, results
+    # land in outputs["results"] as (problem id, C) once every PE has drained its share
+    sim = Sim()
+
+    count = sim.reg(0)
+    sim.add(counter(count))
+
+    source = StreamSource(pairs, rows, cols)
+    collector = StreamCollector(rows, cols, count, source)
+    sim.add(stream_fetch(count, source))
+
+    a_regs = [[sim.reg(0) for _ in range(cols + 1)] for _ in range(rows)]
+    flag_regs = [[sim.reg(False) for _ in range(cols + 1)] for _ in range(rows)]
+    b_regs = [[sim.reg(0) for _ in range(cols)] for _ in range(rows + 1)]
+    sums = [[sim.reg(0) for _ in range(cols)] for _ in range(rows)]
+
+    for i in range(rows):
+        sim.add(stream_a_row(count, i, source, a_regs[i][0], flag_regs[i][0]))
+    for j in range(cols):
+        sim.add(stream_b_col(count, j, source, b_regs[0][j]))
+
+    for i in range(rows):
+        for j in range(cols):
+            sim.add(mac_stream(
+                a_regs[i][j], b_regs[i][j], flag_regs[i][j], sums[i][j],
+                a_regs[i][j + 1], b_regs[i + 1][j], flag_regs[i][j + 1], i, j, collector
+            ))
+
+    outputs = {
+        "mac_accums": sums,
+        "results": collector.results,
+        "source": source,
+        "collector": collector,
+        "dataflow": "os",
+    }
+    return sim, outputs
+
+def run_stream(sim, outputs, max_cycles=1000000):
+    source, collector = outputs["source"], outputs["collector"]
+    while not (source.exhausted and len(collector.results) == source.count):
+        if sim.cycle >= max_cycles:
+            raise RuntimeError(f"Stream did not drain within {max_cycles} cycles")
+        sim.step()
+    return collector.stats()
+
+def compare_engines(matrix_a, matrix_b, cycles=None, engine="numpy"):
+    # steps both engines together, returns the first (cycle, i, j, pe, other) that differs or None
+    N = len(matrix_a)
+    pe_sim, pe_outputs = gen_systolic(matrix_a, matrix_b, "pe")
+    np_sim, np_outputs = gen_systolic(matrix_a, matrix_b, engine)
+    pe_accums = pe_outputs["mac_accums"]
+    np_accums = np_outputs["mac_accums"]
+
+    for cycle in range(cycles if cycles is not None else 3 * N):
+        pe_sim.step()
+        np_sim.step()
+        for i in range(N):
+            for j in range(N):
+                if pe_accums[i][j].val != np_accums[i][j].val:
+                    return cycle, i, j, pe_accums[i][j].val, np_accums[i][j].val
+    return None
 
 if __name__ == "__main__":
     N = 4
@@ -73,7 +234,8 @@ if __name__ == "__main__":
         [13, 14, 15, 16]
     ]
 
-    sim, mac_accums = gen_systolic(matrix_a, matrix_b)
+    sim, outputs = gen_systolic(matrix_a, matrix_b)
+    mac_accums = outputs["mac_accums"]
 
     for i in range(3 * N):
         sim.run(1)
@@ -101,4 +263,42 @@ if __name__ == "__main__":
     #     row = []
     #     for j in range(N):
     #         row.append(mac_accums[i][j].val)
-    #     print(row)
\ No newline at end of file
+    #     print(row)
+
+    print(f"\nnumpy engine matches per-PE model: {compare_engines(matrix_a, matrix_b) is None}")
+
+    fast_sim, fast_outputs = gen_systolic(matrix_a, matrix_b, "fast")
+    fast_sim.run(systolic_cycles(N))
+    print(f"fast engine after {systolic_cycles(N)} cycles matches: {[[c.val for c in row] for row in fast_outputs['mac_accums']] == [[c.val for c in row] for row in mac_accums]}")
+
+    expected = [[sum(matrix_a[i][k] * matrix_b[k][j] for k in range(N)) for j in range(N)] for i in range(N)]
+    print()
+    for dataflow in DATAFLOWS:
+        df_sim, df_outputs = gen_systolic(matrix_a, matrix_b, dataflow=dataflow)
+        df_sim.run(systolic_cycles(N, dataflow))
+        result = [[c.val for c in row] for row in df_outputs["mac_accums"]]
+        print(f"{dataflow}: correct {result == expected}, {df_outputs['stats'].val.stats()}")
+
+    # a 6x5 @ 5x7 problem on a fixed 4x3 array
+    M, K, N = 6, 5, 7
+    tiled_a = [[(i + k) % 5 - 2 for k in range(K)] for i in range(M)]
+    tiled_b = [[(k * j) % 7 - 3 for j in range(N)] for k in range(K)]
+    tiled_expected = [[sum(tiled_a[i][k] * tiled_b[k][j] for k in range(K)) for j in range(N)] for i in range(M)]
+    print()
+    for dataflow in DATAFLOWS:
+        t_sim, t_outputs = gen_systolic(tiled_a, tiled_b, dataflow=dataflow, rows=4, cols=3)
+        t_sim.run(t_outputs["stats"].val.schedule)
+        st = t_outputs["stats"].val
+        print(f"{dataflow} on 4x3: correct {t_outputs['result'].val == tiled_expected}, {st.stats()}")
+        for t in st.tiles:
+            print(f"    tile m0={t['m0']} n0={t['n0']} k0={t['k0']}: {t['cycles']} cycles, {t['macs']} macs, utilization {t['utilization']:.3f}")
+
+    # back to back problems through a 4x4 array
+    rng_a = [[[(p + i * k) % 7 - 3 for k in range(5)] for i in range(4)] for p in range(8)]
+    rng_b = [[[(p * j + k) % 5 - 2 for j in range(4)] for k in range(5)] for p in range(8)]
+    s_sim, s_outputs = gen_systolic_stream(zip(rng_a, rng_b), 4, 4)
+    s_stats = run_stream(s_sim, s_outputs)
+    s_expected = [[[sum(a[i][k] * b[k][j] for k in range(5)) for j in range(4)] for i in range(4)] for a, b in zip(rng_a, rng_b)]
+    print()
+    print(f"stream of 8: correct {[c for _, c in s_outputs['results']] == s_expected}, {s_stats}")
+    print(f"    one at a time: {8 * tile_cycles(4, 4, 5, 'os')} cycles")
@@ -0,0 +1,171 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from sim import *
+from systolic_tasks import counter, count_cycles, tile_cycles, tile_count, stream_depth, SystolicStats
+
+# === Vectorized Engine ===
+
+# The whole grid lives in three arrays held in Regs:
+#   a[i, j]   - the A operand PE (i, j) sees this cycle (column 0 is the row feeder)
+#   b[i, j]   - the B operand PE (i, j) sees this cycle (row 0 is the column feeder)
+#   acc[i, j] - the accumulator
+# so one cycle is a shift of each operand array plus one multiply-add, with the same
+# register timing as the per-PE mac grid.
+
+def skew_a(matrix_a):
+    # stream[c, i] is what feed_a_row(i) drives on cycle c
+    M, K = matrix_a.shape
+    stream = np.zeros((M + K - 1, M), dtype=matrix_a.dtype)
+    for i in range(M):
+        stream[i:i + K, i] = matrix_a[i, :]
+    return stream
+
+def skew_b(matrix_b):
+    K, N = matrix_b.shape
+    stream = np.zeros((N + K - 1, N), dtype=matrix_b.dtype)
+    for j in range(N):
+        stream[j:j + K, j] = matrix_b[:, j]
+    return stream
+
+class CellView:
+    # stands in for a PE's accumulator Reg so callers can keep reading mac_accums[i][j].val
+    def __init__(self, reg, i, j):
+        self.reg = reg
+        self.i = i
+        self.j = j
+
+    @property
+    def val(self):
+        return self.reg.val[self.i, self.j].item()
+
+    def __repr__(self):
+        return f"Reg({self.val})"
+
+@task
+def systolic_step(count, a_stream, b_stream, a, b, acc):
+    c = count.val
+    rows, cols = acc.val.shape
+
+    acc.next = acc.val + a.val * b.val
+
+    a_next = np.empty_like(a.val)
+    a_next[:, 1:] = a.val[:, :-1]
+    a_next[:, 0] = a_stream[c] if c < len(a_stream) else np.zeros(rows, dtype=a.val.dtype)
+    a.next = a_next
+
+    b_next = np.empty_like(b.val)
+    b_next[1:, :] = b.val[:-1, :]
+    b_next[0, :] = b_stream[c] if c < len(b_stream) else np.zeros(cols, dtype=b.val.dtype)
+    b.next = b_next
+
+@task
+def publish(count, acc, result, done_cycle):
+    if count.val == done_cycle:
+        result.next = acc.next.tolist()
+
+def gen_systolic_np(matrix_a, matrix_b):
+    sim = Sim()
+
+    matrix_a = np.asarray(matrix_a)
+    matrix_b = np.asarray(matrix_b)
+    dtype = np.result_type(matrix_a, matrix_b, np.int64)
+    M, K = matrix_a.shape
+    N = matrix_b.shape[1]
+
+    count = sim.reg(0)
+    sim.add(counter(count))
+
+    # every .next is a fresh array so Reg.reset() still restores the zero state
+    a = sim.reg(np.zeros((M, N), dtype=dtype))
+    b = sim.reg(np.zeros((M, N), dtype=dtype))
+    acc = sim.reg(np.zeros((M, N), dtype=dtype))
+
+    sim.add(systolic_step(count, skew_a(matrix_a.astype(dtype)), skew_b(matrix_b.astype(dtype)), a, b, acc))
+
+    result = sim.reg([[0] * N for _ in range(M)])
+    sim.add(publish(count, acc, result, tile_cycles(M, N, K, "os") - 1))
+
+    outputs = {
+        "mac_accums": [[CellView(acc, i, j) for j in range(N)] for i in range(M)],
+        "result": result,
+        "stats": schedule_stats(sim, "os", M, K, N, M, N),
+        "dataflow": "os",
+    }
+    return sim, outputs
+
+# === Closed Form ===
+
+@task
+def systolic_fast(count, product, acc, done_cycle):
+    # nothing moves until the step the real schedule produces its last output, then the product appears at once
+    if count.val == done_cycle:
+        acc.next = product
+
+def gen_systolic_fast(matrix_a, matrix_b, dataflow="os", rows=None, cols=None):
+    sim = Sim()
+
+    matrix_a = np.asarray(matrix_a)
+    matrix_b = np.asarray(matrix_b)
+    dtype = np.result_type(matrix_a, matrix_b, np.int64)
+    M, K = matrix_a.shape
+    N = matrix_b.shape[1]
+
+    count = sim.reg(0)
+    sim.add(counter(count))
+
+    stats = schedule_stats(sim, dataflow, M, K, N, rows, cols)
+    done_cycle = stats.val.schedule - 1
+
+    acc = sim.reg(np.zeros((M, N), dtype=dtype))
+    sim.add(systolic_fast(count, matrix_a.astype(dtype) @ matrix_b.astype(dtype), acc, done_cycle))
+
+    result = sim.reg([[0] * N for _ in range(M)])
+    sim.add(publish(count, acc, result, done_cycle))
+
+    outputs = {
+        "mac_accums": [[CellView(acc, i, j) for j in range(N)] for i in range(M)],
+        "result": result,
+        "stats": stats,
+        "dataflow": dataflow,
+    }
+    return sim, outputs
+
+def schedule_stats(sim, dataflow, M, K, N, rows, cols):
+    # loads, drains and tile records are the schedule totals up front, only the cycle count runs live
+    depth = stream_depth(M, K, N, dataflow)
+    tiles = tile_count(M, K, N, rows, cols, dataflow)
+    cycles = tile_cycles(rows, cols, depth, dataflow)
+
+    stats = sim.reg(SystolicStats(dataflow, rows, cols, M * N * K, tiles * cycles))
+    st = stats.val
+    if dataflow == "os":
+        st.loads = {"a": tiles * rows * depth, "b": tiles * cols * depth}
+        st.drains = tiles * rows * cols
+    else:
+        w_name, x_name = ("b", "a") if dataflow == "ws" else ("a", "b")
+        st.loads = {w_name: tiles * rows * cols, x_name: tiles * depth * rows}
+        st.drains = tiles * depth * cols
+
+    # the same visiting order as plan_tiles
+    outer, inner = {"os": ((M, rows), (N, cols)), "ws": ((N, cols), (K, rows)), "is": ((M, cols), (K, rows))}[dataflow]
+    for o0 in range(0, outer[0], outer[1]):
+        for i0 in range(0, inner[0], inner[1]):
+            if dataflow == "os":
+                m0, n0, k0, macs = o0, i0, 0, min(rows, M - o0) * min(cols, N - i0) * K
+            elif dataflow == "ws":
+                m0, n0, k0, macs = 0, o0, i0, M * min(cols, N - o0) * min(rows, K - i0)
+            else:
+                m0, n0, k0, macs = o0, 0, i0, N * min(cols, M - o0) * min(rows, K - i0)
+            st.tiles.append({
+                "m0": m0, "n0": n0, "k0": k0,
+                "cycles": cycles,
+                "macs": macs,
+                "utilization": macs / (rows * cols * cycles),
+            })
+
+    sim.add(count_cycles(stats))
+    return stats
@@ -4,6 +4,160 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sim import *
 
+# === Dataflows ===
+
+# os: A streams right, B streams down, C accumulates in place (the original grid)
+# ws: B is preloaded into the PEs, A streams right, partial sums flow down and drain out the bottom
+# is: A is preloaded (transposed), B streams, same grid as ws with the output transposed
+DATAFLOWS = ["os", "ws", "is"]
+
+def tile_cycles(rows, cols, depth, dataflow="os"):
+    # steps until the last output of one pass through a rows x cols array is final,
+    # depth is the length of the streamed operand (K for os, M for ws, N for is)
+    if dataflow == "os":
+        # A[i][k] and B[k][j] meet in PE (i, j) on step i + j + k + 1
+        return rows + cols + depth - 1
+    # rows + 1 preload steps, then stream row r leaves the bottom of column j on stream step rows + 1 + j + r
+    return 2 * rows + cols + depth + 1
+
+def systolic_cycles(N, dataflow="os"):
+    return tile_cycles(N, N, N, dataflow)
+
+class SystolicStats:
+    def __init__(self, dataflow, rows, cols, macs, schedule):
+        self.dataflow = dataflow
+        self.rows = rows
+        self.cols = cols
+        self.macs = macs               # useful multiply-adds, padding not included
+        self.schedule = schedule       # cycles the whole schedule takes
+        self.loads = {"a": 0, "b": 0}  # operand elements fed into the array, padding included
+        self.drains = 0                # results read out of the array
+        self.cycles = 0
+        self.tiles = []                # one record per pass through the array
+
+    def copy(self):
+        new = SystolicStats(self.dataflow, self.rows, self.cols, self.macs, self.schedule)
+        new.loads = dict(self.loads)
+        new.drains = self.drains
+        new.cycles = self.cycles
+        new.tiles = list(self.tiles)
+        return new
+
+    def stats(self):
+        busy = self.rows * self.cols * self.cycles
+        return {
+            "dataflow": self.dataflow,
+            "array": (self.rows, self.cols),
+            "cycles": self.cycles,
+            "tiles": len(self.tiles),
+            "macs": self.macs,
+            "loads": dict(self.loads),
+            "drains": self.drains,
+            "utilization": self.macs / busy if busy else 0.0,
+        }
+
+def writable(reg):
+    # the counters are bumped in place, so they must not be the reset value
+    if reg.val is reg.init:
+        reg.val = reg.init.copy()
+        reg.next = reg.val
+    return reg.val
+
+# === Tiling ===
+
+def pad(matrix, rows, cols):
+    out = [[0] * cols for _ in range(rows)]
+    for r in range(min(rows, len(matrix))):
+        for c in range(min(cols, len(matrix[r]))):
+            out[r][c] = matrix[r][c]
+    return out
+
+def plan_tiles(matrix_a, matrix_b, rows, cols, dataflow):
+    # every tile is zero padded to the full array, m/n/k are the real extents
+    M, K, N = len(matrix_a), len(matrix_b), len(matrix_b[0])
+    tiles = []
+
+    if dataflow == "os":
+        # each pass owns a rows x cols block of C and streams all of K
+        for m0 in range(0, M, rows):
+            for n0 in range(0, N, cols):
+                tiles.append({
+                    "m0": m0, "n0": n0, "k0": 0,
+                    "m": min(rows, M - m0), "n": min(cols, N - n0), "k": K,
+                    "a": pad(matrix_a[m0:m0 + rows], rows, K),
+                    "b": pad([row[n0:n0 + cols] for row in matrix_b], K, cols),
+                })
+    elif dataflow == "ws":
+        # B[k0.., n0..] sits in the array, all M rows of A[:, k0..] stream through, K tiles accumulate
+        for n0 in range(0, N, cols):
+            for k0 in range(0, K, rows):
+                tiles.append({
+                    "m0": 0, "n0": n0, "k0": k0,
+                    "m": M, "n": min(cols, N - n0), "k": min(rows, K - k0),
+                    "w": pad([row[n0:n0 + cols] for row in matrix_b[k0:k0 + rows]], rows, cols),
+                    "x": pad([row[k0:k0 + rows] for row in matrix_a], M, rows),
+                })
+    else:
+        # A^T[k0.., m0..] sits in the array, all N columns of B[k0.., :] stream through
+        for m0 in range(0, M, cols):
+            for k0 in range(0, K, rows):
+                tiles.append({
+                    "m0": m0, "n0": 0, "k0": k0,
+                    "m": min(cols, M - m0), "n": N, "k": min(rows, K - k0),
+                    "w": pad([[matrix_a[i][k] for i in range(m0, min(m0 + cols, M))] for k in range(k0, min(k0 + rows, K))], rows, cols),
+                    "x": pad([[matrix_b[k][j] for k in range(k0, min(k0 + rows, K))] for j in range(N)], N, rows),
+                })
+
+    for t in tiles:
+        t["cycles"] = tile_cycles(rows, cols, stream_depth(M, K, N, dataflow), dataflow)
+    return tiles
+
+def stream_depth(M, K, N, dataflow):
+    return {"os": K, "ws": M, "is": N}[dataflow]
+
+def default_array(M, K, N, dataflow):
+    # the array that fits the whole problem in one pass
+    return {"os": (M, N), "ws": (K, N), "is": (K, M)}[dataflow]
+
+def tile_count(M, K, N, rows, cols, dataflow):
+    ceil = lambda a, b: -(-a // b)
+    if dataflow == "os":
+        return ceil(M, rows) * ceil(N, cols)
+    if dataflow == "ws":
+        return ceil(K, rows) * ceil(N, cols)
+    return ceil(K, rows) * ceil(M, cols)
+
+class Tiler:
+    def __init__(self, tiles, dataflow, rows, cols, M, N, step):
+        self.tiles = tiles
+        self.dataflow = dataflow
+        self.rows = rows
+        self.cols = cols
+        self.M = M
+        self.N = N
+        self.step = step # Reg, passes finished so far, so Sim.reset() rewinds the schedule
+
+    @property
+    def index(self):
+        return min(self.step.val, len(self.tiles) - 1)
+
+    @property
+    def done(self):
+        return self.step.val == len(self.tiles)
+
+    @property
+    def current(self):
+        return self.tiles[self.index]
+
+class TileOperand:
+    # what the feeders index as a matrix, always the operand of the tile in flight
+    def __init__(self, tiler, name):
+        self.tiler = tiler
+        self.name = name
+
+    def __getitem__(self, r):
+        return self.tiler.current[self.name][r]
+
 @task
 def mac(a_in, b_in, sum, a_out, b_out):
     sum.next = sum.val + a_in.val * b_in.val
@@ -11,21 +165,228 @@ def mac(a_in, b_in, sum, a_out, b_out):
     b_out.next = b_in.val
 
 @task
-def feed_a_row(cycle, row_idx, matrix_a, a_out, N):
+def feed_a_row(cycle, row_idx, matrix_a, a_out, N, stats=None, operand="a"):
     if cycle.val >= row_idx and cycle.val < row_idx + N:
         col = cycle.val - row_idx
         a_out.next = matrix_a[row_idx][col]
+        if stats is not None:
+            writable(stats).loads[operand] += 1
     else:
         a_out.next = 0
 
 @task
-def feed_b_col(cycle, col_idx, matrix_b, b_out, N):
+def feed_b_col(cycle, col_idx, matrix_b, b_out, N, stats=None, operand="b"):
     if cycle.val >= col_idx and cycle.val < col_idx + N:
         row = cycle.val - col_idx
         b_out.next = matrix_b[row][col_idx]
+        if stats is not None:
+            writable(stats).loads[operand] += 1
     else:
         b_out.next = 0
 
 @task
 def counter(cycle):
-    cycle.next = cycle.val + 1
\ No newline at end of file
+    cycle.next = cycle.val + 1
+
+@task
+def count_cycles(stats):
+    st = writable(stats)
+    if st.cycles < st.schedule:
+        st.cycles += 1
+
+@task
+def sequence(count, stream_count, tiler, outs, result, stats):
+    # added after the grid, so on a tile's last step outs[..].next already holds its final outputs
+    t = tiler.current
+    if tiler.done or count.val < t["cycles"] - 1:
+        return
+
+    new_result = [row.copy() for row in result.val]
+    if tiler.dataflow == "os":
+        # os results are read straight out of the accumulators
+        for i in range(t["m"]):
+            for j in range(t["n"]):
+                new_result[t["m0"] + i][t["n0"] + j] = outs[i][j].next
+        writable(stats).drains += tiler.rows * tiler.cols
+    elif tiler.dataflow == "ws":
+        for r in range(tiler.M):
+            for j in range(t["n"]):
+                new_result[r][t["n0"] + j] += outs[r][j].next
+    else:
+        for r in range(tiler.N):
+            for i in range(t["m"]):
+                new_result[t["m0"] + i][r] += outs[r][i].next
+    result.next = new_result
+
+    macs = t["m"] * t["n"] * t["k"]
+    writable(stats).tiles.append({
+        "m0": t["m0"], "n0": t["n0"], "k0": t["k0"],
+        "cycles": t["cycles"],
+        "macs": macs,
+        "utilization": macs / (tiler.rows * tiler.cols * t["cycles"]),
+    })
+
+    tiler.step.next = tiler.step.val + 1
+    if tiler.step.next == len(tiler.tiles):
+        return
+
+    # next pass: restart the local clocks, the os accumulators start from zero again
+    count.next = 0
+    stream_count.next = -(tiler.rows + 1)
+    if tiler.dataflow == "os":
+        for row in outs:
+            for acc in row:
+                acc.next = 0
+
+# === Stationary Grid ===
+
+@task
+def feed_weight(cycle, col_idx, weights, w_out, rows, stats=None, operand="b"):
+    # the preload shifts rows in from the top, the bottom row goes first
+    if cycle.val < rows:
+        w_out.next = weights[rows - 1 - cycle.val][col_idx]
+        if stats is not None:
+            writable(stats).loads[operand] += 1
+    else:
+        w_out.next = 0
+
+@task
+def preload(cycle, w_in, w, rows):
+    if cycle.val <= rows:
+        w.next = w_in.val
+
+@task
+def mac_stationary(x_in, psum_in, w, x_out, psum_out):
+    psum_out.next = psum_in.val + x_in.val * w.val
+    x_out.next = x_in.val
+
+@task
+def drain_col(cycle, col_idx, psum, outs, rows, depth, stats=None):
+    # stream row r leaves the bottom of column col_idx rows + 1 + col_idx steps after it entered
+    r = cycle.val - rows - 1 - col_idx
+    if 0 <= r < depth:
+        outs[r].next = psum.val
+        if stats is not None:
+            writable(stats).drains += 1
+
+# === Streaming ===
+
+# Back to back os problems: problem p starts injecting on stream step start_p = start_{p-1} + K_{p-1},
+# while p - 1 is still in flight. A drain flag rides along with the first A element of every problem
+# after the first one, and when it reaches a PE that PE's accumulator holds its finished share of the
+# previous problem. A last flag-only wavefront flushes the final problem.
+
+class StreamSource:
+    def __init__(self, pairs, rows, cols):
+        self.it = iter(pairs)
+        self.rows = rows
+        self.cols = cols
+        self.active = []  # problems whose wavefront is still being injected
+        self.shapes = []  # (M, N) of every problem pulled so far
+        self.count = 0
+        self.next_start = 0
+        self.exhausted = False
+        self.flush_at = None
+        self.last_inject = 0
+
+    def fetch(self, t):
+        if self.exhausted or t != self.next_start:
+            return
+        try:
+            a, b = next(self.it)
+        except StopIteration:
+            self.exhausted = True
+            self.flush_at = t
+            return
+
+        # an empty problem would never move next_start on, so it is a shape error like any other
+        K = len(b)
+        N = len(b[0]) if b else 0
+        if not a or K == 0 or N == 0 or len(a) > self.rows or N > self.cols or any(len(row) != K for row in a):
+            raise RuntimeError(f"Problem {self.count} is {len(a)}x{K} @ {K}x{N}, the array is {self.rows}x{self.cols}")
+        self.active.append({"id": self.count, "start": t, "k": K, "a": pad(a, self.rows, K), "b": pad(b, K, self.cols)})
+        self.shapes.append((len(a), len(b[0])))
+        self.count += 1
+        self.next_start = t + K
+        # the last feeder (largest skew) finishes injecting this problem here
+        self.last_inject = t + K - 1 + max(self.rows, self.cols) - 1
+
+        # drop problems every feeder is done with
+        edge = t - max(self.rows, self.cols)
+        self.active = [p for p in self.active if p["start"] + p["k"] > edge]
+
+    def lookup(self, t):
+        for p in self.active:
+            if p["start"] <= t < p["start"] + p["k"]:
+                return p
+        return None
+
+class StreamCollector:
+    def __init__(self, rows, cols, cycle, source):
+        self.source = source
+        self.rows = rows
+        self.cols = cols
+        self.cycle = cycle
+        self.drained = [[0] * cols for _ in range(rows)]  # how many problems each PE has handed out
+        self.pending = {}
+        self.results = []    # (problem id, C) in completion order
+        self.completed = []  # cycle each problem finished draining
+
+    def drain(self, i, j, val):
+        p = self.drained[i][j]
+        self.drained[i][j] += 1
+        entry = self.pending.setdefault(p, [[[0] * self.cols for _ in range(self.rows)], 0])
+        entry[0][i][j] = val
+        entry[1] += 1
+        if entry[1] == self.rows * self.cols:
+            M, N = self.source.shapes[p]
+            self.results.append((p, [row[:N] for row in entry[0][:M]]))
+            self.completed.append(self.cycle.val)
+            del self.pending[p]
+
+    def stats(self):
+        source = self.source
+        n = len(self.results)
+        s = {"problems": n, "cycles": self.completed[-1] + 1 if n else 0}
+        if n:
+            # fill: until the first product is out, drain: from the last injection to the last product
+            s["fill_cycles"] = self.completed[0] + 1
+            s["drain_cycles"] = self.completed[-1] - source.last_inject
+        if n > 1:
+            s["steady_products_per_cycle"] = (n - 1) / (self.completed[-1] - self.completed[0])
+        return s
+
+@task
+def stream_fetch(cycle, source):
+    source.fetch(cycle.val)
+
+@task
+def stream_a_row(cycle, row_idx, source, a_out, flag_out):
+    t = cycle.val - row_idx
+    p = source.lookup(t)
+    if p is not None:
+        a_out.next = p["a"][row_idx][t - p["start"]]
+        flag_out.next = t == p["start"] and p["id"] > 0
+    else:
+        a_out.next = 0
+        flag_out.next = t == source.flush_at
+
+@task
+def stream_b_col(cycle, col_idx, source, b_out):
+    t = cycle.val - col_idx
+    p = source.lookup(t)
+    if p is not None:
+        b_out.next = p["b"][t - p["start"]][col_idx]
+    else:
+        b_out.next = 0
+
+@task
+def mac_stream(a_in, b_in, flag_in, sum, a_out, b_out, flag_out, i, j, collector):
+    if flag_in.val:
+        collector.drain(i, j, sum.val)
+        sum.next = a_in.val * b_in.val
+    else:
+        sum.next = sum.val + a_in.val * b_in.val
+    a_out.next = a_in.val
+    b_out.next = b_in.val
+    flag_out.next = flag_in.val
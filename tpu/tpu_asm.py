@@ -0,0 +1,140 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tpu_tasks import *
+
+# === Assembler ===
+
+# Text programs are one instruction per line, operands split by spaces or commas and
+# anything after a '#' ignored:
+#
+#   mnk 64, 64, 64
+#   tile 16
+#   gemm
+#   halt
+#
+# abase/bbase/cbase take a base address and a leading dimension (row stride) and go after
+# mnk, which packs A, B and C from abase. bgemm takes the count, then how far A, B and C
+# move between problems. The tuple programs gemm_program() and friends build go through
+# the same path.
+#
+# The epilogue on the C store path is set up by
+#
+#   bias 1, 4096        # add mem[4096 + n] to column n, bias 0, 0 turns it off
+#   relu 1
+#   clamp 1, -128, 127  # clamp 0, 0, 0 turns it off
+#   scale 8, 181        # multiply by 181, then a rounding shift right by 8
+#
+# and stays that way for every gemm after it.
+#
+# A convolution reads its input in place instead of from an im2col copy:
+#
+#   abase 0, 0          # the input tensor
+#   bbase 512, 16       # weights as a K x C_out matrix
+#   cbase 1664, 16      # output rows are pixels, columns channels
+#   ifmap 8, 8, 8, 1    # C, H, W, batch
+#   kernel 16, 3, 3     # C_out, KH, KW
+#   conv2d nhwc, 1, 1, 1  # layout, stride, pad, dilation
+#
+# zmap 1, a_map, b_map points at occupancy maps of A and B, one bit per tile, and tiles
+# either map marks empty are neither loaded nor multiplied. zmap 0, 0, 0 turns them off.
+
+class AsmError(RuntimeError):
+    pass
+
+def parse_line(line):
+    line = line.split("#", 1)[0].replace(",", " ").split()
+    return tuple(line) if line else None
+
+def operand(a):
+    if not isinstance(a, str):
+        return int(a)
+    if a.lower() in LAYOUTS:
+        return LAYOUTS.index(a.lower())
+    return int(a, 0)
+
+def assemble_op(instr):
+    name = str(instr[0]).lower()
+    try:
+        kind = OpKind[name.upper()]
+    except KeyError:
+        raise AsmError(f"unknown instruction {name}") from None
+
+    if len(instr) - 1 != OP_ARGS[kind]:
+        raise AsmError(f"{name} takes {OP_ARGS[kind]} operands, got {len(instr) - 1}")
+    try:
+        args = [operand(a) for a in instr[1:]]
+    except ValueError as e:
+        raise AsmError(f"{name}: {e}") from None
+
+    try:
+        return encode_instr(TpuOp(kind, *args))
+    except RuntimeError as e:
+        raise AsmError(str(e)) from None
+
+def assemble(program):
+    # text or a list of tuples in, a flat list of instruction words out
+    if isinstance(program, str):
+        lines = [(n, parse_line(l)) for n, l in enumerate(program.splitlines(), 1)]
+    else:
+        lines = [(n, tuple(instr)) for n, instr in enumerate(program, 1)]
+
+    words = []
+    for lineno, instr in lines:
+        if not instr:
+            continue
+        try:
+            words += assemble_op(instr)
+        except AsmError as e:
+            raise AsmError(f"Line {lineno}: {e}") from None
+    return words
+
+def disassemble(words):
+    if len(words) % INSTR_WORDS:
+        raise AsmError(f"{len(words)} words is not a whole number of {INSTR_WORDS}-word instructions")
+    lines = []
+    for i in range(0, len(words), INSTR_WORDS):
+        op = decode_instr(words[i:i + INSTR_WORDS])
+        args = [op.arg0, op.arg1, op.arg2, op.arg3][:OP_ARGS[op.kind]]
+        lines.append(" ".join([op.kind.name.lower(), ", ".join(str(a) for a in args)]).strip())
+    return "\n".join(lines)
+
+def is_assembled(program):
+    return isinstance(program, list) and all(isinstance(w, int) for w in program)
+
+def program_image(program, mem_size):
+    # the program goes at the top of mem so operands can keep starting at address 0,
+    # returns (mem, base, instruction count)
+    words = program if is_assembled(program) else assemble(program)
+    if len(words) % INSTR_WORDS:
+        raise AsmError(f"{len(words)} words is not a whole number of {INSTR_WORDS}-word instructions")
+    base = mem_size - len(words)
+    if base < 0:
+        raise AsmError(f"program needs {len(words)} words, mem only has {mem_size}")
+
+    mem = [0] * mem_size
+    mem[base:] = words
+    return mem, base, len(words) // INSTR_WORDS
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Assemble a TPU program into instruction words")
+    parser.add_argument("source")
+    parser.add_argument("-o", "--output")
+    parser.add_argument("-d", "--disassemble", action="store_true", help="source is a word file, print it as text")
+    args = parser.parse_args()
+
+    with open(args.source) as f:
+        text = f.read()
+
+    if args.disassemble:
+        print(disassemble([int(w, 16) for w in text.split()]))
+    else:
+        words = assemble(text)
+        out = args.output or os.path.splitext(args.source)[0] + ".tpu"
+        with open(out, "w") as f:
+            for w in words:
+                f.write(f"{w:08x}\n")
+        print(f"Wrote {out}, {len(words) // INSTR_WORDS} instructions")
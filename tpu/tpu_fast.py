@@ -0,0 +1,537 @@
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from sim import *
+from tpu_tasks import *
+from tpu_asm import program_image
+
+# === Cycle Model ===
+
+# Cycle counts straight from the controller's state sequence. Every DMA walks a full
+# T x T tile: one cycle to program it, one cycle per burst, one cycle to see done.
+
+def dma_cycles(T, bandwidth=1):
+    return dma_beats(T, bandwidth) + 2
+
+def exec_cycles(T, dataflow="os"):
+    # s_cycle runs from 0 to the cycle the last result lands on
+    return exec_last_cycle(dataflow, T) + 1
+
+def ceil_div(a, b):
+    return -(-a // b)
+
+def gemm_tiles(M, K, N, T):
+    # the FSM runs INIT before it checks the bounds, so an empty M or N still costs one tile,
+    # and MNXT stops as soon as m0 >= M, so an empty M never moves past the first n tile
+    mt = max(ceil_div(M, T), 1)
+    nt = max(ceil_div(N, T), 1) if M > 0 else 1
+    kt = ceil_div(K, T) if K > 0 else 0
+    return mt, nt, kt
+
+def loads_per_order(order, extents, dims):
+    # how often an operand indexed by `dims` is loaded when the tile loops run in `order`:
+    # inner loops it does not depend on (or that only run once) keep it resident, every
+    # other loop brings in a new tile. Returns (loads, loads of each distinct tile).
+    kept = list(order)
+    while kept and (kept[-1] not in dims or extents[kept[-1]] == 1):
+        kept.pop()
+    loads = reuse = 1
+    for d in kept:
+        loads *= extents[d]
+        if d not in dims:
+            reuse *= extents[d]
+    return loads, reuse
+
+def gemm_schedule(M, K, N, T, order="mnk"):
+    # the same load decisions gemm_steps makes, counted instead of listed
+    mt, nt, kt = gemm_tiles(M, K, N, T)
+    extents = {"m": mt, "n": nt, "k": max(kt, 1)}
+    c_runs, c_reuse = loads_per_order(order, extents, "mn")
+    lda, a_reuse = loads_per_order(order, extents, "mk") if kt else (0, 0)
+    ldb, b_reuse = loads_per_order(order, extents, "kn") if kt else (0, 0)
+    return {
+        "c_runs": c_runs, "lda": lda, "ldb": ldb, "steps": mt * nt * kt,
+        # edge padding never touches mem, an empty M only ever sees the first n tile
+        "reads": M * N * c_reuse + M * K * a_reuse + K * min(N, nt * T) * b_reuse,
+        "writes": M * N * c_reuse,
+        "a_reuse": a_reuse,
+    }
+
+def gemm_cycles(M, K, N, T, dataflow="os", bandwidth=1, order="mnk"):
+    # GEMM op from DEC to the end of its last MNXT, NEXT not included: every C tile visit is
+    # INIT, LDC, LOOP ... STC, MNXT, every step LDA and LDB if needed, EXEC, COMM, KNXT, LOOP
+    sched = gemm_schedule(M, K, N, T, order)
+    dma = dma_cycles(T, bandwidth)
+    return (sched["c_runs"] * (3 + 2 * dma) + sched["steps"] * (exec_cycles(T, dataflow) + 3)
+            + (sched["lda"] + sched["ldb"]) * dma)
+
+def overlap_gemm_cycles(M, K, N, T, dataflow="os", bandwidth=1, order="mnk"):
+    # the double-buffered GEMM, cycles counted from its DEC: the DMA queue is a single FIFO
+    # server that starts a descriptor the cycle after it is queued, EXEC waits for its own tiles
+    beats = dma_beats(T, bandwidth)
+    exec_len = exec_cycles(T, dataflow)
+    steps = gemm_steps(M, K, N, T, order)
+    free = 0
+
+    def enqueue(t, n):
+        # n descriptors queued on cycle t, returns the cycle the last of them finishes
+        nonlocal free
+        free = max(t + 1, free) + n * beats
+        return free - 1
+
+    def loads(st):
+        return int(st["ldc"]) + int(st["lda"]) + int(st["ldb"])
+
+    need = enqueue(1, loads(steps[0])) # PLAN
+    t = 2
+    for s, st in enumerate(steps):
+        t = max(t, need + 1)
+        if st["exec"]:
+            if s + 1 < len(steps):
+                need = enqueue(t, loads(steps[s + 1]))
+            t += 1 + exec_len # EXEC, then COMM
+            if st["stc"]:
+                enqueue(t, 1)
+            t += 1
+        else:
+            enqueue(t, 1)
+            if s + 1 < len(steps):
+                need = enqueue(t, loads(steps[s + 1]))
+            t += 1
+    # the last WAIT, once the queue has drained
+    return max(t, free)
+
+def gemm_program_cycles(M, K, N, T, dataflow="os", bandwidth=1, overlap=False, order="mnk"):
+    # gemm_program(): mnk and tile are IF, DEC, NEXT, the gemm adds IF, DEC and NEXT around
+    # its tiles and the halt stops after its DEC
+    gemm = overlap_gemm_cycles if overlap else gemm_cycles
+    return 3 + 3 + 3 + gemm(M, K, N, T, dataflow, bandwidth, order) + 2
+
+def mac_utilization(M, K, N, T, cycles):
+    # useful MACs over what the T x T grid could have done in that time
+    return M * K * N / (T * T * cycles) if cycles else 0.0
+
+def gemm_traffic(M, K, N, T, bandwidth=1, order="mnk"):
+    # (words read, words written, busy cycles)
+    sched = gemm_schedule(M, K, N, T, order)
+    busy = (2 * sched["c_runs"] + sched["lda"] + sched["ldb"]) * dma_beats(T, bandwidth)
+    return sched["reads"], sched["writes"], busy
+
+# === Fast Model ===
+
+def read_matrix(mem, base, rows, cols, step):
+    out = np.zeros((rows, cols), dtype=mem.dtype)
+    for r in range(rows):
+        start = base + r * step
+        row = mem[start:min(start + cols, len(mem))]
+        out[r, :len(row)] = row
+    return out
+
+def write_matrix(mem, base, val, step):
+    rows, cols = val.shape
+    for r in range(rows):
+        start = base + r * step
+        end = min(start + cols, len(mem))
+        if start < end:
+            mem[start:end] = val[r, :end - start]
+
+def epilogue_matrix(D, bias, e):
+    # epilogue() on a whole C at once
+    D = D + bias
+    if e.relu:
+        D = np.maximum(D, 0)
+    D = D * e.mult
+    if e.shift:
+        D = (D + (1 << (e.shift - 1))) >> e.shift
+    if e.lo is not None:
+        D = np.maximum(D, e.lo)
+    if e.hi is not None:
+        D = np.minimum(D, e.hi)
+    return D
+
+def im2col_addrs(g, mem_len):
+    # ConvGeom.a_addr over the whole A at once, -1 where the LDA reads nothing
+    M, K, _ = g.gemm_shape
+    b, pix = np.divmod(np.arange(M)[:, None], g.OH * g.OW)
+    oh, ow = np.divmod(pix, g.OW)
+    if g.layout == NCHW:
+        c, tap = np.divmod(np.arange(K)[None, :], g.KH * g.KW)
+    else:
+        tap, c = np.divmod(np.arange(K)[None, :], g.C)
+    kh, kw = np.divmod(tap, g.KW)
+    ih = oh * g.stride - g.pad + kh * g.dilation
+    iw = ow * g.stride - g.pad + kw * g.dilation
+    if g.layout == NCHW:
+        addr = g.base + ((b * g.C + c) * g.H + ih) * g.W + iw
+    else:
+        addr = g.base + ((b * g.H + ih) * g.W + iw) * g.C + c
+    valid = (ih >= 0) & (ih < g.H) & (iw >= 0) & (iw < g.W) & (addr < mem_len)
+    return np.where(valid, addr, -1)
+
+@task
+def tpu_fast(mem, prog_base, prog_len, c_state, c_pc, c_halt, c_count, cycle, d_reads, d_writes, d_bytes, d_busy, s_count, s_macs,
+             t_rM, t_rK, t_rN, t_rT, t_m0, t_n0, t_k0, epi_cfg, v_geom, c_conv,
+             dataflow="os", bandwidth=1, overlap=False, order="mnk"):
+    # runs the whole program on the first step and leaves every counter where the FSM would
+    if c_halt.val:
+        return
+
+    M, K, N, T = t_rM.val, t_rK.val, t_rN.val, t_rT.val
+    pc = c_pc.val
+    cycles = cycle.val
+    count = c_count.val
+    reads, writes, busy, macs = d_reads.val, d_writes.val, d_busy.val, s_count.val
+    eff_macs = s_macs.val
+    m0, n0, k0 = t_m0.val, t_n0.val, t_k0.val
+    data = np.asarray(mem.val)
+    a_base = b_base = c_base = 0
+    a_step = b_step = c_step = 0
+    epi = epi_cfg.val
+    geom, conv = v_geom.val, c_conv.val
+
+    while True:
+        cycles += 1 # IF
+        if pc >= prog_len.val:
+            break
+        addr = prog_base.val + pc * INSTR_WORDS
+        op = decode_instr(data[addr:addr + INSTR_WORDS])
+        cycles += 1 # DEC
+
+        if op.kind == OpKind.HALT:
+            break
+        elif op.kind == OpKind.MNK:
+            M, K, N = op.arg0, op.arg1, op.arg2
+            b_base, c_base = a_base + M * K, a_base + M * K + K * N
+            a_step, b_step, c_step = K, N, N
+        elif op.kind == OpKind.TILE:
+            T = op.arg0
+        elif op.kind == OpKind.ABASE:
+            a_base, a_step = op.arg0, op.arg1
+        elif op.kind == OpKind.BBASE:
+            b_base, b_step = op.arg0, op.arg1
+        elif op.kind == OpKind.CBASE:
+            c_base, c_step = op.arg0, op.arg1
+        elif op.kind == OpKind.BIAS:
+            epi = replace(epi, bias=op.arg1 if op.arg0 else None)
+        elif op.kind == OpKind.RELU:
+            epi = replace(epi, relu=bool(op.arg0))
+        elif op.kind == OpKind.CLAMP:
+            epi = replace(epi, lo=op.arg1 if op.arg0 else None, hi=op.arg2 if op.arg0 else None)
+        elif op.kind == OpKind.SCALE:
+            epi = replace(epi, shift=op.arg0, mult=op.arg1)
+        elif op.kind == OpKind.ZMAP:
+            if op.arg0:
+                raise RuntimeError("the fast TPU model does not skip tiles, run zmap programs on the cycle model")
+        elif op.kind == OpKind.IFMAP:
+            geom = replace(geom, C=op.arg0, H=op.arg1, W=op.arg2, batch=op.arg3)
+        elif op.kind == OpKind.KERNEL:
+            geom = replace(geom, C_out=op.arg0, KH=op.arg1, KW=op.arg2)
+        elif op.kind in (OpKind.GEMM, OpKind.BGEMM, OpKind.CONV2D):
+            batch, sa, sb, sc = (op.arg0, op.arg1, op.arg2, op.arg3) if op.kind == OpKind.BGEMM else (1, 0, 0, 0)
+            conv = None
+            if op.kind == OpKind.CONV2D:
+                conv = replace(geom, layout=op.arg0, stride=op.arg1, pad=op.arg2, dilation=op.arg3)
+                conv.check()
+                M, K, N = conv.gemm_shape
+            mt, nt, kt = gemm_tiles(M, K, N, T)
+            r, w, b = gemm_traffic(M, K, N, T, bandwidth, order)
+
+            for i in range(batch):
+                # in order, a later problem may read an earlier one's C
+                if i:
+                    a_base, b_base, c_base = a_base + sa, b_base + sb, c_base + sc
+                if conv is not None:
+                    # only the taps inside the input are read, each every time its A tile is loaded
+                    addrs = im2col_addrs(conv.at_tile(a_base, 0, 0), len(data))
+                    A = np.where(addrs >= 0, data[np.maximum(addrs, 0)], 0)
+                    r = r + (int((addrs >= 0).sum()) - M * K) * gemm_schedule(M, K, N, T, order)["a_reuse"]
+                else:
+                    A = read_matrix(data, a_base, M, K, a_step)
+                B = read_matrix(data, b_base, K, N, b_step)
+                C = read_matrix(data, c_base, M, N, c_step)
+                D = C + A @ B
+                if epi.enabled:
+                    bias = np.zeros(max(N, 0), dtype=data.dtype)
+                    if epi.bias is not None:
+                        bias = read_matrix(data, epi.bias, 1, N, N)[0]
+                        # each final C tile latches its columns' bias once
+                        reads += mt * N if M > 0 else 0
+                    D = epilogue_matrix(D, bias, epi)
+                write_matrix(data, c_base, D, c_step)
+
+                cycles += (overlap_gemm_cycles if overlap else gemm_cycles)(M, K, N, T, dataflow, bandwidth, order)
+                reads += r
+                writes += w
+                busy += b
+                macs += mt * nt * kt * T * T
+                eff_macs += M * K * N
+            # where the last MNXT leaves the tile origin, an empty batch only clears it
+            if batch <= 0:
+                m0, n0 = 0, 0
+            else:
+                m0, n0, k0 = (mt * T, 0, kt * T) if M > 0 or N <= T else (0, T, kt * T)
+
+        cycles += 1 # NEXT
+        count += 1
+        pc += 1
+
+    mem.next = data.tolist()
+    c_state.next = TpuState.HALT
+    c_pc.next = pc
+    c_halt.next = True
+    c_count.next = count
+    cycle.next = cycles
+    d_reads.next = reads
+    d_writes.next = writes
+    d_bytes.next = d_bytes.val + (reads - d_reads.val + writes - d_writes.val) * WORD_BYTES
+    d_busy.next = busy
+    s_count.next = macs
+    s_macs.next = eff_macs
+    t_rM.next, t_rK.next, t_rN.next, t_rT.next = M, K, N, T
+    t_m0.next, t_n0.next, t_k0.next = m0, n0, k0
+    epi_cfg.next = epi
+    v_geom.next = geom
+    c_conv.next = conv
+
+def gen_tpu_fast(T, program, mem_size=4096, dataflow="os", bandwidth=1, overlap=False, order="mnk"):
+    sim = Sim()
+
+    image, p_base, p_len = program_image(program, mem_size)
+    mem = sim.reg(image)
+    prog_base = sim.reg(p_base)
+    prog_len = sim.reg(p_len)
+
+    c_state = sim.reg(TpuState.IF)
+    c_pc = sim.reg(0)
+    c_halt = sim.reg(False)
+    c_count = sim.reg(0)
+    cycle = sim.reg(0)
+
+    d_reads = sim.reg(0)
+    d_writes = sim.reg(0)
+    d_bytes = sim.reg(0)
+    d_busy = sim.reg(0)
+    s_count = sim.reg(0)
+    s_macs = sim.reg(0)
+
+    t_rM = sim.reg(0)
+    t_rK = sim.reg(0)
+    t_rN = sim.reg(0)
+    t_rT = sim.reg(T)
+    t_m0 = sim.reg(0)
+    t_n0 = sim.reg(0)
+    t_k0 = sim.reg(0)
+    e_cfg = sim.reg(Epilogue())
+    v_geom = sim.reg(ConvGeom())
+    c_conv = sim.reg(None)
+
+    sim.add(tpu_fast(
+        mem, prog_base, prog_len, c_state, c_pc, c_halt, c_count, cycle, d_reads, d_writes, d_bytes, d_busy, s_count, s_macs,
+        t_rM, t_rK, t_rN, t_rT, t_m0, t_n0, t_k0, e_cfg, v_geom, c_conv, dataflow, bandwidth, overlap, order
+    ))
+
+    # no scratchpads or PE grid here, only what is architecturally visible after the run
+    outputs = {
+        "mem": mem,
+        "prog_base": p_base,
+        "state": c_state,
+        "pc": c_pc,
+        "halted": c_halt,
+        "cycle": cycle,
+        "instr_count": c_count,
+        "dma_reads": d_reads,
+        "dma_writes": d_writes,
+        "dma_bytes": d_bytes,
+        "dma_busy": d_busy,
+        "mac_count": s_count,
+        "eff_macs": s_macs,
+        "m0": t_m0, "n0": t_n0, "k0": t_k0,
+        "rM": t_rM, "rK": t_rK, "rN": t_rN, "rT": t_rT,
+        "dataflow": dataflow,
+        "bandwidth": bandwidth,
+        "overlap": overlap,
+        "order": order,
+        "epilogue": e_cfg,
+        "conv": c_conv,
+    }
+
+    return sim, outputs
+
+# === Cross Check ===
+
+CHECKED = ["cycle", "instr_count", "dma_reads", "dma_writes", "dma_bytes", "dma_busy", "mac_count", "eff_macs", "pc", "m0", "n0", "k0", "epilogue", "conv"]
+
+def cross_check(M, K, N, T, seed=0, program=None, dataflow="os", bandwidth=1, overlap=False, order="mnk"):
+    # runs the same GEMM through both models, returns a list of (what, cycle model, fast model)
+    from tpu_gen import gen_tpu, gemm_program, gemm_mem, load_mem, run_tpu
+    import random
+
+    rng = random.Random(seed)
+    A = [[rng.randint(-8, 8) for _ in range(K)] for _ in range(M)]
+    B = [[rng.randint(-8, 8) for _ in range(N)] for _ in range(K)]
+    C = [[rng.randint(-8, 8) for _ in range(N)] for _ in range(M)]
+
+    program = program or gemm_program(M, K, N, T)
+    mem_size = max(256, M * K + K * N + M * N + 64)
+
+    results = {}
+    for mode in ("cycle", "fast"):
+        sim, outputs = gen_tpu(T, program, mem_size, mode, dataflow, bandwidth, overlap, order)
+        load_mem(outputs, gemm_mem(A, B, C, M, K, N, M * K + K * N + M * N))
+        run_tpu(sim, outputs, 100000000)
+        results[mode] = outputs
+
+    diffs = []
+    for key in CHECKED + ["mem"]:
+        a, b = results["cycle"][key].val, results["fast"][key].val
+        if a != b:
+            diffs.append((key, a, b) if key != "mem" else ("mem", "differs", "differs"))
+    return diffs
+
+def conv_check(geom, T, seed=0, dataflow="os", bandwidth=1, overlap=False, order="mnk"):
+    # one conv2d through both models and the reference, returns (what, cycle model, fast model)
+    from tpu_gen import gen_tpu, conv_program, conv_mem, conv2d, read_conv, load_mem, run_tpu
+    import random
+
+    g = geom
+    rng = random.Random(seed)
+    x = [[[[rng.randint(-8, 8) for _ in range(g.W)] for _ in range(g.H)] for _ in range(g.C)] for _ in range(g.batch)]
+    w = [[[[rng.randint(-8, 8) for _ in range(g.KW)] for _ in range(g.KH)] for _ in range(g.C)] for _ in range(g.C_out)]
+    data = conv_mem(x, w, g)
+    M, K, N = g.gemm_shape
+
+    results = {}
+    for mode in ("cycle", "fast"):
+        sim, outputs = gen_tpu(T, conv_program(g, T), max(256, len(data) + M * N + 64), mode, dataflow, bandwidth, overlap, order)
+        load_mem(outputs, data)
+        run_tpu(sim, outputs, 100000000)
+        results[mode] = outputs
+
+    diffs = [(key, results["cycle"][key].val, results["fast"][key].val) for key in CHECKED
+             if results["cycle"][key].val != results["fast"][key].val]
+    if read_conv(results["cycle"]["mem"].val, g) != conv2d(x, w, g):
+        diffs.append(("result", "differs", "reference"))
+    if results["cycle"]["mem"].val != results["fast"]["mem"].val:
+        diffs.append(("mem", "differs", "differs"))
+    return diffs
+
+# === Int8 Reference ===
+
+def int8_gemm(A, B, C, M, K, N, T, saturate=False):
+    # what the int8 arrays compute: products summed in k order within a k tile, then each
+    # tile's partial sum added into C, every add wrapping or saturating at 32 bits
+    A = np.asarray(A, dtype=np.int64).reshape(M, K)
+    B = np.asarray(B, dtype=np.int64).reshape(K, N)
+    D = np.asarray(C, dtype=np.int64).reshape(M, N)
+
+    def acc(x):
+        return np.clip(x, INT32_MIN, INT32_MAX) if saturate else ((x - INT32_MIN) & 0xFFFFFFFF) + INT32_MIN
+
+    if not saturate:
+        return acc(D + A @ B)
+    for k0 in range(0, K, T):
+        part = np.zeros((M, N), dtype=np.int64)
+        for k in range(k0, min(k0 + T, K)):
+            part = acc(part + np.outer(A[:, k], B[k, :]))
+        D = acc(D + part)
+    return D
+
+def int8_check(M, K, N, T, seed=0, saturate=False, **kwargs):
+    # one int8 GEMM on the cycle model against int8_gemm, C starts near the int32 limits so
+    # wrapping and saturation both show up. Returns the (row, col, cycle model, reference) mismatches
+    from tpu_gen import gen_tpu, gemm_program, gemm_mem_int8, load_mem, read_c, run_tpu
+    import random
+
+    rng = random.Random(seed)
+    A = [[rng.randint(-128, 127) for _ in range(K)] for _ in range(M)]
+    B = [[rng.randint(-128, 127) for _ in range(N)] for _ in range(K)]
+    C = [[rng.choice([rng.randint(-1000, 1000), INT32_MAX - rng.randint(0, 1 << 16), INT32_MIN + rng.randint(0, 1 << 16)])
+          for _ in range(N)] for _ in range(M)]
+
+    data = gemm_mem_int8(A, B, C, M, K, N)
+    sim, outputs = gen_tpu(T, gemm_program(M, K, N, T), max(256, len(data) + 64),
+                           precision="int8", saturate=saturate, **kwargs)
+    load_mem(outputs, data)
+    run_tpu(sim, outputs, 100000000)
+
+    got = read_c(outputs["mem"].val, M, K, N, int8=True)
+    want = int8_gemm(A, B, C, M, K, N, T, saturate).tolist()
+    return [(r, c, got[r][c], want[r][c]) for r in range(M) for c in range(N) if got[r][c] != want[r][c]]
+
+if __name__ == "__main__":
+    import time
+    from tpu_gen import conv_geom
+
+    shapes = [
+        (4, 4, 4, 2), (2, 2, 2, 2), (4, 4, 4, 4), (6, 6, 6, 3),
+        (3, 3, 3, 2), (4, 6, 2, 2), (5, 3, 4, 2), (1, 7, 3, 4),
+        (7, 1, 5, 3), (9, 5, 6, 4), (2, 9, 9, 3), (8, 8, 8, 1),
+    ]
+
+    ok = True
+    for dataflow in DATAFLOWS:
+        for M, K, N, T in shapes:
+            diffs = cross_check(M, K, N, T, dataflow=dataflow)
+            ok = ok and not diffs
+            print(f"{dataflow} M={M} K={K} N={N} T={T}: {'match' if not diffs else diffs}")
+    for bandwidth in (2, 3, 8):
+        for M, K, N, T in shapes:
+            diffs = cross_check(M, K, N, T, bandwidth=bandwidth)
+            ok = ok and not diffs
+            print(f"{bandwidth} words/cycle M={M} K={K} N={N} T={T}: {'match' if not diffs else diffs}")
+    for M, K, N, T in [(6, 9, 5, 3), (8, 16, 8, 4)]:
+        for dataflow in DATAFLOWS:
+            diffs = cross_check(M, K, N, T, dataflow=dataflow, bandwidth=T, overlap=True)
+            ok = ok and not diffs
+            print(f"{dataflow} overlapped M={M} K={K} N={N} T={T}: {'match' if not diffs else diffs}")
+    for order in LOOP_ORDERS:
+        for M, K, N, T in [(6, 9, 5, 3), (9, 5, 6, 4)]:
+            for overlap in (False, True):
+                diffs = cross_check(M, K, N, T, bandwidth=T, overlap=overlap, order=order)
+                ok = ok and not diffs
+                print(f"{order}{' overlapped' if overlap else ''} M={M} K={K} N={N} T={T}: {'match' if not diffs else diffs}")
+    for saturate in (False, True):
+        for M, K, N, T in [(6, 9, 5, 3), (8, 16, 8, 4), (5, 13, 7, 8)]:
+            for dataflow in DATAFLOWS:
+                diffs = int8_check(M, K, N, T, saturate=saturate, dataflow=dataflow, bandwidth=2)
+                ok = ok and not diffs
+                print(f"int8 {'saturating' if saturate else 'wrapping'} {dataflow} M={M} K={K} N={N} T={T}: "
+                      f"{'match' if not diffs else diffs}")
+    for layout in LAYOUTS:
+        for geom, T in [(conv_geom(1, 3, 6, 6, 4, 3, 3, layout, 1, 1, 1), 4),
+                        (conv_geom(2, 2, 7, 5, 3, 3, 2, layout, 2, 1, 1), 3),
+                        (conv_geom(1, 4, 8, 8, 5, 3, 3, layout, 1, 2, 2), 4)]:
+            for overlap in (False, True):
+                diffs = conv_check(geom, T, bandwidth=2, overlap=overlap)
+                ok = ok and not diffs
+                print(f"conv2d {layout} {geom.C}x{geom.H}x{geom.W} {geom.KH}x{geom.KW} stride {geom.stride} pad {geom.pad} "
+                      f"dilation {geom.dilation}{' overlapped' if overlap else ''}: {'match' if not diffs else diffs}")
+    print(f"All shapes match: {ok}")
+
+    print()
+    print(f"{'GEMM':<16}{'order':>6}{'words read':>12}{'written':>10}{'cycles':>12}{'overlapped':>12}")
+    for M, K, N in [(64, 64, 64), (64, 1024, 64), (1024, 64, 16), (16, 64, 1024)]:
+        for order in LOOP_ORDERS:
+            reads, writes, _ = gemm_traffic(M, K, N, 16, 16, order)
+            print(f"{f'{M}x{K}x{N}':<16}{order:>6}{reads:>12}{writes:>10}"
+                  f"{gemm_cycles(M, K, N, 16, 'os', 16, order):>12}{overlap_gemm_cycles(M, K, N, 16, 'os', 16, order):>12}")
+
+    print()
+    print(f"{'GEMM':<16}{'T':>4}{'words/cycle':>13}{'cycles':>12}{'util':>8}{'overlapped':>12}{'util':>8}")
+    for M, K, N in [(64, 64, 64), (64, 1024, 64), (64, 4096, 64), (256, 4096, 256)]:
+        for T, bandwidth in [(16, 1), (16, 16), (32, 32)]:
+            plain = gemm_cycles(M, K, N, T, "os", bandwidth)
+            overlapped = overlap_gemm_cycles(M, K, N, T, "os", bandwidth)
+            print(f"{f'{M}x{K}x{N}':<16}{T:>4}{bandwidth:>13}{plain:>12}{mac_utilization(M, K, N, T, plain):>8.3f}"
+                  f"{overlapped:>12}{mac_utilization(M, K, N, T, overlapped):>8.3f}")
+    print()
+
+    start = time.perf_counter()
+    for size in (64, 128, 256, 512):
+        for T in (8, 16, 32):
+            print(f"GEMM {size}^3 on a {T}x{T} array: {gemm_program_cycles(size, size, size, T)} cycles, "
+                  f"{gemm_program_cycles(size, size, size, T, bandwidth=T)} with row-wide DMA")
+    print(f"Sweep took {1000 * (time.perf_counter() - start):.2f} ms")
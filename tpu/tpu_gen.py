@@ -4,17 +4,75 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sim import *
 from tpu_tasks import *
+from tpu_asm import program_image
+from tpu_mem import BankedMem
+
+def gen_tpu(T, program, mem_size=4096, mode="cycle", dataflow="os", bandwidth=1, overlap=False, order="mnk", arrays=1,
+            memory=None, precision="int", saturate=False, skip_zero=False):
+    if dataflow not in DATAFLOWS:
+        raise RuntimeError(f"Unknown dataflow {dataflow}")
+    if order not in LOOP_ORDERS:
+        raise RuntimeError(f"Unknown loop order {order}, pick one of {LOOP_ORDERS}")
+    if bandwidth < 1:
+        raise RuntimeError(f"DMA bandwidth must be at least one word per cycle, got {bandwidth}")
+    if precision not in PRECISIONS:
+        raise RuntimeError(f"Unknown precision {precision}, pick one of {PRECISIONS}")
+    if arrays < 1:
+        raise RuntimeError(f"Need at least one array, got {arrays}")
+    if arrays > 1:
+        if mode != "cycle" or overlap:
+            raise RuntimeError("several arrays are only modelled by the cycle model without overlap")
+        if order not in MULTI_ORDERS:
+            raise RuntimeError(f"several arrays split the C tiles between them, loop order {order} revisits C")
+    if mode == "fast":
+        if memory is not None:
+            raise RuntimeError("the fast TPU model has no banked memory, use the cycle model")
+        if precision != "int":
+            raise RuntimeError("the fast TPU model only does unbounded ints, check int8 with int8_check()")
+        if skip_zero:
+            raise RuntimeError("the fast TPU model does not skip zero tiles, use the cycle model")
+        try:
+            from tpu_fast import gen_tpu_fast
+        except ImportError:
+            raise RuntimeError("the fast TPU model needs the numpy package")
+        return gen_tpu_fast(T, program, mem_size, dataflow, bandwidth, overlap, order)
+    if mode != "cycle":
+        raise RuntimeError(f"Unknown TPU mode {mode}")
 
-def gen_tpu(T, program, mem_size=4096):
     sim = Sim()
 
-    mem = sim.reg([0] * mem_size)
-
-    spad_a = sim.reg([0] * (T * T))
-    spad_b = sim.reg([0] * (T * T))
-    sums_c = sim.reg([0] * (T * T))
-
-    prog = sim.reg(program)
+    int8 = precision == "int8"
+    acc = (sat32 if saturate else wrap32) if int8 else None
+
+    image, p_base, p_len = program_image(program, mem_size)
+    mem = sim.reg(image)
+
+    # timing only, mem keeps the data. The clock goes first so every DMA engine sees the same cycle
+    if memory is not None:
+        memory = sim.reg(memory)
+        sim.add(mem_clock(memory))
+
+    if overlap:
+        a_sel = sim.reg(0)
+        b_sel = sim.reg(0)
+        c_sel = sim.reg(0)
+        a_bufs = [sim.reg([0] * (T * T)) for _ in range(2)]
+        b_bufs = [sim.reg([0] * (T * T)) for _ in range(2)]
+        c_bufs = [sim.reg([0] * (T * T)) for _ in range(2)]
+        a_zero = [sim.reg(False) for _ in range(2)]
+        b_zero = [sim.reg(False) for _ in range(2)]
+        spad_a = PingPong(a_bufs, a_sel)
+        spad_b = PingPong(b_bufs, b_sel)
+        sums_c = PingPong(c_bufs, c_sel)
+    else:
+        spad_a = sim.reg([0] * (T * T))
+        spad_b = sim.reg([0] * (T * T))
+        sums_c = sim.reg([0] * (T * T))
+        a_zero = sim.reg(False)
+        b_zero = sim.reg(False)
+
+    c_base = sim.reg(p_base)
+    c_len = sim.reg(p_len)
 
     c_state = sim.reg(TpuState.IF)
     c_pc = sim.reg(0)
@@ -42,45 +100,283 @@ def gen_tpu(T, program, mem_size=4096):
     m_bstep = sim.reg(0)
     m_cstep = sim.reg(0)
 
+    b_left = sim.reg(0)
+    b_sa = sim.reg(0)
+    b_sb = sim.reg(0)
+    b_sc = sim.reg(0)
+
+    o_steps = sim.reg([])
+    o_cur = sim.reg(0)
+
+    e_cfg = sim.reg(Epilogue())
+
+    v_geom = sim.reg(ConvGeom())
+    c_conv = sim.reg(None)
+
+    z_cfg = sim.reg(None)
+    z_empty = sim.reg(None)
+    skips = sim.reg(SkipStats())
+
     d_kind = sim.reg(DmaKind.NONE)
     d_base = sim.reg(0)
     d_stride = sim.reg(0)
     d_r = sim.reg(0)
     d_c = sim.reg(0)
     d_done = sim.reg(False)
+    d_epi = sim.reg(None)
+    d_conv = sim.reg(None)
     d_reads = sim.reg(0)
     d_writes = sim.reg(0)
+    d_bytes = sim.reg(0)
+    d_busy = sim.reg(0)
 
     s_cycle = sim.reg(0)
     s_count = sim.reg(0)
+    s_macs = sim.reg(0)
     s_active = sim.reg(False)
 
     cycle = sim.reg(0)
 
-    a_feeders = [[sim.reg(0) for _ in range(T)] for _ in range(T)]
-    b_feeders = [[sim.reg(0) for _ in range(T)] for _ in range(T)]
-
     s_sums = [[sim.reg(0) for _ in range(T)] for _ in range(T)]
-
-    a_in_feeders = [sim.reg(0) for _ in range(T)]
-    b_in_feeders = [sim.reg(0) for _ in range(T)]
-
     s_sums_flat = [s_sums[i][j] for i in range(T) for j in range(T)]
 
     # === DMA ===
 
-    # dma(state, kind, base, step, r, c, done, t_rows, t_cols, mem, spad_a, spad_b, sums_c, T):
+    # dma(state, kind, base, step, r, c, done, t_rows, t_cols, mem, spad_a, spad_b, sums_c, T, ...):
+
+    if arrays > 1:
+        # the arbiter has to see every array's request before any DMA engine runs
+        arbiter = sim.reg(DmaArbiter(arrays))
+        array_list = []
+        sim.add(arbitrate_dma(arbiter, array_list, memory))
+        for port in range(arrays):
+            array_list.append(add_array(
+                sim, T, dataflow, mem, t_T, s_count, s_macs, e_cfg, c_conv, z_empty, skips, skip_zero, int8, acc,
+                t_rM, t_rK, t_rN, t_rT,
+                m_abase, m_bbase, m_cbase, m_astep, m_bstep, m_cstep,
+                d_reads, d_writes, d_bytes, d_busy, bandwidth, arbiter, port, memory
+            ))
+        sim.add(dispatcher(
+            c_state, o_steps, o_cur, array_list,
+            t_rK, t_rN, t_rT, t_m0, t_n0, t_k0,
+            m_abase, m_bbase, m_cbase, b_left, b_sa, b_sb, b_sc
+        ))
+    elif overlap:
+        q = sim.reg([])
+        q_issued = sim.reg(0)
+        q_done = sim.reg(0)
+        sim.add(dma_queue(q, q_done, d_r, d_c, mem, t_T, d_reads, d_writes, d_bytes, d_busy, bandwidth, memory))
+    else:
+        sim.add(dma(
+            c_state, 
+            d_kind, d_base, d_stride, d_r, d_c, d_done, 
+            t_rows, t_cols,
+            mem, spad_a, spad_b, sums_c, t_T,
+            d_reads, d_writes, d_bytes, d_busy, bandwidth, memory=memory, epi=d_epi, int8=int8, conv=d_conv, zeros=(a_zero, b_zero)
+        ))
+
+    # === Systolic ===
+
+    if arrays == 1:
+        sim.add(s_counter(c_state, s_cycle))
+        add_grid(sim, T, dataflow, s_cycle, spad_a, spad_b, s_sums, s_active, t_T, acc)
+    
+    # === Controller ===
+
+    if arrays == 1:
+        sim.add(commit(c_state, s_sums_flat, sums_c, t_T, acc))
+
+    sim.add(controller(
+        c_state, c_pc, c_op, mem, c_base, c_len, c_halt, c_count,
+        d_kind, d_base, d_stride, d_r, d_c, d_done,
+        s_cycle, s_sums_flat, sums_c, s_count, s_macs, s_active, 
+        t_rM, t_rK, t_rN, t_rT, t_m0, t_n0, t_k0, t_rows, t_cols, t_T,
+        m_abase, m_bbase, m_cbase, m_astep, m_bstep, m_cstep,
+        b_left, b_sa, b_sb, b_sc, o_steps, o_cur, e_cfg, d_epi, v_geom, c_conv, d_conv,
+        z_cfg, z_empty, a_zero if arrays == 1 else None, b_zero if arrays == 1 else None, skips,
+        dataflow, overlap, order, arrays, int8, skip_zero
+    ))
+
+    if overlap:
+        o_wait = sim.reg(0)
+        sim.add(overlap_controller(
+            c_state, q, q_issued, q_done, o_steps, o_cur, o_wait, a_sel, b_sel, c_sel,
+            s_cycle, s_sums_flat, a_bufs, b_bufs, c_bufs,
+            t_rM, t_rK, t_rN, t_rT, t_m0, t_n0, t_k0,
+            m_abase, m_bbase, m_cbase, m_astep, m_bstep, m_cstep,
+            b_left, b_sa, b_sb, b_sc, e_cfg, c_conv, a_zero, b_zero, skips,
+            dataflow, order, int8, skip_zero
+        ))
+
+    # reads the state every other task left, so where it goes does not matter
+    perf = sim.reg(PerfStats())
+    units = array_list if arrays > 1 else [{"state": c_state, "d_kind": d_kind, "d_done": d_done}]
+    sim.add(perf_counter(perf, c_halt, c_state, units, q if overlap else None))
+
+    sim.add(c_counter(cycle, c_halt))
+
+    outputs = {
+        "mem": mem,
+        "prog_base": p_base,
+        "spad_a": spad_a,
+        "spad_b": spad_b,
+        "accum_c": sums_c,
+        "s_sums": s_sums,
+        "state": c_state,
+        "pc": c_pc,
+        "halted": c_halt,
+        "cycle": cycle,
+        "instr_count": c_count,
+        "dma_reads": d_reads,
+        "dma_writes": d_writes,
+        "dma_bytes": d_bytes,
+        "dma_busy": d_busy,
+        "mac_count": s_count,
+        "eff_macs": s_macs,
+        "perf": perf,
+        "s_cycle": s_cycle,
+        "m0": t_m0, "n0": t_n0, "k0": t_k0,
+        "rM": t_rM, "rK": t_rK, "rN": t_rN, "rT": t_rT,
+        "dataflow": dataflow,
+        "bandwidth": bandwidth,
+        "overlap": overlap,
+        "order": order,
+        "memory": memory,
+        "epilogue": e_cfg,
+        "conv": c_conv,
+        "skips": skips,
+        "precision": precision,
+        "saturate": saturate,
+    }
+    if arrays > 1:
+        outputs["arrays"] = array_list
+        outputs["arbiter"] = arbiter
+
+    return sim, outputs
+
+def add_grid(sim, T, dataflow, s_cycle, spad_a, spad_b, s_sums, s_active, t_T, acc=None):
+    if dataflow == "os":
+        add_output_stationary(sim, T, s_cycle, spad_a, spad_b, s_sums, s_active, t_T, acc)
+    elif dataflow == "ws":
+        add_stationary(sim, T, s_cycle, spad_b, spad_a, False, s_sums, s_active, acc)
+    else:
+        s_sums_t = [[s_sums[i][j] for i in range(T)] for j in range(T)]
+        add_stationary(sim, T, s_cycle, spad_a, spad_b, True, s_sums_t, s_active, acc)
+
+def add_array(sim, T, dataflow, mem, t_T, s_count, s_macs, e_cfg, c_conv, z_empty, skips, skip_zero, int8, acc,
+              t_rM, t_rK, t_rN, t_rT,
+              m_abase, m_bbase, m_cbase, m_astep, m_bstep, m_cstep,
+              d_reads, d_writes, d_bytes, d_busy, bandwidth, arbiter, port, memory=None):
+    # one of several arrays, the DMA counters and mem are shared, everything else is its own
+    arr = {
+        "port": port,
+        "state": sim.reg(TpuState.IDLE),
+        "m0": sim.reg(0), "n0": sim.reg(0), "k0": sim.reg(0),
+        "rows": sim.reg(0), "cols": sim.reg(0),
+        "tile_a": sim.reg(None), "tile_b": sim.reg(None),
+        "spad_a": sim.reg([0] * (T * T)),
+        "spad_b": sim.reg([0] * (T * T)),
+        "accum_c": sim.reg([0] * (T * T)),
+        "d_kind": sim.reg(DmaKind.NONE),
+        "d_base": sim.reg(0), "d_step": sim.reg(0),
+        "d_r": sim.reg(0), "d_c": sim.reg(0),
+        "d_done": sim.reg(False),
+        "d_epi": sim.reg(None),
+        "d_conv": sim.reg(None),
+        "a_zero": sim.reg(False), "b_zero": sim.reg(False),
+        "s_cycle": sim.reg(0),
+        "s_active": sim.reg(False),
+        "exec_cycles": sim.reg(0),
+        "macs": sim.reg(0),
+        "tiles": sim.reg(0),
+    }
+    s_sums = [[sim.reg(0) for _ in range(T)] for _ in range(T)]
+    s_sums_flat = [s_sums[i][j] for i in range(T) for j in range(T)]
+    arr["s_sums"] = s_sums
 
     sim.add(dma(
-        c_state, 
-        d_kind, d_base, d_stride, d_r, d_c, d_done, 
-        t_rows, t_cols,
-        mem, spad_a, spad_b, sums_c, t_T
+        arr["state"],
+        arr["d_kind"], arr["d_base"], arr["d_step"], arr["d_r"], arr["d_c"], arr["d_done"],
+        arr["rows"], arr["cols"],
+        mem, arr["spad_a"], arr["spad_b"], arr["accum_c"], t_T,
+        d_reads, d_writes, d_bytes, d_busy, bandwidth, arbiter, port, memory, arr["d_epi"], int8, arr["d_conv"], (arr["a_zero"], arr["b_zero"])
     ))
 
-    # === Systolic ===
+    sim.add(s_counter(arr["state"], arr["s_cycle"]))
+    add_grid(sim, T, dataflow, arr["s_cycle"], arr["spad_a"], arr["spad_b"], s_sums, arr["s_active"], t_T, acc)
+    sim.add(commit(arr["state"], s_sums_flat, arr["accum_c"], t_T, acc))
 
-    sim.add(s_counter(c_state, s_cycle))
+    sim.add(array_controller(
+        arr, s_sums_flat, s_count, s_macs, e_cfg, c_conv, z_empty, skips,
+        t_rM, t_rK, t_rN, t_rT,
+        m_abase, m_bbase, m_cbase, m_astep, m_bstep, m_cstep,
+        dataflow, int8, skip_zero
+    ))
+    return arr
+
+def array_stats(outputs):
+    # per array: C tiles done, share of the run spent in EXEC, useful MACs over what the grid
+    # could have done, DMA beats it got and cycles it waited on the arbiter
+    cycles = outputs["cycle"].val
+    T = outputs["rT"].val
+    arb = outputs["arbiter"].val
+    stats = []
+    for arr in outputs["arrays"]:
+        p = arr["port"]
+        stats.append({
+            "tiles": arr["tiles"].val,
+            "exec_cycles": arr["exec_cycles"].val,
+            "busy": arr["exec_cycles"].val / cycles if cycles else 0.0,
+            "utilization": arr["macs"].val / (T * T * cycles) if cycles else 0.0,
+            "dma_beats": arb.beats[p],
+            "dma_stalls": arb.stall_cycles[p],
+        })
+    return stats
+
+def perf_report(outputs):
+    # the run on a roofline in MACs per cycle: the grids can do T * T a cycle each and the DMA
+    # moves `bandwidth` words, so a run with fewer MACs per byte moved than the ridge is held
+    # back by memory. Works on the fast model too, it only lacks the cycle breakdown
+    cycles = outputs["cycle"].val
+    T = outputs["rT"].val
+    macs = outputs["eff_macs"].val
+    nbytes = outputs["dma_bytes"].val
+    peak = len(outputs.get("arrays", [None])) * T * T
+    mem_roof = outputs["bandwidth"] * WORD_BYTES
+    intensity = macs / nbytes if nbytes else float("inf")
+    attainable = min(peak, intensity * mem_roof)
+    achieved = macs / cycles if cycles else 0.0
+    report = {
+        "cycles": cycles,
+        "macs": macs,
+        "bytes": nbytes,
+        "intensity": intensity, # MACs per byte
+        "ridge": peak / mem_roof,
+        "bound": "memory" if intensity < peak / mem_roof else "compute",
+        "peak": peak, # MACs per cycle
+        "attainable": attainable,
+        "achieved": achieved,
+        "utilization": achieved / peak if peak else 0.0,
+        "of_attainable": achieved / attainable if attainable else 0.0,
+    }
+    if "perf" in outputs:
+        p = outputs["perf"].val
+
+        def hist(h):
+            return {st.name: h[st] for st in TpuState if st in h}
+
+        report["states"] = hist(p.states)
+        report["busy"] = {"compute": p.compute, "dma": p.dma, "both": p.both, "idle": p.idle}
+        if p.array_states:
+            report["array_states"] = [hist(h) for h in p.array_states]
+    return report
+
+def add_output_stationary(sim, T, s_cycle, spad_a, spad_b, s_sums, s_active, t_T, acc=None):
+    a_feeders = [[sim.reg(0) for _ in range(T)] for _ in range(T)]
+    b_feeders = [[sim.reg(0) for _ in range(T)] for _ in range(T)]
+
+    a_in_feeders = [sim.reg(0) for _ in range(T)]
+    b_in_feeders = [sim.reg(0) for _ in range(T)]
 
     for i in range(t_T.val):
         sim.add(feed_a_row(s_cycle, i, spad_a, a_in_feeders[i], t_T.val))
@@ -114,43 +410,39 @@ def gen_tpu(T, program, mem_size=4096):
                 s_sums[i][j],
                 get_a_out(i, j),
                 get_b_out(i, j),
-                s_active
+                s_active,
+                acc
             ))
-    
-    # === Controller ===
 
-    sim.add(commit(c_state, s_sums_flat, sums_c, t_T))
+def add_stationary(sim, T, s_cycle, w_spad, x_spad, transpose, outs, s_active, acc=None):
+    # PE (k, j) holds weights[k][j], stream row r drains from the bottom of column j into outs[r][j]
+    w_in_feeders = [sim.reg(0) for _ in range(T)]
+    weights = [[sim.reg(0) for _ in range(T)] for _ in range(T)]
 
-    sim.add(controller(
-        c_state, c_pc, c_op, prog, c_halt, c_count,
-        d_kind, d_base, d_stride, d_r, d_c, d_done, d_reads, d_writes,
-        s_cycle, s_sums_flat, sums_c, s_count, s_active, 
-        t_rM, t_rK, t_rN, t_rT, t_m0, t_n0, t_k0, t_rows, t_cols, t_T,
-        m_abase, m_bbase, m_cbase, m_astep, m_bstep, m_cstep
-    ))
+    x_in_feeders = [sim.reg(0) for _ in range(T)]
+    x_feeders = [[sim.reg(0) for _ in range(T)] for _ in range(T)]
+    psums = [[sim.reg(0) for _ in range(T)] for _ in range(T)]
+    zero = sim.reg(0)
 
-    sim.add(c_counter(cycle, c_halt))
+    for j in range(T):
+        sim.add(feed_weight(s_cycle, j, w_spad, w_in_feeders[j], T, transpose))
+    for k in range(T):
+        sim.add(feed_stream(s_cycle, k, x_spad, x_in_feeders[k], T, transpose))
 
-    outputs = {
-        "mem": mem,
-        "spad_a": spad_a,
-        "spad_b": spad_b,
-        "accum_c": sums_c,
-        "s_sums": s_sums,
-        "state": c_state,
-        "pc": c_pc,
-        "halted": c_halt,
-        "cycle": cycle,
-        "instr_count": c_count,
-        "dma_reads": d_reads,
-        "dma_writes": d_writes,
-        "mac_count": s_count,
-        "s_cycle": s_cycle,
-        "m0": t_m0, "n0": t_n0, "k0": t_k0,
-        "rM": t_rM, "rK": t_rK, "rN": t_rN, "rT": t_rT,
-    }
+    for k in range(T):
+        for j in range(T):
+            sim.add(preload(s_cycle, w_in_feeders[j] if k == 0 else weights[k-1][j], weights[k][j], T))
+            sim.add(mac_stationary(
+                x_in_feeders[k] if j == 0 else x_feeders[k][j-1],
+                zero if k == 0 else psums[k-1][j],
+                weights[k][j],
+                x_feeders[k][j],
+                psums[k][j],
+                acc
+            ))
 
-    return sim, outputs
+    for j in range(T):
+        sim.add(drain_col(s_cycle, j, psums[T-1][j], [outs[r][j] for r in range(T)], T, s_active))
 
 def gemm(A, B, C, M, K, N):
     D = [[0] * N for _ in range(M)]
@@ -164,42 +456,177 @@ def gemm(A, B, C, M, K, N):
             D[i][j] += C[i][j]
     return D
 
-def test_tpu(M, K, N, T, A, B, C):
-        program = [
-            ("mnk", M, N, K),
-            ("tile", T), 
-            ("gemm",),
-            ("halt",)
-        ]
-
-        sim, outputs = gen_tpu(T, program)
-
-        mem_init = [0] * 4096
-        for r in range(M):
-            for c in range(K):
-                mem_init[r * K + c] = A[r][c]
-        for r in range(K):
-            for c in range(N):
-                mem_init[M * K + r * N + c] = B[r][c]
-        for r in range(M):
-            for c in range(N):
-                mem_init[M * K + K * N + r * N + c] = C[r][c]
-
-        outputs["mem"].val = mem_init
-        outputs["mem"].next = mem_init
-
-        max_cycles = 10000
-        cycle_count = 0
-        while not outputs["halted"].val and outputs["cycle"].val < max_cycles:
-            sim.step()
-            cycle_count += 1
+def gemm_program(M, K, N, T):
+    return [
+        ("mnk", M, K, N),
+        ("tile", T), 
+        ("gemm",),
+        ("halt",)
+    ]
+
+def gemm_mem(A, B, C, M, K, N, mem_size=4096):
+    # A, then B, then C packed row major from address 0, the layout mnk sets up
+    mem = [0] * mem_size
+    for r in range(M):
+        for c in range(K):
+            mem[r * K + c] = A[r][c]
+    for r in range(K):
+        for c in range(N):
+            mem[M * K + r * N + c] = B[r][c]
+    for r in range(M):
+        for c in range(N):
+            mem[M * K + K * N + r * N + c] = C[r][c]
+    return mem
+
+def read_c(mem, M, K, N, int8=False):
+    base = M * packed_words(K, int8) + K * packed_words(N, int8)
+    return [[mem[base + r * N + c] for c in range(N)] for r in range(M)]
+
+def gemm_mem_int8(A, B, C, M, K, N):
+    # the int8 layout mnk sets up: A and B rows packed four to a word, then C one per word
+    mem = []
+    for row in A:
+        mem += pack_int8(row)
+    for row in B:
+        mem += pack_int8(row)
+    for row in C:
+        mem += list(row)
+    return mem
+
+def bgemm_program(M, K, N, T, count):
+    # count problems packed back to back: every A, then every B, then every C
+    a_size, b_size, c_size = M * K, K * N, M * N
+    return [
+        ("mnk", M, K, N),
+        ("tile", T),
+        ("abase", 0, K),
+        ("bbase", count * a_size, N),
+        ("cbase", count * (a_size + b_size), N),
+        ("bgemm", count, a_size, b_size, c_size),
+        ("halt",)
+    ]
+
+def bgemm_mem(As, Bs, Cs, M, K, N, mem_size=4096):
+    count = len(As)
+    mem = [0] * mem_size
+    for i in range(count):
+        problem = gemm_mem(As[i], Bs[i], Cs[i], M, K, N, M * K + K * N + M * N)
+        mem[i * M * K:(i + 1) * M * K] = problem[:M * K]
+        b = count * M * K + i * K * N
+        mem[b:b + K * N] = problem[M * K:M * K + K * N]
+        c = count * (M * K + K * N) + i * M * N
+        mem[c:c + M * N] = problem[M * K + K * N:]
+    return mem
+
+def read_batch_c(mem, M, K, N, count):
+    base = count * (M * K + K * N)
+    return [[[mem[base + i * M * N + r * N + c] for c in range(N)] for r in range(M)] for i in range(count)]
+
+def conv_geom(batch, C, H, W, C_out, KH, KW, layout="nchw", stride=1, pad=0, dilation=1):
+    return ConvGeom(C, H, W, batch, C_out, KH, KW, LAYOUTS.index(layout), stride, pad, dilation)
+
+def conv_program(geom, T):
+    # the input tensor from address 0, then the K x N weights, then C
+    M, K, N = geom.gemm_shape
+    x_size = geom.batch * geom.C * geom.H * geom.W
+    return [
+        ("tile", T),
+        ("abase", 0, 0),
+        ("bbase", x_size, N),
+        ("cbase", x_size + K * N, N),
+        ("ifmap", geom.C, geom.H, geom.W, geom.batch),
+        ("kernel", geom.C_out, geom.KH, geom.KW),
+        ("conv2d", LAYOUTS[geom.layout], geom.stride, geom.pad, geom.dilation),
+        ("halt",)
+    ]
+
+def conv_mem(x, w, geom):
+    # x is (batch, C, H, W) and w (C_out, C, KH, KW) whatever the layout, laid out as
+    # conv_program expects with the weight rows in the layout's tap order
+    g = geom
+    mem = conv_input(x, g)
+    if g.layout == NCHW:
+        taps = [(c, kh, kw) for c in range(g.C) for kh in range(g.KH) for kw in range(g.KW)]
+    else:
+        taps = [(c, kh, kw) for kh in range(g.KH) for kw in range(g.KW) for c in range(g.C)]
+    for c, kh, kw in taps:
+        mem += [w[o][c][kh][kw] for o in range(g.C_out)]
+    return mem
+
+def conv_input(x, geom):
+    g = geom
+    if g.layout == NCHW:
+        return [x[b][c][h][i] for b in range(g.batch) for c in range(g.C) for h in range(g.H) for i in range(g.W)]
+    return [x[b][c][h][i] for b in range(g.batch) for h in range(g.H) for i in range(g.W) for c in range(g.C)]
+
+def im2col(x, geom):
+    # the A matrix conv2d reads in place, for running the same layer as a plain gemm
+    M, K, _ = geom.gemm_shape
+    flat = conv_input(x, geom)
+    A = []
+    for m in range(M):
+        addrs = [geom.a_addr(m, k) for k in range(K)]
+        A.append([flat[a] if a is not None else 0 for a in addrs])
+    return A
+
+def conv2d(x, w, geom):
+    # reference, (batch * OH * OW) x C_out rows in the order C comes out
+    g = geom
+    out = []
+    for b in range(g.batch):
+        for oh in range(g.OH):
+            for ow in range(g.OW):
+                row = []
+                for o in range(g.C_out):
+                    acc = 0
+                    for c in range(g.C):
+                        for kh in range(g.KH):
+                            for kw in range(g.KW):
+                                ih = oh * g.stride - g.pad + kh * g.dilation
+                                iw = ow * g.stride - g.pad + kw * g.dilation
+                                if 0 <= ih < g.H and 0 <= iw < g.W:
+                                    acc += x[b][c][ih][iw] * w[o][c][kh][kw]
+                    row.append(acc)
+                out.append(row)
+    return out
+
+def read_conv(mem, geom):
+    M, K, N = geom.gemm_shape
+    base = geom.batch * geom.C * geom.H * geom.W + K * N
+    return [[mem[base + r * N + c] for c in range(N)] for r in range(M)]
+
+def occupancy_map(X, T):
+    # zmap bits for matrix X, one per T x T tile in row major tile order, set if it has a nonzero
+    rows, cols = len(X), len(X[0]) if X else 0
+    tr, tc = -(-rows // T), -(-cols // T)
+    words = [0] * -(-(tr * tc) // 32)
+    for i in range(tr * tc):
+        r0, c0 = divmod(i, tc)
+        if any(X[r][c] for r in range(r0 * T, min(r0 * T + T, rows)) for c in range(c0 * T, min(c0 * T + T, cols))):
+            words[i // 32] |= 1 << (i % 32)
+    return words
+
+def load_mem(outputs, data, base=0):
+    # writes through, a fresh list would drop the program sitting at the top of mem
+    mem = writable(outputs["mem"])
+    if base + len(data) > outputs.get("prog_base", len(mem)):
+        raise RuntimeError(f"{len(data)} words at {base} run into the program at {outputs['prog_base']}")
+    mem[base:base + len(data)] = data
+
+def run_tpu(sim, outputs, max_cycles=10000):
+    while not outputs["halted"].val and outputs["cycle"].val < max_cycles:
+        sim.step()
+    return outputs["cycle"].val
+
+def test_tpu(M, K, N, T, A, B, C, mode="cycle", dataflow="os", bandwidth=1, overlap=False, order="mnk"):
+        mem_size = max(4096, M * K + K * N + M * N)
+        sim, outputs = gen_tpu(T, gemm_program(M, K, N, T), mem_size, mode, dataflow, bandwidth, overlap, order)
+
+        load_mem(outputs, gemm_mem(A, B, C, M, K, N, M * K + K * N + M * N))
+
+        run_tpu(sim, outputs, 10000000)
         
-        actual_c = []
-        for r in range(M):
-            row = []
-            for c in range(N):
-                row.append(outputs["mem"].val[M * K + K * N + r * N + c])
-            actual_c.append(row)
+        actual_c = read_c(outputs["mem"].val, M, K, N)
 
         print("Actual:")
         for row in actual_c:
@@ -210,6 +637,8 @@ def test_tpu(M, K, N, T, A, B, C):
         for row in expected:
             print(row)
 
+        return actual_c == expected
+
 
 if __name__ == "__main__":
     M, K, N = 4, 4, 4
@@ -245,4 +674,163 @@ if __name__ == "__main__":
 
     test_tpu(M, K, N, T, A, B, C)
 
-    
\ No newline at end of file
+    # eight small problems in one bgemm against eight separate programs
+    count = 8
+    As = [[[(i + r * c) % 5 - 2 for c in range(K)] for r in range(M)] for i in range(count)]
+    Bs = [[[(i * r + c) % 7 - 3 for c in range(N)] for r in range(K)] for i in range(count)]
+    Cs = [[[i - r + c for c in range(N)] for r in range(M)] for i in range(count)]
+
+    sim, outputs = gen_tpu(T, bgemm_program(M, K, N, T, count))
+    load_mem(outputs, bgemm_mem(As, Bs, Cs, M, K, N, count * (M * K + K * N + M * N)))
+    batched = run_tpu(sim, outputs, 10000000)
+    correct = read_batch_c(outputs["mem"].val, M, K, N, count) == [gemm(As[i], Bs[i], Cs[i], M, K, N) for i in range(count)]
+
+    separate = 0
+    for i in range(count):
+        sim, outputs = gen_tpu(T, gemm_program(M, K, N, T))
+        load_mem(outputs, gemm_mem(As[i], Bs[i], Cs[i], M, K, N, M * K + K * N + M * N))
+        separate += run_tpu(sim, outputs, 10000000)
+    print(f"\nbgemm of {count}: correct {correct}, {batched} cycles, {separate} as separate programs")
+
+    
+    # the same GEMM spread over more arrays, until the shared DMA can't keep them fed
+    M, K, N, T = 16, 16, 16, 4
+    print(f"\n{'arrays':>6}{'words/cycle':>13}{'cycles':>9}{'speedup':>9}{'util/array':>12}{'dma stalls/array':>18}")
+    for bandwidth in (1, T):
+        single = None
+        for arrays in (1, 2, 4, 8):
+            sim, outputs = gen_tpu(T, gemm_program(M, K, N, T), bandwidth=bandwidth, arrays=arrays)
+            cycles = run_tpu(sim, outputs, 10000000)
+            single = single or cycles
+            if arrays == 1:
+                util, stalls = M * K * N / (T * T * cycles), 0
+            else:
+                stats = array_stats(outputs)
+                util = sum(s["utilization"] for s in stats) / arrays
+                stalls = sum(s["dma_stalls"] for s in stats) / arrays
+            print(f"{arrays:>6}{bandwidth:>13}{cycles:>9}{single / cycles:>9.2f}{util:>12.3f}{stalls:>18.0f}")
+
+    # the same GEMM behind a few memory configurations
+    M, K, N, T = 16, 16, 16, 4
+    print(f"\n{'memory':<28}{'cycles':>9}{'stalls':>9}{'conflicts':>11}{'bank util':>11}")
+    for name, memory in [
+        ("ideal", None),
+        ("8 banks", BankedMem(8)),
+        ("2 banks", BankedMem(2)),
+        ("8 banks, 4-word lines", BankedMem(8, interleave=4)),
+        ("8 banks, 20 cycle latency", BankedMem(8, latency=20)),
+    ]:
+        sim, outputs = gen_tpu(T, gemm_program(M, K, N, T), bandwidth=T, memory=memory)
+        cycles = run_tpu(sim, outputs, 10000000)
+        if memory is None:
+            print(f"{name:<28}{cycles:>9}")
+            continue
+        stats = outputs["memory"].val.stats()
+        util = sum(stats["utilization"]) / len(stats["utilization"])
+        print(f"{name:<28}{cycles:>9}{stats['stall_cycles']:>9}{sum(stats['conflicts']):>11}{util:>11.3f}")
+
+    # a quantized layer: bias, ReLU and requantization fused into the C store, against the
+    # same epilogue done as a separate pass that reads C and the bias back and writes C again
+    M, K, N, T = 16, 16, 16, 4
+    layer = [
+        ("mnk", M, K, N), ("tile", T),
+        ("bias", 1, M * K + K * N + M * N),
+        ("relu", 1), ("scale", 4, 3), ("clamp", 1, -128, 127),
+        ("gemm",), ("halt",),
+    ]
+    As = [[(r * 3 + c) % 9 - 4 for c in range(K)] for r in range(M)]
+    Bs = [[(r + 2 * c) % 7 - 3 for c in range(N)] for r in range(K)]
+    Cs = [[0] * N for _ in range(M)]
+    bias = [c - N // 2 for c in range(N)]
+    sim, outputs = gen_tpu(T, layer, bandwidth=T)
+    load_mem(outputs, gemm_mem(As, Bs, Cs, M, K, N, M * K + K * N + M * N) + bias)
+    cycles = run_tpu(sim, outputs, 10000000)
+    e = outputs["epilogue"].val
+    correct = read_c(outputs["mem"].val, M, K, N) == [epilogue(row, bias, e) for row in gemm(As, Bs, Cs, M, K, N)]
+    fused = outputs["dma_reads"].val + outputs["dma_writes"].val
+    # the fused store latches the bias once per row of C tiles, the pass reads it once
+    separate = fused - -(-M // T) * N + N + 2 * M * N
+    print(f"\nfused layer: correct {correct}, {cycles} cycles, {fused} words moved, "
+          f"{separate} with the epilogue as a separate pass")
+
+    # int8 operands packed four to a word against one int per word
+    M, K, N, T = 16, 16, 16, 4
+    As = [[(r * 7 + c * 3) % 255 - 128 for c in range(K)] for r in range(M)]
+    Bs = [[(r * 5 + c) % 255 - 128 for c in range(N)] for r in range(K)]
+    Cs = [[0] * N for _ in range(M)]
+    print(f"\n{'precision':<10}{'words read':>12}{'cycles':>9}")
+    for precision, data in [("int", gemm_mem(As, Bs, Cs, M, K, N, M * K + K * N + M * N)),
+                            ("int8", gemm_mem_int8(As, Bs, Cs, M, K, N))]:
+        sim, outputs = gen_tpu(T, gemm_program(M, K, N, T), precision=precision)
+        load_mem(outputs, data)
+        cycles = run_tpu(sim, outputs, 10000000)
+        print(f"{precision:<10}{outputs['dma_reads'].val:>12}{cycles:>9}")
+
+    # a 3x3 convolution read in place against the same layer as a gemm on a materialized im2col copy
+    T = 4
+    geom = conv_geom(1, 4, 8, 8, 8, 3, 3, "nhwc", 1, 1, 1)
+    M, K, N = geom.gemm_shape
+    x = [[[[(c * 5 + h * 3 + w) % 7 - 3 for w in range(geom.W)] for h in range(geom.H)] for c in range(geom.C)]]
+    w = [[[[(o + c * kh - kw) % 5 - 2 for kw in range(geom.KW)] for kh in range(geom.KH)] for c in range(geom.C)] for o in range(N)]
+    data = conv_mem(x, w, geom)
+    x_size = len(conv_input(x, geom))
+    print(f"\n{'3x3 conv, 4->8 ch, 8x8':<24}{'A words in mem':>16}{'words read':>12}{'cycles':>9}")
+
+    sim, outputs = gen_tpu(T, conv_program(geom, T), bandwidth=T)
+    load_mem(outputs, data)
+    cycles = run_tpu(sim, outputs, 10000000)
+    correct = read_conv(outputs["mem"].val, geom) == conv2d(x, w, geom)
+    print(f"{'conv2d':<24}{x_size:>16}{outputs['dma_reads'].val:>12}{cycles:>9}  correct {correct}")
+
+    A = im2col(x, geom)
+    B = [data[x_size + k * N:x_size + (k + 1) * N] for k in range(K)]
+    Cs = [[0] * N for _ in range(M)]
+    sim, outputs = gen_tpu(T, gemm_program(M, K, N, T), bandwidth=T)
+    load_mem(outputs, gemm_mem(A, B, Cs, M, K, N, M * K + K * N + M * N))
+    cycles = run_tpu(sim, outputs, 10000000)
+    correct = read_c(outputs["mem"].val, M, K, N) == conv2d(x, w, geom)
+    print(f"{'im2col + gemm':<24}{M * K:>16}{outputs['dma_reads'].val:>12}{cycles:>9}  correct {correct}")
+
+    # a pruned layer with half the A tiles and a quarter of the B tiles zero, skipping them
+    # after the load on the DMA's zero flags and before it with occupancy maps
+    M, K, N, T = 32, 32, 32, 4
+    As = [[(r + 3 * c) % 7 - 3 if (r // T + c // T) % 2 else 0 for c in range(K)] for r in range(M)]
+    Bs = [[(2 * r + c) % 5 - 2 if (r // T) % 4 else 0 for c in range(N)] for r in range(K)]
+    Cs = [[0] * N for _ in range(M)]
+    base = M * K + K * N + M * N
+    a_map, b_map = occupancy_map(As, T), occupancy_map(Bs, T)
+    data = gemm_mem(As, Bs, Cs, M, K, N, base) + a_map + b_map
+    mapped = [("mnk", M, K, N), ("tile", T), ("zmap", 1, base, base + len(a_map)), ("gemm",), ("halt",)]
+    print(f"\n{'pruned 32^3':<24}{'cycles':>9}{'words read':>12}{'zero skips':>12}{'map skips':>11}{'saved':>8}")
+    for name, program, skip_zero in [("no skipping", gemm_program(M, K, N, T), False),
+                                     ("zero flags", gemm_program(M, K, N, T), True),
+                                     ("occupancy maps", mapped, False)]:
+        sim, outputs = gen_tpu(T, program, bandwidth=T, skip_zero=skip_zero)
+        load_mem(outputs, data)
+        cycles = run_tpu(sim, outputs, 10000000)
+        sk = outputs["skips"].val
+        correct = read_c(outputs["mem"].val, M, K, N) == gemm(As, Bs, Cs, M, K, N)
+        print(f"{name:<24}{cycles:>9}{outputs['dma_reads'].val:>12}{sk.zero_skips:>12}{sk.map_skips:>11}"
+              f"{sk.saved_cycles:>8}  correct {correct}")
+
+    # the same GEMM in a few configurations on the roofline, then where one run's cycles went
+    M, K, N, T = 30, 30, 30, 4
+    print(f"\n{'30^3, T=4':<20}{'cycles':>8}{'MAC/B':>7}{'ridge':>7}{'bound':>8}{'MAC/cyc':>9}{'attain':>8}"
+          f"{'util':>7}{'compute':>9}{'dma':>6}{'both':>6}{'idle':>6}")
+    for name, kwargs in [
+        ("1 word/cycle", dict()),
+        ("4 words/cycle", dict(bandwidth=T)),
+        ("overlapped", dict(bandwidth=T, overlap=True)),
+        ("4 arrays", dict(bandwidth=T, arrays=4)),
+        ("int8", dict(bandwidth=T, precision="int8")),
+    ]:
+        sim, outputs = gen_tpu(T, gemm_program(M, K, N, T), **kwargs)
+        cycles = run_tpu(sim, outputs, 10000000)
+        r = perf_report(outputs)
+        b = r["busy"]
+        print(f"{name:<20}{cycles:>8}{r['intensity']:>7.2f}{r['ridge']:>7.2f}{r['bound']:>8}{r['achieved']:>9.2f}"
+              f"{r['attainable']:>8.2f}{r['utilization']:>7.3f}{b['compute']:>9}{b['dma']:>6}{b['both']:>6}{b['idle']:>6}")
+    sim, outputs = gen_tpu(T, gemm_program(M, K, N, T), bandwidth=T)
+    run_tpu(sim, outputs, 10000000)
+    states = perf_report(outputs)["states"]
+    print("cycles by state, 4 words/cycle: " + ", ".join(f"{name} {n}" for name, n in states.items()))
@@ -0,0 +1,86 @@
+# === Banked Memory ===
+
+class BankedMem:
+    # timing only, the words stay in the mem list and the DMA still moves them. Word address a
+    # lives in bank (a // interleave) % banks. A bank hands out one word per cycle, so a beat
+    # takes as many cycles as the most words it wants from one bank. Banks another beat is still
+    # using make it wait, and the first beat of every transfer pays `latency` on top.
+    def __init__(self, banks=8, interleave=1, latency=0):
+        if banks < 1 or interleave < 1:
+            raise RuntimeError(f"Need at least one bank and one word per bank line, got {banks} and {interleave}")
+        if latency < 0:
+            raise RuntimeError(f"Memory latency can't be negative, got {latency}")
+
+        self.banks = banks
+        self.interleave = interleave
+        self.latency = latency
+
+        self.now = 0
+        self.free = [0] * banks # first cycle each bank can start on a new word
+        self.inflight = {} # port -> cycle its beat's data is there
+
+        self.accesses = [0] * banks
+        self.conflicts = [0] * banks
+        self.busy = [0] * banks
+        self.stall_cycles = 0
+        self.latency_cycles = 0
+
+    def copy(self):
+        new = BankedMem(self.banks, self.interleave, self.latency)
+        new.now = self.now
+        new.free = list(self.free)
+        new.inflight = dict(self.inflight)
+        new.accesses = list(self.accesses)
+        new.conflicts = list(self.conflicts)
+        new.busy = list(self.busy)
+        new.stall_cycles = self.stall_cycles
+        new.latency_cycles = self.latency_cycles
+        return new
+
+    def tick(self):
+        self.now += 1
+
+    def bank(self, addr):
+        return (addr // self.interleave) % self.banks
+
+    def waiting(self, port=0):
+        return port in self.inflight
+
+    def issue(self, port, addrs, first=False):
+        # the word addresses one beat touches, none for a beat of padding that never reaches mem
+        words = {}
+        for a in addrs:
+            b = self.bank(a)
+            words[b] = words.get(b, 0) + 1
+
+        done = self.now
+        for b, k in words.items():
+            start = max(self.now, self.free[b])
+            if start > self.now or k > 1:
+                self.conflicts[b] += 1
+            self.free[b] = start + k
+            self.accesses[b] += k
+            self.busy[b] += k
+            done = max(done, start + k - 1)
+
+        if first:
+            done += self.latency
+            self.latency_cycles += self.latency
+        self.inflight[port] = done
+
+    def arrived(self, port=0):
+        # True on the cycle the beat can move, every cycle before that is a stall
+        if self.now >= self.inflight[port]:
+            del self.inflight[port]
+            return True
+        self.stall_cycles += 1
+        return False
+
+    def stats(self):
+        return {
+            "accesses": list(self.accesses),
+            "conflicts": list(self.conflicts),
+            "utilization": [b / self.now if self.now else 0.0 for b in self.busy],
+            "stall_cycles": self.stall_cycles,
+            "latency_cycles": self.latency_cycles,
+        }
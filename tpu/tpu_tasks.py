@@ -3,8 +3,10 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sim import *
+import itertools
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
+from typing import Optional
 
 # === States, Ops, Kinds ===
 
@@ -30,6 +32,10 @@ class TpuState(Enum):
     MNXT = 11
     NEXT = 12
     HALT = 13
+    PLAN = 14
+    WAIT = 15
+    DISP = 16
+    IDLE = 17
 
 class DmaKind(Enum):
     NONE = 0
@@ -37,12 +43,25 @@ class DmaKind(Enum):
     LDB  = 2
     LDC  = 3
     STC  = 4
+    STE  = 5 # STC through the epilogue
 
 class OpKind(Enum):
-    MNK  = 0
-    TILE = 1
-    GEMM = 2
-    HALT = 3
+    MNK   = 0
+    TILE  = 1
+    GEMM  = 2
+    HALT  = 3
+    ABASE = 4
+    BBASE = 5
+    CBASE = 6
+    BGEMM = 7
+    BIAS  = 8
+    RELU  = 9
+    CLAMP = 10
+    SCALE = 11
+    IFMAP = 12
+    KERNEL = 13
+    CONV2D = 14
+    ZMAP = 15
 
 # === Structs ===
 
@@ -52,27 +71,171 @@ class TpuOp:
     arg0: int = 0
     arg1: int = 0
     arg2: int = 0
+    arg3: int = 0
 
-# this wouldnt be in the actual implementation but im using python instead of actual asm :P
-def parse_instr(instr):
-    op = instr[0].lower()
-
-    match op:
-        case "mnk":
-            return TpuOp(OpKind.MNK, int(instr[1]), int(instr[2]), int(instr[3]))
-        case "tile":
-            return TpuOp(OpKind.TILE, int(instr[1]))
-        case "gemm":
-            return TpuOp(OpKind.GEMM)
-        case "halt":
-            return TpuOp(OpKind.HALT)
-        case _:
-            raise RuntimeError(f"Unknown instruction {op}")
+# === Encoding ===
+
+# Programs sit in mem as fixed-width instructions of INSTR_WORDS 32-bit words:
+#   word 0     opcode[31:24] arg0[23:0]
+#   words 1-3  arg1, arg2, arg3, two's complement
+# tpu_asm.py turns text or tuple programs into these once, IF only decodes integers.
+
+INSTR_WORDS = 4
+
+OP_ARGS = {
+    OpKind.MNK: 3, OpKind.TILE: 1, OpKind.GEMM: 0, OpKind.HALT: 0,
+    OpKind.ABASE: 2, OpKind.BBASE: 2, OpKind.CBASE: 2, OpKind.BGEMM: 4,
+    OpKind.BIAS: 2, OpKind.RELU: 1, OpKind.CLAMP: 3, OpKind.SCALE: 2,
+    OpKind.IFMAP: 4, OpKind.KERNEL: 3, OpKind.CONV2D: 4, OpKind.ZMAP: 3,
+}
+
+def encode_instr(op):
+    if not 0 <= op.arg0 < 1 << 24:
+        raise RuntimeError(f"{op.kind.name.lower()}: first operand {op.arg0} does not fit in 24 bits")
+    for arg in (op.arg1, op.arg2, op.arg3):
+        if not -(1 << 31) <= arg < 1 << 31:
+            raise RuntimeError(f"{op.kind.name.lower()}: operand {arg} does not fit in 32 bits")
+    return [(op.kind.value << 24) | op.arg0, op.arg1 & 0xFFFFFFFF, op.arg2 & 0xFFFFFFFF, op.arg3 & 0xFFFFFFFF]
+
+def decode_instr(words):
+    w0 = int(words[0])
+    try:
+        kind = OpKind(w0 >> 24)
+    except ValueError:
+        raise RuntimeError(f"Bad TPU opcode {w0 >> 24} in 0x{w0:08x}") from None
+    args = [int(w) - (1 << 32) if int(w) & 0x80000000 else int(w) for w in words[1:INSTR_WORDS]]
+    return TpuOp(kind, w0 & 0xFFFFFF, *args)
 
 # === DMA ===
 
+WORD_BYTES = 4
+
+def writable(reg):
+    # transfers and counters update the value in place, so it must not be the reset value
+    if reg.val is reg.init:
+        reg.val = reg.init.copy()
+        reg.next = reg.val
+    return reg.val
+
+def dma_beats(T, bandwidth):
+    # cycles to walk a T x T tile, a burst never crosses a row since rows are not contiguous in mem
+    return T * -(-T // bandwidth)
+
+def beat_span(base, step, row, col, n, rows, cols, mem_len, bandwidth, packed=False):
+    # one beat: up to bandwidth words of tile row `row` starting at column col, returns the row's
+    # address, the next column and how many elements really come from or go to mem. The walk always
+    # covers the whole T x T tile so an edge tile overwrites stale data with zeros, only the elements
+    # inside the tile and inside mem are real transfers. Packed int8 operands are byte addressed
+    # and a beat stops at the word boundary that keeps it within bandwidth words
+    row_addr = base + row * step
+    if packed:
+        end = min(col + PACK * bandwidth - (row_addr + col) % PACK, n)
+        limit = PACK * mem_len - row_addr
+    else:
+        end = min(col + bandwidth, n)
+        limit = mem_len - row_addr
+    valid = 0
+    if row < rows:
+        valid = max(0, min(end, cols, limit) - col)
+    return row_addr, end, valid
+
+def beat_words(addr, valid, packed=False):
+    # (first word, words) a beat of valid elements from addr touches in mem
+    if not packed or not valid:
+        return addr, valid
+    return addr // PACK, (addr + valid - 1) // PACK - addr // PACK + 1
+
+def dma_burst(kind, base, step, row, col, n, rows, cols, mem, spad, reads, writes, nbytes, busy, bandwidth,
+              epi=None, packed=False, conv=None):
+    # moves one beat, returns the next column
+    spad_row = row * n
+    if conv is not None:
+        return gather_burst(conv, row, col, n, rows, cols, mem, spad, reads, nbytes, busy, bandwidth)
+
+    row_addr, end, valid = beat_span(base, step, row, col, n, rows, cols, len(mem.val), bandwidth, packed)
+    words = valid
+
+    if kind in (DmaKind.STC, DmaKind.STE):
+        if valid:
+            vals = spad.val[spad_row + col:spad_row + col + valid]
+            if kind == DmaKind.STE:
+                bias = [0] * valid
+                if epi.bias is not None:
+                    bias = mem.val[epi.bias + col:epi.bias + col + valid]
+                    bias += [0] * (valid - len(bias))
+                    # latched while the first row goes out, every other row reuses it
+                    if row == 0:
+                        reads.next = reads.next + valid
+                        nbytes.next = nbytes.next + valid * WORD_BYTES
+                vals = epilogue(vals, bias, epi)
+            dst = writable(mem)
+            dst[row_addr + col:row_addr + col + valid] = vals
+            writes.next = writes.next + valid
+    else:
+        dst = writable(spad)
+        if packed:
+            _, words = beat_words(row_addr + col, valid, packed)
+            dst[spad_row + col:spad_row + col + valid] = [unpack_int8(mem.val, row_addr + col + i) for i in range(valid)]
+        else:
+            dst[spad_row + col:spad_row + col + valid] = mem.val[row_addr + col:row_addr + col + valid]
+        dst[spad_row + col + valid:spad_row + end] = [0] * (end - col - valid)
+        reads.next = reads.next + words
+
+    nbytes.next = nbytes.next + words * WORD_BYTES
+    busy.next = busy.next + 1
+    return end
+
+def gather_span(conv, row, col, n, rows, cols, mem_len, bandwidth):
+    # an im2col beat: up to bandwidth elements of A tile row `row`, each from its own address.
+    # Returns the next column and (column, address) for the elements inside the tile, the
+    # address is None where the window hangs over the padding or past mem
+    end = min(col + bandwidth, n)
+    elems = []
+    if row < rows:
+        for c in range(col, min(end, cols)):
+            a = conv.a_addr(conv.m0 + row, conv.k0 + c)
+            elems.append((c, a if a is not None and a < mem_len else None))
+    return end, elems
+
+def gather_burst(conv, row, col, n, rows, cols, mem, spad, reads, nbytes, busy, bandwidth):
+    end, elems = gather_span(conv, row, col, n, rows, cols, len(mem.val), bandwidth)
+    spad_row = row * n
+    dst = writable(spad)
+    dst[spad_row + col:spad_row + end] = [0] * (end - col)
+    words = 0
+    for c, a in elems:
+        if a is not None:
+            dst[spad_row + c] = mem.val[a]
+            words += 1
+    reads.next = reads.next + words
+    nbytes.next = nbytes.next + words * WORD_BYTES
+    busy.next = busy.next + 1
+    return end
+
+def mem_stall(memory, port, base, step, row, col, n, rows, cols, mem, bandwidth, packed=False, conv=None):
+    # True while the beat is still waiting on the banks, see tpu_mem.py
+    if memory is None:
+        return False
+    banked = memory.val
+    if not banked.waiting(port):
+        if conv is not None:
+            _, addrs = gather_span(conv, row, col, n, rows, cols, len(mem.val), bandwidth)
+            addrs = [a for _, a in addrs if a is not None]
+        else:
+            row_addr, _, valid = beat_span(base, step, row, col, n, rows, cols, len(mem.val), bandwidth, packed)
+            first, count = beat_words(row_addr + col, valid, packed)
+            addrs = range(first, first + count)
+        banked.issue(port, addrs, row == 0 and col == 0)
+    return not banked.arrived(port)
+
+@task
+def mem_clock(memory):
+    # the first task every cycle, so the DMA engines only ever see the copy
+    writable(memory).tick()
+
 @task
-def dma(state, kind, base, step, r, c, done, t_rows, t_cols, mem, spad_a, spad_b, sums_c, T):
+def dma(state, kind, base, step, r, c, done, t_rows, t_cols, mem, spad_a, spad_b, sums_c, T,
+        reads, writes, nbytes, busy, bandwidth=1, arbiter=None, port=0, memory=None, epi=None, int8=False, conv=None, zeros=None):
     cur_state = state.val
 
     if cur_state not in [TpuState.LDA, TpuState.LDB, TpuState.LDC, TpuState.STC]:
@@ -95,49 +258,32 @@ def dma(state, kind, base, step, r, c, done, t_rows, t_cols, mem, spad_a, spad_b
         # Already done, keep done high until kind clears
         return
 
-    mem_addr = base.val + r.val * step.val + c.val
-    spad_idx = r.val * T.val + c.val
+    # a beat already waiting on memory does not need the arbiter again
+    if arbiter is not None and not (memory is not None and memory.val.waiting(port)):
+        if arbiter.val.grant != port:
+            arbiter.val.stall_cycles[port] += 1
+            return
+        arbiter.val.beats[port] += 1
 
-    in_bounds = r.val < t_rows.val and c.val < t_cols.val
+    row, n = r.val, T.val
+    packed = int8 and kind.val in (DmaKind.LDA, DmaKind.LDB)
+    gather = conv.val if conv is not None and kind.val == DmaKind.LDA else None
+    if mem_stall(memory, port, base.val, step.val, row, c.val, n, t_rows.val, t_cols.val, mem, bandwidth, packed, gather):
+        return
+    spad = {DmaKind.LDA: spad_a, DmaKind.LDB: spad_b, DmaKind.LDC: sums_c, DmaKind.STC: sums_c, DmaKind.STE: sums_c}[kind.val]
+    end = dma_burst(kind.val, base.val, step.val, row, c.val, n, t_rows.val, t_cols.val, mem, spad,
+                    reads, writes, nbytes, busy, bandwidth, epi.val if epi is not None else None, packed, gather)
+    if zeros is not None and kind.val in (DmaKind.LDA, DmaKind.LDB):
+        note_zero(zeros[kind.val == DmaKind.LDB], spad, row, c.val, end, n)
 
-    if kind.val == DmaKind.LDA:
-        new_spad_a = spad_a.val.copy()
-        if in_bounds and mem_addr < len(mem.val):
-            new_spad_a[spad_idx] = mem.val[mem_addr]
-        else: 
-            new_spad_a[spad_idx] = 0
-        spad_a.next = new_spad_a
-    
-    elif kind.val == DmaKind.LDB:
-        new_spad_b = spad_b.val.copy()
-        if in_bounds and mem_addr < len(mem.val):
-            new_spad_b[spad_idx] = mem.val[mem_addr]
-        else:
-            new_spad_b[spad_idx] = 0
-        spad_b.next = new_spad_b
-    
-    elif kind.val == DmaKind.LDC:
-        new_sums_c = sums_c.val.copy()
-        if in_bounds and mem_addr < len(mem.val):
-            new_sums_c[spad_idx] = mem.val[mem_addr]
-        else:
-            new_sums_c[spad_idx] = 0
-        sums_c.next = new_sums_c
-    
-    elif kind.val == DmaKind.STC:
-        new_mem = mem.val.copy()
-        if in_bounds and mem_addr < len(mem.val):
-            new_mem[mem_addr] = sums_c.val[spad_idx]
-        mem.next = new_mem
-    
-    next_c = c.val + 1
-    next_r = r.val
+    next_c = end
+    next_r = row
     dne = False
 
-    if next_c >= t_cols.val:
+    if next_c >= n:
         next_c = 0
-        next_r = r.val + 1
-        if next_r >= t_rows.val:
+        next_r = row + 1
+        if next_r >= n:
             dne = True
             next_r = 0
     
@@ -145,12 +291,55 @@ def dma(state, kind, base, step, r, c, done, t_rows, t_cols, mem, spad_a, spad_b
     c.next = next_c
     done.next = dne
 
+# === Int8 ===
+
+# With int8 on, A and B sit in mem four signed bytes to a word, little endian, and a row
+# starts on a word boundary. The DMA addresses them by byte and unpacks into the scratchpads,
+# so a beat of `bandwidth` words carries four times the elements. The accumulators are int32
+# and either wrap or saturate, C stays one int32 per word.
+
+PRECISIONS = ["int", "int8"]
+
+PACK = 4
+INT32_MIN = -(1 << 31)
+INT32_MAX = (1 << 31) - 1
+
+def wrap32(v):
+    return ((v - INT32_MIN) & 0xFFFFFFFF) + INT32_MIN
+
+def sat32(v):
+    return min(max(v, INT32_MIN), INT32_MAX)
+
+def accumulate(acc, v):
+    return acc(v) if acc is not None else v
+
+def packed_words(n, int8):
+    return -(-n // PACK) if int8 else n
+
+def operand_addr(base, step, r0, c0, int8):
+    # DMA base and row step of the tile at (r0, c0), in bytes for packed int8 operands
+    if int8:
+        return (base + r0 * step) * PACK + c0, step * PACK
+    return base + r0 * step + c0, step
+
+def pack_int8(vals):
+    words = [0] * packed_words(len(vals), True)
+    for i, v in enumerate(vals):
+        if not -128 <= v <= 127:
+            raise RuntimeError(f"{v} does not fit in int8")
+        words[i // PACK] |= (v & 0xFF) << (8 * (i % PACK))
+    return words
+
+def unpack_int8(mem, addr):
+    b = (int(mem[addr // PACK]) >> (8 * (addr % PACK))) & 0xFF
+    return b - 256 if b & 0x80 else b
+
 # === Systolic ===
 
 @task
-def mac(a_in, b_in, sum, a_out, b_out, active):
+def mac(a_in, b_in, sum, a_out, b_out, active, acc=None):
     if active.val:
-        sum.next = sum.val + a_in.val * b_in.val
+        sum.next = accumulate(acc, sum.val + a_in.val * b_in.val)
 
     a_out.next = a_in.val
     b_out.next = b_in.val
@@ -173,34 +362,353 @@ def feed_b_col(cycle, col_idx, spad_b, b_out, T):
     else:
         b_out.next = 0
 
+# === Stationary Dataflows ===
+
+# ws keeps the B tile in the PEs and streams A, is keeps A transposed and streams B
+# transposed. Both spend s_cycle 0..T preloading, then stream, and drain partial sums
+# out of the bottom row into s_sums so COMM works the same for every dataflow.
+
+DATAFLOWS = ["os", "ws", "is"]
+
+def tile_macs(M, K, N, T, m0, k0, n0):
+    # the MACs that do something, an edge tile only fills part of the grid
+    return max(0, min(T, M - m0)) * max(0, min(T, K - k0)) * max(0, min(T, N - n0))
+
+def exec_last_cycle(dataflow, T):
+    # the s_cycle on which the last result lands
+    if dataflow == "os":
+        return 3 * T - 2
+    return 4 * T
+
+def spad_elem(spad, row, col, T, transpose):
+    return spad[col * T + row] if transpose else spad[row * T + col]
+
+@task
+def feed_weight(cycle, col_idx, spad, w_out, T, transpose):
+    # bottom row first, so after T + 1 shifts row k holds weights[k]
+    if cycle.val < T:
+        w_out.next = spad_elem(spad.val, T - 1 - cycle.val, col_idx, T, transpose)
+    else:
+        w_out.next = 0
+
+@task
+def preload(cycle, w_in, w, T):
+    if cycle.val <= T:
+        w.next = w_in.val
+
+@task
+def feed_stream(cycle, row_idx, spad, x_out, T, transpose):
+    c = cycle.val - (T + 1)
+    if c >= row_idx and c < row_idx + T:
+        x_out.next = spad_elem(spad.val, c - row_idx, row_idx, T, transpose)
+    else:
+        x_out.next = 0
+
+@task
+def mac_stationary(x_in, psum_in, w, x_out, psum_out, acc=None):
+    psum_out.next = accumulate(acc, psum_in.val + x_in.val * w.val)
+    x_out.next = x_in.val
+
+@task
+def drain_col(cycle, col_idx, psum, outs, T, active):
+    r = cycle.val - (T + 1) - T - 1 - col_idx
+    if active.val and 0 <= r < T:
+        outs[r].next = psum.val
+
 @task
 def s_counter(state, cycle):
     if state.val == TpuState.EXEC:
         cycle.next = cycle.val + 1
 
 @task 
-def commit(state, s_sums_flat, sums_c, T):
+def commit(state, s_sums_flat, sums_c, T, acc=None):
     if state.val == TpuState.COMM:
         new_sums_c = sums_c.val.copy()
         for i in range(T.val * T.val):
-            new_sums_c[i] = new_sums_c[i] + s_sums_flat[i].val
+            new_sums_c[i] = accumulate(acc, new_sums_c[i] + s_sums_flat[i].val)
         sums_c.next = new_sums_c
 
+# === Epilogue ===
+
+# The last store of a C tile can go out through a small post-processing unit instead of
+# straight from sums_c: add a per-column bias from mem, ReLU, requantize with a multiply and
+# a rounding right shift, then clamp. Partial sums a k-outer loop order parks in mem between
+# visits go out raw. The bias, relu, clamp and scale instructions set it up and it stays
+# that way until changed, like abase.
+
+@dataclass(frozen=True)
+class Epilogue:
+    bias: Optional[int] = None # mem address of the bias for column 0
+    relu: bool = False
+    lo: Optional[int] = None
+    hi: Optional[int] = None
+    shift: int = 0
+    mult: int = 1
+
+    @property
+    def enabled(self):
+        return self != Epilogue()
+
+    def at_column(self, n0):
+        # the copy a C tile starting at column n0 is stored with
+        return self if self.bias is None else replace(self, bias=self.bias + n0)
+
+def epilogue(vals, bias, e):
+    out = []
+    for v, b in zip(vals, bias):
+        v += b
+        if e.relu:
+            v = max(v, 0)
+        v *= e.mult
+        if e.shift:
+            v = (v + (1 << (e.shift - 1))) >> e.shift
+        if e.lo is not None:
+            v = max(v, e.lo)
+        if e.hi is not None:
+            v = min(v, e.hi)
+        out.append(v)
+    return out
+
+# === Convolution ===
+
+# conv2d runs a convolution as the GEMM of its im2col matrix with the weights, without the
+# im2col matrix ever being in mem. A row of A is one output pixel (b, oh, ow) and a column
+# one (c, kh, kw) tap, and the LDA of a conv tile works out each element's input address on
+# the fly, reading nothing where the window hangs over the padding. B is the weights as a
+# K x N matrix at bbase, row k in the same tap order: (c, kh, kw) for NCHW, which is OIHW
+# weights reshaped to (C_out, K) and transposed, or (kh, kw, c) for NHWC, which is HWIO
+# weights reshaped to (K, C_out). C is (batch, OH, OW, C_out) at cbase either way. ifmap and
+# kernel set the shapes, conv2d takes abase as the input tensor and runs.
+
+NCHW = 0
+NHWC = 1
+LAYOUTS = ["nchw", "nhwc"]
+
+@dataclass(frozen=True)
+class ConvGeom:
+    C: int = 1
+    H: int = 1
+    W: int = 1
+    batch: int = 1
+    C_out: int = 1
+    KH: int = 1
+    KW: int = 1
+    layout: int = NCHW
+    stride: int = 1
+    pad: int = 0
+    dilation: int = 1
+    base: int = 0 # mem address of the input tensor
+    m0: int = 0 # the A tile this copy loads
+    k0: int = 0
+
+    @property
+    def OH(self):
+        return (self.H + 2 * self.pad - self.dilation * (self.KH - 1) - 1) // self.stride + 1
+
+    @property
+    def OW(self):
+        return (self.W + 2 * self.pad - self.dilation * (self.KW - 1) - 1) // self.stride + 1
+
+    @property
+    def gemm_shape(self):
+        return self.batch * self.OH * self.OW, self.C * self.KH * self.KW, self.C_out
+
+    def check(self):
+        if self.layout not in (NCHW, NHWC):
+            raise RuntimeError(f"conv2d: unknown layout {self.layout}, 0 is NCHW and 1 is NHWC")
+        if self.stride < 1 or self.dilation < 1 or self.pad < 0:
+            raise RuntimeError(f"conv2d: bad stride {self.stride}, pad {self.pad} or dilation {self.dilation}")
+        if self.OH < 1 or self.OW < 1:
+            raise RuntimeError(f"conv2d: a {self.KH}x{self.KW} kernel does not fit a padded {self.H}x{self.W} input")
+
+    def at_tile(self, base, m0, k0):
+        return replace(self, base=base, m0=m0, k0=k0)
+
+    def a_addr(self, m, k):
+        # mem address of im2col A[m][k], None in the padding
+        b, pix = divmod(m, self.OH * self.OW)
+        oh, ow = divmod(pix, self.OW)
+        if self.layout == NCHW:
+            c, tap = divmod(k, self.KH * self.KW)
+            kh, kw = divmod(tap, self.KW)
+        else:
+            tap, c = divmod(k, self.C)
+            kh, kw = divmod(tap, self.KW)
+        ih = oh * self.stride - self.pad + kh * self.dilation
+        iw = ow * self.stride - self.pad + kw * self.dilation
+        if not (0 <= ih < self.H and 0 <= iw < self.W):
+            return None
+        if self.layout == NCHW:
+            return self.base + ((b * self.C + c) * self.H + ih) * self.W + iw
+        return self.base + ((b * self.H + ih) * self.W + iw) * self.C + c
+
+# === Zero Tiles ===
+
+# Every LDA and LDB notes whether the tile it brought in is all zero. With skip_zero on, a
+# step whose A or B tile is goes from its loads straight to the next step without EXEC or
+# COMM, the product would add nothing to C. A zmap instruction points at precomputed
+# occupancy maps for A and B, one bit per tile in row major tile order, 32 to a word, set
+# when the tile holds anything nonzero. Steps the maps rule out do not load either, and the
+# next step that runs loads whatever it needs. The maps hold for every gemm, bgemm problem
+# and conv2d after the zmap until zmap 0 turns them off.
+
+@dataclass
+class SkipStats:
+    zero_skips: int = 0 # steps skipped on a zero flag, after their loads
+    map_skips: int = 0 # steps the occupancy maps skipped, loads and all
+    saved_cycles: int = 0 # EXEC and COMM cycles not spent
+
+    def copy(self):
+        return replace(self)
+
+def note_zero(zero, spad, row, col, end, n):
+    # a tile is zero until a beat brings in something that is not
+    vals = spad.val[row * n + col:row * n + end]
+    zero.next = (row == 0 and col == 0 or zero.val) and not any(vals)
+
+def tile_map(mem, base, rows, cols, T):
+    # origins of the empty tiles in a rows x cols grid of T x T tiles
+    empty = set()
+    for i in range(rows * cols):
+        if not (int(mem[base + i // 32]) >> (i % 32)) & 1:
+            r, c = divmod(i, cols)
+            empty.add((r * T, c * T))
+    return empty
+
+def skip_steps(steps, a_empty, b_empty):
+    # marks the steps with an empty A or B tile and redoes the loads around them, a tile
+    # only counts as resident if a step that ran loaded it
+    last_a = last_b = None
+    a_buf = b_buf = 0
+    for s, st in enumerate(steps):
+        if st["exec"]:
+            a, b = (st["m0"], st["k0"]), (st["k0"], st["n0"])
+            st["skip"] = a in a_empty or b in b_empty
+            st["lda"] = not st["skip"] and a != last_a
+            st["ldb"] = not st["skip"] and b != last_b
+            last_a = a if st["lda"] else last_a
+            last_b = b if st["ldb"] else last_b
+        if s:
+            a_buf ^= int(st["lda"])
+            b_buf ^= int(st["ldb"])
+        st["a_buf"], st["b_buf"] = a_buf, b_buf
+    return steps
+
+def skip_exec(skips, cause, dataflow, T):
+    sk = writable(skips)
+    if cause == "map":
+        sk.map_skips += 1
+    else:
+        sk.zero_skips += 1
+    sk.saved_cycles += exec_last_cycle(dataflow, T) + 2
+
+# === Loop Order ===
+
+# A GEMM is a list of steps, one per EXEC, visited in any order of the m, n and k tile loops.
+# Each step records which tiles it has to bring in: C when the previous step worked on a
+# different C tile, A or B when the previous step's tile is not the same one. C stays in
+# sums_c across a run of steps on the same tile and is stored when the run ends, so with
+# k innermost C goes in and out once and with k outside it makes a round trip per visit.
+
+LOOP_ORDERS = ["mnk", "nmk", "mkn", "kmn", "nkm", "knm"]
+
+def gemm_steps(M, K, N, T, order="mnk"):
+    kt = -(-K // T) if K > 0 else 0
+    # MNXT stops as soon as m0 >= M, so an empty M ends after the first tile
+    dims = {
+        "m": range(0, M, T) if M > 0 else [0],
+        "n": range(0, max(N, 1), T) if M > 0 else [0],
+        "k": range(0, K, T) if kt else [None],
+    }
+
+    steps = []
+    prev = None
+    for idx in itertools.product(*(dims[d] for d in order)):
+        pos = dict(zip(order, idx))
+        m0, n0, k0 = pos["m"], pos["n"], pos["k"]
+        run = prev["run"] + int((prev["m0"], prev["n0"]) != (m0, n0)) if prev else 0
+        st = {
+            "m0": m0, "n0": n0, "k0": k0 or 0, "exec": k0 is not None, "run": run,
+            "ldc": prev is None or run != prev["run"],
+            "lda": k0 is not None and (prev is None or (prev["m0"], prev["k0"]) != (m0, k0)),
+            "ldb": k0 is not None and (prev is None or (prev["k0"], prev["n0"]) != (k0, n0)),
+            "stc": True, "skip": False,
+        }
+        # the double-buffered controller loads into the buffer the previous step is not reading
+        st["a_buf"] = 0 if prev is None else prev["a_buf"] ^ int(st["lda"])
+        st["b_buf"] = 0 if prev is None else prev["b_buf"] ^ int(st["ldb"])
+        if prev is not None:
+            prev["stc"] = st["ldc"]
+        steps.append(st)
+        prev = st
+
+    # only the store after the last k tile is final, that one goes through the epilogue
+    for st in steps:
+        st["epi"] = st["stc"] and st["k0"] + T >= K
+    return steps
+
+def next_origin(m0, n0, N, T):
+    n0 += T
+    if n0 >= N:
+        return m0 + T, 0
+    return m0, n0
+
 # === Controller ===
 
+def next_batch(c_state, b_left, b_sa, b_sb, b_sc, m_abase, m_bbase, m_cbase, t_m0, t_n0, o_cur, restart):
+    # end of one GEMM: a bgemm moves every base by its stride and runs the next problem
+    if b_left.val > 1:
+        b_left.next = b_left.val - 1
+        m_abase.next = m_abase.val + b_sa.val
+        m_bbase.next = m_bbase.val + b_sb.val
+        m_cbase.next = m_cbase.val + b_sc.val
+        t_m0.next = 0
+        t_n0.next = 0
+        o_cur.next = 0
+        c_state.next = restart
+    else:
+        b_left.next = 0
+        c_state.next = TpuState.NEXT
+
 @task
 def controller( # implemented as a fsm, idk if this will fly in lotus
-    c_state, c_pc, c_op, c_prog, c_halt, c_count,
-    d_kind, d_base, d_step, d_r, d_c, d_done, d_reads, d_writes,
-    s_cycle, s_sums, s_spad_c, s_count, s_active, 
+    c_state, c_pc, c_op, c_mem, c_base, c_len, c_halt, c_count,
+    d_kind, d_base, d_step, d_r, d_c, d_done,
+    s_cycle, s_sums, s_spad_c, s_count, s_macs, s_active, 
     t_rM, t_rK, t_rN, t_rT, t_m0, t_n0, t_k0, t_rows, t_cols, T,
-    m_abase, m_bbase, m_cbase, m_astep, m_bstep, m_cstep
+    m_abase, m_bbase, m_cbase, m_astep, m_bstep, m_cstep,
+    b_left, b_sa, b_sb, b_sc, o_steps, o_cur, e_cfg, d_epi, v_geom, c_conv, d_conv,
+    z_cfg, z_empty, a_zero, b_zero, skips,
+    dataflow="os", overlap=False, order="mnk", arrays=1, int8=False, skip_zero=False
 ):
+    start = TpuState.DISP if arrays > 1 else TpuState.PLAN if overlap else TpuState.INIT
+
+    def plan(M, K, N):
+        T = t_rT.val
+        steps = gemm_steps(M, K, N, T, order)
+        empty = None
+        if z_cfg.val is not None:
+            tiles = [-(-x // T) for x in (M, K, N)]
+            empty = (tile_map(c_mem.val, z_cfg.val[0], tiles[0], tiles[1], T),
+                     tile_map(c_mem.val, z_cfg.val[1], tiles[1], tiles[2], T))
+            steps = skip_steps(steps, *empty)
+        z_empty.next = empty
+        # with several arrays each one walks k on its own, the controller only hands out C tiles
+        return [st for st in steps if st["ldc"]] if arrays > 1 else steps
+
+    def exec_or_skip():
+        if skip_zero and (a_zero.val or b_zero.val):
+            skip_exec(skips, "zero", dataflow, t_rT.val)
+            c_state.next = TpuState.KNXT
+        else:
+            s_cycle.next = 0
+            c_state.next = TpuState.EXEC
+
     match c_state.val: 
         case TpuState.IF: 
-            if c_pc.val < len(c_prog.val):
-                op = parse_instr(c_prog.val[c_pc.val])
-                c_op.next = op
+            if c_pc.val < c_len.val:
+                addr = c_base.val + c_pc.val * INSTR_WORDS
+                c_op.next = decode_instr(c_mem.val[addr:addr + INSTR_WORDS])
                 c_state.next = TpuState.DEC
             else:
                 c_state.next = TpuState.HALT
@@ -213,11 +721,14 @@ def controller( # implemented as a fsm, idk if this will fly in lotus
                     t_rK.next = c_op.val.arg1
                     t_rN.next = c_op.val.arg2
 
+                    # packed int8 rows of A and B take a quarter of the words, C stays one per word
+                    a_words = packed_words(c_op.val.arg1, int8)
+                    b_words = packed_words(c_op.val.arg2, int8)
                     m_abase.next = m_abase.val
-                    m_astep.next = c_op.val.arg1
-                    m_bbase.next = m_abase.val + c_op.val.arg0 * c_op.val.arg1
-                    m_bstep.next = c_op.val.arg2
-                    m_cbase.next = m_abase.val + c_op.val.arg0 * c_op.val.arg1 + c_op.val.arg1 * c_op.val.arg2
+                    m_astep.next = a_words
+                    m_bbase.next = m_abase.val + c_op.val.arg0 * a_words
+                    m_bstep.next = b_words
+                    m_cbase.next = m_abase.val + c_op.val.arg0 * a_words + c_op.val.arg1 * b_words
                     m_cstep.next = c_op.val.arg2
                     c_state.next = TpuState.NEXT
 
@@ -229,7 +740,90 @@ def controller( # implemented as a fsm, idk if this will fly in lotus
                 case OpKind.GEMM:
                     t_m0.next = 0
                     t_n0.next = 0
-                    c_state.next = TpuState.INIT
+                    b_left.next = 1
+                    o_steps.next = plan(t_rM.val, t_rK.val, t_rN.val)
+                    o_cur.next = 0
+                    c_conv.next = None
+                    c_state.next = start
+
+                case OpKind.ZMAP:
+                    z_cfg.next = (c_op.val.arg1, c_op.val.arg2) if c_op.val.arg0 else None
+                    c_state.next = TpuState.NEXT
+
+                case OpKind.IFMAP:
+                    op = c_op.val
+                    v_geom.next = replace(v_geom.val, C=op.arg0, H=op.arg1, W=op.arg2, batch=op.arg3)
+                    c_state.next = TpuState.NEXT
+
+                case OpKind.KERNEL:
+                    op = c_op.val
+                    v_geom.next = replace(v_geom.val, C_out=op.arg0, KH=op.arg1, KW=op.arg2)
+                    c_state.next = TpuState.NEXT
+
+                case OpKind.CONV2D:
+                    op = c_op.val
+                    if int8:
+                        raise RuntimeError("conv2d gathers single elements, it has no packed int8 mode")
+                    geom = replace(v_geom.val, layout=op.arg0, stride=op.arg1, pad=op.arg2, dilation=op.arg3)
+                    geom.check()
+                    M, K, N = geom.gemm_shape
+                    t_rM.next = M
+                    t_rK.next = K
+                    t_rN.next = N
+                    t_m0.next = 0
+                    t_n0.next = 0
+                    b_left.next = 1
+                    o_steps.next = plan(M, K, N)
+                    o_cur.next = 0
+                    c_conv.next = geom
+                    c_state.next = start
+
+                case OpKind.ABASE:
+                    m_abase.next = c_op.val.arg0
+                    m_astep.next = c_op.val.arg1
+                    c_state.next = TpuState.NEXT
+
+                case OpKind.BBASE:
+                    m_bbase.next = c_op.val.arg0
+                    m_bstep.next = c_op.val.arg1
+                    c_state.next = TpuState.NEXT
+
+                case OpKind.CBASE:
+                    m_cbase.next = c_op.val.arg0
+                    m_cstep.next = c_op.val.arg1
+                    c_state.next = TpuState.NEXT
+
+                case OpKind.BIAS:
+                    e_cfg.next = replace(e_cfg.val, bias=c_op.val.arg1 if c_op.val.arg0 else None)
+                    c_state.next = TpuState.NEXT
+
+                case OpKind.RELU:
+                    e_cfg.next = replace(e_cfg.val, relu=bool(c_op.val.arg0))
+                    c_state.next = TpuState.NEXT
+
+                case OpKind.CLAMP:
+                    on = c_op.val.arg0
+                    e_cfg.next = replace(e_cfg.val, lo=c_op.val.arg1 if on else None, hi=c_op.val.arg2 if on else None)
+                    c_state.next = TpuState.NEXT
+
+                case OpKind.SCALE:
+                    e_cfg.next = replace(e_cfg.val, shift=c_op.val.arg0, mult=c_op.val.arg1)
+                    c_state.next = TpuState.NEXT
+
+                case OpKind.BGEMM:
+                    t_m0.next = 0
+                    t_n0.next = 0
+                    b_left.next = c_op.val.arg0
+                    b_sa.next = c_op.val.arg1
+                    b_sb.next = c_op.val.arg2
+                    b_sc.next = c_op.val.arg3
+                    o_steps.next = plan(t_rM.val, t_rK.val, t_rN.val)
+                    o_cur.next = 0
+                    c_conv.next = None
+                    if c_op.val.arg0 <= 0:
+                        c_state.next = TpuState.NEXT
+                    else:
+                        c_state.next = start
                 
                 # case OpKind.STC:
                 #     d_kind.next = DmaKind.STC
@@ -244,8 +838,12 @@ def controller( # implemented as a fsm, idk if this will fly in lotus
                     c_halt.next = True
 
         case TpuState.INIT:
-            t_rows.next = min(t_rT.val, t_rM.val - t_m0.val)
-            t_cols.next = min(t_rT.val, t_rN.val - t_n0.val)
+            # a new C tile, the first step that uses it says which
+            st = o_steps.val[o_cur.val]
+            t_m0.next = st["m0"]
+            t_n0.next = st["n0"]
+            t_rows.next = min(t_rT.val, t_rM.val - st["m0"])
+            t_cols.next = min(t_rT.val, t_rN.val - st["n0"])
             t_k0.next = 0
             # Reset systolic partial sums for this M,N tile
             for i in range(len(s_sums)):
@@ -265,41 +863,46 @@ def controller( # implemented as a fsm, idk if this will fly in lotus
                 d_kind.next = DmaKind.NONE
                 d_r.next = 0
                 d_c.next = 0
-                d_reads.next = d_reads.val + t_rT.val * t_rT.val
                 c_state.next = TpuState.LOOP
 
         case TpuState.LOOP:
-            # Don't do anything - wait for the previous DMA to complete if needed
-            # Check if we're waiting for LDC DMA to complete (which happens from INIT->LDC->LOOP)
-            if d_kind.val == DmaKind.LDC and d_done.val:
-                # LDC DMA completed, now start next iteration
-                if t_k0.val >= t_rK.val:
-                    d_kind.next = DmaKind.NONE
-                    c_state.next = TpuState.STC
-                else:
-                    # Resetting systolic array for next K iteration
-                    for i in range(len(s_sums)):
-                        s_sums[i].next = 0
-                    t_rows.next = min(t_rT.val, t_rM.val - t_m0.val)
-                    t_cols.next = min(t_rT.val, t_rN.val - t_n0.val)
+            # entered from LDC or KNXT, the next step either keeps working on the C tile
+            # in sums_c or that tile is finished and goes back out
+            steps, cur = o_steps.val, o_cur.val
+            st = steps[cur] if cur < len(steps) else None
+            for i in range(len(s_sums)):
+                s_sums[i].next = 0
+
+            if st is None or (st["m0"], st["n0"]) != (t_m0.val, t_n0.val):
+                c_state.next = TpuState.STC
+            elif not st["exec"]:
+                # no K, C only goes in and out
+                o_cur.next = cur + 1
+                c_state.next = TpuState.STC
+            elif st["skip"]:
+                # the occupancy maps say the product is zero, nothing to load or run
+                skip_exec(skips, "map", dataflow, t_rT.val)
+                o_cur.next = cur + 1
+            else:
+                # an A or B tile the previous step left in its scratchpad is not loaded again
+                t_k0.next = st["k0"]
+                if st["lda"]:
+                    t_rows.next = min(t_rT.val, t_rM.val - st["m0"])
+                    t_cols.next = min(t_rT.val, t_rK.val - st["k0"])
                     c_state.next = TpuState.LDA
-            elif d_kind.val == DmaKind.NONE:
-                # We're coming from KNXT, reset systolic array for next K iteration
-                for i in range(len(s_sums)):
-                    s_sums[i].next = 0
-                if t_k0.val >= t_rK.val:
-                    c_state.next = TpuState.STC
+                elif st["ldb"]:
+                    t_rows.next = min(t_rT.val, t_rK.val - st["k0"])
+                    t_cols.next = min(t_rT.val, t_rN.val - st["n0"])
+                    c_state.next = TpuState.LDB
                 else:
-                    t_rows.next = min(t_rT.val, t_rM.val - t_m0.val)
-                    t_cols.next = min(t_rT.val, t_rN.val - t_n0.val)
-                    c_state.next = TpuState.LDA
+                    exec_or_skip()
         
         case TpuState.LDA:
             if d_kind.val == DmaKind.NONE:
                 # First entry to LDA state - initialize DMA
                 d_kind.next = DmaKind.LDA
-                d_base.next = m_abase.val + (t_m0.val * m_astep.val) + t_k0.val
-                d_step.next = m_astep.val
+                d_base.next, d_step.next = operand_addr(m_abase.val, m_astep.val, t_m0.val, t_k0.val, int8)
+                d_conv.next = c_conv.val.at_tile(m_abase.val, t_m0.val, t_k0.val) if c_conv.val is not None else None
                 d_r.next = 0
                 d_c.next = 0
             elif d_done.val:
@@ -307,15 +910,18 @@ def controller( # implemented as a fsm, idk if this will fly in lotus
                 d_kind.next = DmaKind.NONE
                 d_r.next = 0
                 d_c.next = 0
-                d_reads.next = d_reads.val + t_rT.val * t_rT.val
-                c_state.next = TpuState.LDB
+                t_rows.next = min(t_rT.val, t_rK.val - t_k0.val)
+                t_cols.next = min(t_rT.val, t_rN.val - t_n0.val)
+                if o_steps.val[o_cur.val]["ldb"]:
+                    c_state.next = TpuState.LDB
+                else:
+                    exec_or_skip()
         
         case TpuState.LDB:
             if d_kind.val == DmaKind.NONE:
                 # First entry to LDB state - initialize DMA
                 d_kind.next = DmaKind.LDB
-                d_base.next = m_bbase.val + (t_k0.val * m_bstep.val) + t_n0.val
-                d_step.next = m_bstep.val
+                d_base.next, d_step.next = operand_addr(m_bbase.val, m_bstep.val, t_k0.val, t_n0.val, int8)
                 d_r.next = 0
                 d_c.next = 0
             elif d_done.val:
@@ -323,29 +929,26 @@ def controller( # implemented as a fsm, idk if this will fly in lotus
                 d_kind.next = DmaKind.NONE
                 d_r.next = 0
                 d_c.next = 0
-                d_reads.next = d_reads.val + t_rT.val * t_rT.val
                 t_rows.next = min(t_rT.val, t_rK.val - t_k0.val)
                 t_cols.next = min(t_rT.val, t_rN.val - t_n0.val)
-                s_cycle.next = 0
-                c_state.next = TpuState.EXEC
+                exec_or_skip()
 
 
         case TpuState.EXEC:
-            if d_done.val:
-                d_kind.next = DmaKind.NONE
-                d_reads.next = d_reads.val + t_rT.val * t_rT.val
-            
             s_active.next = True
-            if s_cycle.val >= 3 * t_rT.val - 2:
+            if s_cycle.val >= exec_last_cycle(dataflow, t_rT.val):
                 s_active.next = False
                 s_count.next = s_count.val + t_rT.val * t_rT.val
+                s_macs.next = s_macs.val + tile_macs(t_rM.val, t_rK.val, t_rN.val, t_rT.val, t_m0.val, t_k0.val, t_n0.val)
                 c_state.next = TpuState.COMM
         
         case TpuState.COMM:
-            c_state.next = TpuState.KNXT
+            # the overlapped GEMM does its own bookkeeping in overlap_controller
+            c_state.next = TpuState.WAIT if overlap else TpuState.KNXT
         
         case TpuState.KNXT:
             t_k0.next = t_k0.val + t_rT.val
+            o_cur.next = o_cur.val + 1
             c_state.next = TpuState.LOOP
         
         case TpuState.STC:
@@ -353,7 +956,12 @@ def controller( # implemented as a fsm, idk if this will fly in lotus
                 # First entry to STC state - initialize DMA
                 t_rows.next = min(t_rT.val, t_rM.val - t_m0.val)
                 t_cols.next = min(t_rT.val, t_rN.val - t_n0.val)
-                d_kind.next = DmaKind.STC
+                # the run that just ended is the tile's last visit when it covered the last k tile
+                if o_steps.val[o_cur.val - 1]["epi"] and e_cfg.val.enabled:
+                    d_kind.next = DmaKind.STE
+                    d_epi.next = e_cfg.val.at_column(t_n0.val)
+                else:
+                    d_kind.next = DmaKind.STC
                 d_base.next = m_cbase.val + t_m0.val * m_cstep.val + t_n0.val
                 d_step.next = m_cstep.val
                 d_r.next = 0
@@ -363,28 +971,15 @@ def controller( # implemented as a fsm, idk if this will fly in lotus
                 d_kind.next = DmaKind.NONE
                 d_r.next = 0
                 d_c.next = 0
-                d_writes.next = d_writes.val + t_rT.val * t_rT.val
                 c_state.next = TpuState.MNXT
         
         case TpuState.MNXT:
-            if d_done.val:
-                d_kind.next = DmaKind.NONE
-                d_writes.next = d_writes.val + t_rT.val * t_rT.val
-            
-            n0_next = t_n0.val + t_rT.val
-            m0_next = t_m0.val
-
-            if n0_next >= t_rN.val:
-                n0_next = 0
-                m0_next = t_m0.val + t_rT.val
-
-            t_n0.next = n0_next
-            t_m0.next = m0_next
-
-            if m0_next >= t_rM.val:
-                c_state.next = TpuState.NEXT
-            else:
+            if o_cur.val < len(o_steps.val):
                 c_state.next = TpuState.INIT
+            else:
+                # the tile origin ends one tile past the last C tile, as the plain m, n walk left it
+                t_m0.next, t_n0.next = next_origin(t_m0.val, t_n0.val, t_rN.val, t_rT.val)
+                next_batch(c_state, b_left, b_sa, b_sb, b_sc, m_abase, m_bbase, m_cbase, t_m0, t_n0, o_cur, TpuState.INIT)
 
         case TpuState.NEXT:
             c_pc.next = c_pc.val + 1
@@ -394,7 +989,416 @@ def controller( # implemented as a fsm, idk if this will fly in lotus
         case TpuState.HALT:
             pass
 
+# === Double Buffering ===
+
+# With overlap on, A, B and C each get two buffers and the DMA works through a FIFO of
+# descriptors on its own. The loads for step s + 1 are queued when step s starts EXEC, into
+# the buffers step s is not reading, and a finished C tile is queued for STC while the next
+# tile's loads are already in flight. The controller only waits on the queue when the next
+# step's tiles have not landed yet.
+
+@dataclass
+class DmaDesc:
+    kind: DmaKind
+    base: int
+    step: int
+    rows: int
+    cols: int
+    spad: object # the Reg the tile goes to or comes from
+    epi: Optional[Epilogue] = None
+    packed: bool = False
+    conv: Optional[object] = None # a ConvGeom at its A tile, for an im2col LDA
+    zero: Optional[object] = None # the Reg an LDA or LDB notes an all zero tile in
+
+class PingPong:
+    # stands in for a scratchpad Reg, the feeders and commit see whichever buffer sel picks
+    def __init__(self, bufs, sel):
+        self.bufs = bufs
+        self.sel = sel
+
+    @property
+    def val(self):
+        return self.bufs[self.sel.val].val
+
+    @property
+    def next(self):
+        return self.bufs[self.sel.val].next
+
+    @next.setter
+    def next(self, val):
+        self.bufs[self.sel.val].next = val
+
+    def __repr__(self):
+        return f"PingPong({self.sel.val}, {self.val})"
+
+@task
+def dma_queue(queue, q_done, r, c, mem, T, reads, writes, nbytes, busy, bandwidth=1, memory=None):
+    if not queue.val:
+        return
+
+    d = queue.val[0]
+    n = T.val
+    if mem_stall(memory, 0, d.base, d.step, r.val, c.val, n, d.rows, d.cols, mem, bandwidth, d.packed, d.conv):
+        return
+    end = dma_burst(d.kind, d.base, d.step, r.val, c.val, n, d.rows, d.cols, mem, d.spad,
+                    reads, writes, nbytes, busy, bandwidth, d.epi, d.packed, d.conv)
+    if d.zero is not None:
+        note_zero(d.zero, d.spad, r.val, c.val, end, n)
+
+    if end < n:
+        c.next = end
+        return
+    c.next = 0
+    if r.val + 1 < n:
+        r.next = r.val + 1
+        return
+
+    r.next = 0
+    queue.next = queue.val[1:]
+    q_done.next = q_done.val + 1
+
+@task
+def overlap_controller(
+    c_state, queue, q_issued, q_done, o_steps, o_cur, o_wait, a_sel, b_sel, c_sel,
+    s_cycle, s_sums, spad_a, spad_b, sums_c,
+    t_rM, t_rK, t_rN, t_rT, t_m0, t_n0, t_k0,
+    m_abase, m_bbase, m_cbase, m_astep, m_bstep, m_cstep,
+    b_left, b_sa, b_sb, b_sc, e_cfg, c_conv, a_zero, b_zero, skips,
+    dataflow="os", order="mnk", int8=False, skip_zero=False
+):
+    M, K, N, T = t_rM.val, t_rK.val, t_rN.val, t_rT.val
+
+    def c_desc(kind, st, epi=None):
+        return DmaDesc(kind, m_cbase.val + st["m0"] * m_cstep.val + st["n0"], m_cstep.val,
+                       min(T, M - st["m0"]), min(T, N - st["n0"]), sums_c[st["run"] % 2], epi)
+
+    def store(st):
+        if st["epi"] and e_cfg.val.enabled:
+            return c_desc(DmaKind.STE, st, e_cfg.val.at_column(st["n0"]))
+        return c_desc(DmaKind.STC, st)
+
+    def loads(steps, s):
+        st = steps[s]
+        m0, n0, k0 = st["m0"], st["n0"], st["k0"]
+        descs = [c_desc(DmaKind.LDC, st)] if st["ldc"] else []
+        if st["lda"]:
+            conv = c_conv.val.at_tile(m_abase.val, m0, k0) if c_conv.val is not None else None
+            descs.append(DmaDesc(DmaKind.LDA, *operand_addr(m_abase.val, m_astep.val, m0, k0, int8),
+                                 min(T, M - m0), min(T, K - k0), spad_a[st["a_buf"]], packed=int8, conv=conv,
+                                 zero=a_zero[st["a_buf"]]))
+        if st["ldb"]:
+            descs.append(DmaDesc(DmaKind.LDB, *operand_addr(m_bbase.val, m_bstep.val, k0, n0, int8),
+                                 min(T, K - k0), min(T, N - n0), spad_b[st["b_buf"]], packed=int8,
+                                 zero=b_zero[st["b_buf"]]))
+        return descs
+
+    def issue(descs):
+        # returns the completion count that means all of these have landed
+        queue.next = queue.next + descs
+        q_issued.next = q_issued.next + len(descs)
+        return q_issued.next
+
+    match c_state.val:
+        case TpuState.PLAN:
+            # the controller planned the steps on DEC, a bgemm comes back here for every problem
+            steps = o_steps.val
+            o_cur.next = 0
+            o_wait.next = issue(loads(steps, 0))
+            c_state.next = TpuState.WAIT
+
+        case TpuState.WAIT:
+            steps, cur = o_steps.val, o_cur.val
+            if cur >= len(steps):
+                # everything computed, wait for the last STCs to leave
+                if q_done.val == q_issued.val:
+                    kt = -(-K // T) if K > 0 else 0
+                    last = steps[-1]
+                    t_m0.next, t_n0.next = next_origin(last["m0"], last["n0"], N, T)
+                    t_k0.next = kt * T
+                    next_batch(c_state, b_left, b_sa, b_sb, b_sc, m_abase, m_bbase, m_cbase, t_m0, t_n0, o_cur, TpuState.PLAN)
+            elif q_done.val >= o_wait.val:
+                st = steps[cur]
+                t_m0.next, t_n0.next, t_k0.next = st["m0"], st["n0"], st["k0"]
+                skip = None
+                if st["exec"]:
+                    if st["skip"]:
+                        skip = "map"
+                    elif skip_zero and (a_zero[st["a_buf"]].val or b_zero[st["b_buf"]].val):
+                        skip = "zero"
+                if skip:
+                    skip_exec(skips, skip, dataflow, T)
+                    o_cur.next = cur + 1
+                elif st["exec"]:
+                    for i in range(len(s_sums)):
+                        s_sums[i].next = 0
+                    a_sel.next = st["a_buf"]
+                    b_sel.next = st["b_buf"]
+                    c_sel.next = st["run"] % 2
+                    s_cycle.next = 0
+                    c_state.next = TpuState.EXEC
+                else:
+                    # no K to multiply, C goes straight back out
+                    issue([store(st)])
+                    o_cur.next = cur + 1
+                if cur + 1 < len(steps):
+                    o_wait.next = issue(loads(steps, cur + 1))
+                if skip and st["stc"]:
+                    # behind the next step's loads, where the store at COMM would have gone
+                    issue([store(st)])
+
+        case TpuState.COMM:
+            st = o_steps.val[o_cur.val]
+            if st["stc"]:
+                issue([store(st)])
+            o_cur.next = o_cur.val + 1
+
+# === Multiple Arrays ===
+
+# Several T x T arrays, each with its own scratchpads, grid, commit path and DMA engine.
+# The shared controller still fetches and decodes, a GEMM goes to DISP where the dispatcher
+# hands the (m0, n0) C tiles out in loop order to whichever array is idle. An array walks k
+# on its own and keeps the last A and B tile it loaded, so a tile it runs next that shares
+# the row or column of A or B does not load it again. All DMA engines share mem and its
+# bandwidth, one beat per cycle handed out round robin.
+
+MULTI_ORDERS = ["mnk", "nmk"]
+
+class DmaArbiter:
+    def __init__(self, num_ports):
+        self.num_ports = num_ports
+        self.grant = None
+        self.last = num_ports - 1
+        self.beats = [0] * num_ports
+        self.stall_cycles = [0] * num_ports
+
+    def copy(self):
+        new = DmaArbiter(self.num_ports)
+        new.grant = self.grant
+        new.last = self.last
+        new.beats = list(self.beats)
+        new.stall_cycles = list(self.stall_cycles)
+        return new
+
+    def stats(self):
+        return {
+            "beats": list(self.beats),
+            "stall_cycles": list(self.stall_cycles),
+        }
+
+def dma_requesting(arr, memory=None):
+    if memory is not None and memory.val.waiting(arr["port"]):
+        return False
+    return (arr["state"].val in [TpuState.LDA, TpuState.LDB, TpuState.LDC, TpuState.STC]
+            and arr["d_kind"].val != DmaKind.NONE and not arr["d_done"].val)
+
+@task
+def arbitrate_dma(arbiter, arrays, memory=None):
+    # runs before every DMA engine, so they all count into the copy
+    arb = writable(arbiter)
+    arb.grant = None
+
+    for i in range(1, arb.num_ports + 1):
+        port = (arb.last + i) % arb.num_ports
+        if dma_requesting(arrays[port], memory):
+            arb.grant = port
+            arb.last = port
+            return
+
+def dma_step(arr, kind, base, step):
+    # starts the transfer on the first cycle, True once it is done
+    if arr["d_kind"].val == DmaKind.NONE:
+        arr["d_kind"].next = kind
+        arr["d_base"].next = base
+        arr["d_step"].next = step
+        arr["d_r"].next = 0
+        arr["d_c"].next = 0
+    elif arr["d_done"].val:
+        arr["d_kind"].next = DmaKind.NONE
+        arr["d_r"].next = 0
+        arr["d_c"].next = 0
+        return True
+    return False
+
+@task
+def dispatcher(
+    c_state, o_steps, o_cur, arrays,
+    t_rK, t_rN, t_rT, t_m0, t_n0, t_k0,
+    m_abase, m_bbase, m_cbase, b_left, b_sa, b_sb, b_sc
+):
+    if c_state.val != TpuState.DISP:
+        return
+
+    tiles, cur = o_steps.val, o_cur.val
+    idle = [arr for arr in arrays if arr["state"].val == TpuState.IDLE]
+
+    if cur == 0:
+        # a new problem, whatever the scratchpads hold belongs to the last one
+        for arr in arrays:
+            arr["tile_a"].next = None
+            arr["tile_b"].next = None
+
+    if cur < len(tiles):
+        for arr in idle[:len(tiles) - cur]:
+            arr["m0"].next = tiles[cur]["m0"]
+            arr["n0"].next = tiles[cur]["n0"]
+            arr["state"].next = TpuState.INIT
+            cur += 1
+        o_cur.next = cur
+    elif len(idle) == len(arrays):
+        K, T = t_rK.val, t_rT.val
+        kt = -(-K // T) if K > 0 else 0
+        t_m0.next, t_n0.next = next_origin(tiles[-1]["m0"], tiles[-1]["n0"], t_rN.val, T)
+        t_k0.next = kt * T
+        next_batch(c_state, b_left, b_sa, b_sb, b_sc, m_abase, m_bbase, m_cbase, t_m0, t_n0, o_cur, TpuState.DISP)
+
+@task
+def array_controller(
+    arr, s_sums, s_count, s_macs, e_cfg, c_conv, z_empty, skips,
+    t_rM, t_rK, t_rN, t_rT,
+    m_abase, m_bbase, m_cbase, m_astep, m_bstep, m_cstep,
+    dataflow="os", int8=False, skip_zero=False
+):
+    # one C tile from INIT to STC, the same walk the single array controller does with mnk
+    state = arr["state"]
+    M, K, N, T = t_rM.val, t_rK.val, t_rN.val, t_rT.val
+    m0, n0, k0 = arr["m0"].val, arr["n0"].val, arr["k0"].val
+
+    def shape(rows, cols):
+        arr["rows"].next = min(T, rows)
+        arr["cols"].next = min(T, cols)
+
+    def exec_or_skip():
+        if skip_zero and (arr["a_zero"].val or arr["b_zero"].val):
+            skip_exec(skips, "zero", dataflow, T)
+            state.next = TpuState.KNXT
+        else:
+            arr["s_cycle"].next = 0
+            state.next = TpuState.EXEC
+
+    def load_b_or_exec():
+        if arr["tile_b"].val != (k0, n0):
+            shape(K - k0, N - n0)
+            state.next = TpuState.LDB
+        else:
+            exec_or_skip()
+
+    match state.val:
+        case TpuState.INIT:
+            shape(M - m0, N - n0)
+            arr["k0"].next = 0
+            for i in range(len(s_sums)):
+                s_sums[i].next = 0
+            state.next = TpuState.LDC
+
+        case TpuState.LDC:
+            if dma_step(arr, DmaKind.LDC, m_cbase.val + m0 * m_cstep.val + n0, m_cstep.val):
+                state.next = TpuState.LOOP
+
+        case TpuState.LOOP:
+            for i in range(len(s_sums)):
+                s_sums[i].next = 0
+            if k0 >= K:
+                shape(M - m0, N - n0)
+                state.next = TpuState.STC
+            elif z_empty.val is not None and ((m0, k0) in z_empty.val[0] or (k0, n0) in z_empty.val[1]):
+                skip_exec(skips, "map", dataflow, T)
+                arr["k0"].next = k0 + T
+            elif arr["tile_a"].val != (m0, k0):
+                shape(M - m0, K - k0)
+                state.next = TpuState.LDA
+            else:
+                load_b_or_exec()
+
+        case TpuState.LDA:
+            if arr["d_kind"].val == DmaKind.NONE:
+                arr["d_conv"].next = c_conv.val.at_tile(m_abase.val, m0, k0) if c_conv.val is not None else None
+            if dma_step(arr, DmaKind.LDA, *operand_addr(m_abase.val, m_astep.val, m0, k0, int8)):
+                arr["tile_a"].next = (m0, k0)
+                load_b_or_exec()
+
+        case TpuState.LDB:
+            if dma_step(arr, DmaKind.LDB, *operand_addr(m_bbase.val, m_bstep.val, k0, n0, int8)):
+                arr["tile_b"].next = (k0, n0)
+                exec_or_skip()
+
+        case TpuState.EXEC:
+            arr["s_active"].next = True
+            arr["exec_cycles"].next = arr["exec_cycles"].val + 1
+            if arr["s_cycle"].val >= exec_last_cycle(dataflow, T):
+                arr["s_active"].next = False
+                macs = tile_macs(M, K, N, T, m0, k0, n0)
+                arr["macs"].next = arr["macs"].val + macs
+                s_count.next = s_count.next + T * T
+                s_macs.next = s_macs.next + macs
+                state.next = TpuState.COMM
+
+        case TpuState.COMM:
+            state.next = TpuState.KNXT
+
+        case TpuState.KNXT:
+            arr["k0"].next = k0 + T
+            state.next = TpuState.LOOP
+
+        case TpuState.STC:
+            # an array always runs every k of its tile, so its store is the final one
+            kind = DmaKind.STE if e_cfg.val.enabled else DmaKind.STC
+            if arr["d_kind"].val == DmaKind.NONE:
+                arr["d_epi"].next = e_cfg.val.at_column(n0)
+            if dma_step(arr, kind, m_cbase.val + m0 * m_cstep.val + n0, m_cstep.val):
+                arr["tiles"].next = arr["tiles"].val + 1
+                state.next = TpuState.IDLE
+
 @task
 def c_counter(cycle, halted):
     if not halted.val:
         cycle.next = cycle.val + 1
+
+# === Performance Counters ===
+
+# Every cycle until halt lands in the controller's state histogram and in one of four
+# buckets: a grid is in EXEC, a transfer is in flight, both, or neither. With several arrays
+# each one also keeps its own state histogram. A transfer is in flight from its first beat
+# to its last, stalls on the arbiter or the banks included, the cycles that program it and
+# see it done count as control. Double buffered, it is whenever the queue is not empty.
+
+DMA_STATES = [TpuState.LDA, TpuState.LDB, TpuState.LDC, TpuState.STC]
+
+@dataclass
+class PerfStats:
+    states: dict = field(default_factory=dict) # TpuState -> cycles, for the controller
+    array_states: list = field(default_factory=list) # the same for each of several arrays
+    compute: int = 0 # cycles with a grid in EXEC and no transfer
+    dma: int = 0 # cycles with a transfer in flight and no grid in EXEC
+    both: int = 0
+    idle: int = 0
+
+    def copy(self):
+        return replace(self, states=dict(self.states), array_states=[dict(h) for h in self.array_states])
+
+def transferring(unit):
+    return unit["state"].val in DMA_STATES and unit["d_kind"].val != DmaKind.NONE and not unit["d_done"].val
+
+@task
+def perf_counter(perf, halted, c_state, units, queue=None):
+    # units are the controller, or each array, as dicts with state, d_kind and d_done
+    if halted.val:
+        return
+    p = writable(perf)
+    p.states[c_state.val] = p.states.get(c_state.val, 0) + 1
+    if len(units) > 1:
+        if not p.array_states:
+            p.array_states = [{} for _ in units]
+        for hist, unit in zip(p.array_states, units):
+            hist[unit["state"].val] = hist.get(unit["state"].val, 0) + 1
+
+    compute = any(unit["state"].val == TpuState.EXEC for unit in units)
+    dma = bool(queue.val) if queue is not None else any(transferring(u) for u in units)
+
+    if compute and dma:
+        p.both += 1
+    elif compute:
+        p.compute += 1
+    elif dma:
+        p.dma += 1
+    else:
+        p.idle += 1